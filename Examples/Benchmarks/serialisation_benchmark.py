@@ -0,0 +1,66 @@
+from Hurricane import serialisation
+import sys
+import timeit
+
+
+def deep(depth):
+    # [[[...[1]...]]], one list per level
+    obj = [1]
+    for _ in range(depth):
+        obj = [obj]
+    return obj
+
+
+def wide(width):
+    # A flat list of small, mixed records
+    return [
+        {"id": i, "name": f"player{i}", "position": (i * 0.5, 2.0)}
+        for i in range(width)
+    ]
+
+
+def mixed():
+    # A typical game state update
+    return {
+        "tick": 12345,
+        "players": [
+            {
+                "id": i,
+                "name": f"player{i}",
+                "health": 100,
+                "alive": True,
+                "position": (1.5, 2.5, 3.5),
+            }
+            for i in range(20)
+        ],
+        "events": [("join", i) for i in range(5)],
+    }
+
+
+def benchmark(name, obj, number):
+    data = serialisation.dumps(obj)
+    # The fastest of several runs is the least affected by anything else on the machine
+    dumps_time = (
+        min(timeit.repeat(lambda: serialisation.dumps(obj), number=number, repeat=5))
+        / number
+    )
+    loads_time = (
+        min(timeit.repeat(lambda: serialisation.loads(data), number=number, repeat=5))
+        / number
+    )
+    print(
+        f"{name:<24}{len(data):>8} bytes{dumps_time * 1e6:>12.1f} us{loads_time * 1e6:>12.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    print(f"{'':<24}{'size':>14}{'dumps':>15}{'loads':>15}")
+    benchmark("mixed", mixed(), 500)
+    benchmark("wide, 1000 records", wide(1000), 10)
+    benchmark("deep, 100 levels", deep(100), 500)
+    # Deeper than the default recursion limit
+    benchmark(
+        f"deep, {sys.getrecursionlimit() * 10} levels",
+        deep(sys.getrecursionlimit() * 10),
+        5,
+    )
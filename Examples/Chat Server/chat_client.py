@@ -1,7 +1,6 @@
 from Hurricane.client_functions import ServerConnection
 import socket
 import tkinter as tk
-import threading
 
 
 def send_message():
@@ -9,12 +8,10 @@ def send_message():
     entry_box.delete(0, "end")
 
 
-def receive_message():
-    while True:
-        message = server.recv()
-        text_box["state"] = "normal"
-        text_box.insert("end", "\n" + message.contents)
-        text_box["state"] = "disabled"
+def show_message(message):
+    text_box["state"] = "normal"
+    text_box.insert("end", "\n" + message.contents)
+    text_box["state"] = "disabled"
 
 
 window = tk.Tk()
@@ -26,10 +23,8 @@ text_box.pack()
 entry_box.pack()
 submit.pack()
 
-receiving_thread = threading.Thread(target=receive_message, daemon=True)
-
 with ServerConnection("localhost", 65432, socket.AF_INET, socket.SOCK_STREAM) as server:
     name = input("Name: ")
     server.send(name)
-    receiving_thread.start()
+    server.start_receiving(show_message)
     window.mainloop()
@@ -1,4 +1,5 @@
 import Hurricane
+from Hurricane.topics import MULTI_WILDCARD, SEPARATOR, SINGLE_WILDCARD
 
 server = Hurricane.Server(timeout=5)
 
@@ -6,39 +7,44 @@ clients = []
 names = {}
 containing_groups = {}
 
-rooms = {"all": Hurricane.Group()}
-
 
 @server.on_new_connection
 async def on_new_client(new_client: Hurricane.Client):
     clients.append(new_client)
-    rooms["all"].add(new_client)
+    server.topics.subscribe(new_client, "room.all")
     containing_groups[new_client] = "all"
     name = (await new_client.receive()).contents
     names[new_client] = name.title()
     print(f"{name} has joined the chat")
-    await rooms["all"].send(f"{name} has joined the chat")
+    await server.topics.publish("room.all", f"{name} has joined the chat")
 
 
 @server.on_receiving_message
 async def got_message(message: Hurricane.Message):
     if message.contents[:6] == "/join ":
         group_name = message.contents[6:]
-        if group_name not in rooms:
-            rooms[group_name] = Hurricane.Group()
+        # A room is one segment of its topic, wildcards would join every room at once
+        if not group_name or any(
+            character in group_name
+            for character in (SEPARATOR, SINGLE_WILDCARD, MULTI_WILDCARD)
+        ):
+            await message.author.send(f"{group_name!r} is not a valid group name")
+            return
         old_group_name = containing_groups[message.author]
 
-        rooms[old_group_name].remove(message.author)
+        server.topics.unsubscribe(message.author, f"room.{old_group_name}")
 
-        await rooms[old_group_name].send(
-            f"{names[message.author]} has changed to group {group_name}"
+        await server.topics.publish(
+            f"room.{old_group_name}",
+            f"{names[message.author]} has changed to group {group_name}",
         )
-        await rooms[group_name].send(
-            f"{names[message.author]} has joined group {group_name}"
+        await server.topics.publish(
+            f"room.{group_name}",
+            f"{names[message.author]} has joined group {group_name}",
         )
         await message.author.send(f"You have changed to group {group_name}")
 
-        rooms[group_name].add(message.author)
+        server.topics.subscribe(message.author, f"room.{group_name}")
         containing_groups[message.author] = group_name
         print(
             f"{names[message.author]} changed from group {old_group_name} to {group_name}"
@@ -47,7 +53,7 @@ async def got_message(message: Hurricane.Message):
         formatted_message = f"{names[message.author]}: {message.contents}"
         print(formatted_message)
         group_name = containing_groups[message.author]
-        await rooms[group_name].send(formatted_message)
+        await server.topics.publish(f"room.{group_name}", formatted_message)
 
 
 @server.on_client_disconnect
@@ -14,7 +14,7 @@ async def new_conn(client):
 
 @server.on_client_disconnect
 async def disconnect(client):
-    if len(server._clients) == 1:
+    if sum(server.metrics.connection_counts().values()) == 1:
         await master_conn.send(0)
 
 
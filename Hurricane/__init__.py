@@ -2,3 +2,4 @@ from Hurricane.server import Server
 from Hurricane.client import Client
 from Hurricane.message import Message
 from Hurricane.group import Group
+from Hurricane.topics import TopicRouter
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import random
+from typing import NamedTuple
+
+
+class Backoff(NamedTuple):
+    # How long ServerConnection waits before each attempt to reconnect, and when it gives up
+    # Before attempt n, counting from 0, it waits a random time between 0 and
+    # min(max_delay, initial_delay * multiplier ** n), so clients that lost their
+    # connections at the same moment, such as when the server restarts, come back spread out
+    # instead of all at once
+    initial_delay: float = 0.1
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+    # Gives up after this many attempts, or once this many seconds have passed since the
+    # connection was lost, None for no limit
+    max_attempts: int | None = None
+    deadline: float | None = 60.0
+
+    def delay(self, attempt: int) -> float:
+        # multiplier ** attempt overflows long after max_delay is reached
+        ceiling = self.max_delay
+        if attempt < 64:
+            ceiling = min(ceiling, self.initial_delay * self.multiplier**attempt)
+        return random.uniform(0, ceiling)
+
+    def exhausted(self, attempts: int, elapsed: float) -> bool:
+        # Whether to give up, after attempts that failed over elapsed seconds
+        if self.max_attempts is not None and attempts >= self.max_attempts:
+            return True
+        return self.deadline is not None and elapsed >= self.deadline
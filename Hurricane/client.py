@@ -3,17 +3,25 @@ from __future__ import annotations
 import asyncio
 from asyncio import StreamReader, StreamWriter
 from asyncio.locks import Event
-from datetime import datetime
+from collections import deque
 from enum import Enum
-import struct
-from typing import Any, Callable, Coroutine
+import os
+import time
+from typing import Any, BinaryIO, Callable, Coroutine, Hashable
 from uuid import UUID
 
 
 from Hurricane.message import Message
-from Hurricane import serialisation
+from Hurricane import framing, serialisation
+from Hurricane.compression import Compressor
+from Hurricane.hooks import ProfilingHooks
+from Hurricane.lanes import BULK, NORMAL, PriorityLanes
+from Hurricane.metrics import ServerMetrics
 from Hurricane.queue import Queue
-from Hurricane.encryption import ServerEncryption
+from Hurricane.ratelimit import RateLimiter
+from Hurricane.reliability import ReliableStream
+from Hurricane.timers import TimingWheel
+from Hurricane.encryption import Encryption, NullEncryption
 
 
 class ClientState(Enum):
@@ -22,38 +30,176 @@ class ClientState(Enum):
     CLOSED = 3
 
 
+class _Outgoing:
+    # A message waiting to be written, and how much of it has been
+    __slots__ = (
+        "data",
+        "written",
+        "offset",
+        "first_sequence",
+        "key",
+        "expires_at",
+        "path",
+        "file",
+    )
+
+    def __init__(
+        self,
+        data: bytes,
+        written: asyncio.Future | None,
+        offset: int = 0,
+        first_sequence: int = 0,
+        key: Hashable | None = None,
+        expires_at: float | None = None,
+        path: str | None = None,
+    ) -> None:
+        self.data: bytes = data
+        # Given the sequence number of the last frame of the message once it is written
+        self.written: asyncio.Future | None = written
+        self.offset: int = offset
+        # Of the first part, 0 until it is written, see framing.PART
+        self.first_sequence: int = first_sequence
+        # The conflate_key and expiry time, in time.monotonic seconds, it was sent with
+        self.key: Hashable | None = key
+        self.expires_at: float | None = expires_at
+        # Of a file sent with Client.send_file, then data is its size and name, see
+        # framing.FILE, and offset counts the bytes of the file written
+        self.path: str | None = path
+        # Opened when its first chunk is written, if it was not already
+        self.file: BinaryIO | None = None
+
+
+class _FileChunk:
+    # Kept by the ReliableStream in place of the data of a FILE frame, so the file is
+    # not held in memory until the client acknowledges it, and read again to resend it
+    __slots__ = ("prefix", "path", "offset", "count")
+
+    def __init__(self, prefix: bytes, path: str, offset: int, count: int) -> None:
+        self.prefix: bytes = prefix
+        self.path: str = path
+        self.offset: int = offset
+        self.count: int = count
+
+    def __bytes__(self) -> bytes:
+        with open(self.path, "rb") as file:
+            return self.prefix + _read_chunk(file, self.offset, self.count)
+
+
+def _read_chunk(file: BinaryIO, offset: int, count: int) -> bytes:
+    # Padded if the file has shrunk, so the client still gets the size it was promised
+    file.seek(offset)
+    return file.read(count).ljust(count, b"\0")
+
+
 class Client:
+    # Most bytes read from the socket at once, enough for the largest frame
+    READ_SIZE: int = 64 * 1024
+    # Messages bigger than this are sent in parts, so urgent messages can go between them
+    # Raising it trades their latency for less work for each big message, though a part
+    # never holds more than fits in one frame, see _part_size
+    CHUNK_SIZE: int = 16 * 1024
+    # Once the transport holds this many bytes, messages wait in their lanes instead,
+    # where those sent later with a higher priority can overtake them
+    WRITE_BUFFER_SIZE: int = 2 * CHUNK_SIZE
+    # Fewest waiting messages at which those that have expired are looked for
+    SWEEP_SIZE: int = 1024
+
     def __init__(
         self,
-        tcp_reader: StreamReader,
-        tcp_writer: StreamWriter,
+        tcp_reader: StreamReader | None,
+        tcp_writer: StreamWriter | None,
         uuid: UUID,
         client_disconnect_callback,
         reconnect_timeout: int,
-        encrypter: ServerEncryption,
+        encrypter: Encryption,
+        compressor: Compressor | None = None,
+        metrics: ServerMetrics | None = None,
+        hooks: ProfilingHooks | None = None,
+        heartbeat_interval: float | None = None,
+        heartbeat_misses: int = 3,
+        replay_buffer_size: int = 1024,
+        rate_limiter: RateLimiter | None = None,
+        shared_rate_limiter: RateLimiter | None = None,
+        timers: TimingWheel | None = None,
     ) -> None:
-
-        self._tcp_reader: StreamReader = tcp_reader
-        self._tcp_writer: StreamWriter = tcp_writer
+        # None for a session handed over without its connection, see Hurricane.handoff
+        self._tcp_reader: StreamReader | None = tcp_reader
+        self._tcp_writer: StreamWriter | None = tcp_writer
         self._state: ClientState = ClientState.OPEN
         self._uuid: UUID = uuid
         self._socket_read_task = None
         self._disconnect_task_handle = None
         self._message_dispatch_task = None
-        self._outgoing_message_queue: Queue[Any] = Queue()
+        self._heartbeat_timer = None
+        self._write_task = None
+        # Messages waiting to be written, because the connection is busy or lost
+        self._outgoing_message_queue: PriorityLanes[_Outgoing] = PriorityLanes(
+            quantum=self.CHUNK_SIZE
+        )
+        # The waiting message sent with each conflate_key, see send_serialised
+        self._conflated: dict[Hashable, _Outgoing] = {}
+        # Expired messages are only dropped when they reach the head of their lane,
+        # and every one waiting once this many are, so they cannot pile up while the
+        # client is away
+        self._sweep_at: int = self.SWEEP_SIZE
+        self._messages_waiting: Event = Event()
+        # Set for the rest of the event loop iteration after a message is written straight
+        # away, so any others sent in it wait in the lanes and go out together as a BATCH
+        self._corked: bool = False
+        # Writing the contents of a FILE frame with loop.sendfile, during which anything
+        # else written is held back, so it does not end up in the middle of the frame
+        self._sendfile: asyncio.Task | None = None
+        self._held_frames: list[bytes] | None = None
+        # Set while the session is being handed over, see Hurricane.handoff
+        self._suspended: bool = False
         self._incoming_message_queue: Queue[Message] = Queue()
         self._reconnect_event: Event = Event()
-        self._encrypter: ServerEncryption = encrypter
+        self._encrypter: Encryption = encrypter
+        self._compressor: Compressor | None = compressor
+        self._metrics: ServerMetrics = ServerMetrics() if metrics is None else metrics
+        self._hooks: ProfilingHooks = ProfilingHooks() if hooks is None else hooks
+        self._stream: ReliableStream = ReliableStream(replay_buffer_size)
+        self._reconnections: int = 0
+        # Shared by every client of a server, for the reconnect timeout and heartbeats
+        self._timers: TimingWheel = TimingWheel() if timers is None else timers
+        # Frames read but not yet handled, and the start of the next one
+        self._unhandled_frames: deque[bytes] = deque()
+        self._decoder: framing.FrameDecoder = framing.FrameDecoder()
+        # The message the callback is handling, put back if the client is suspended
+        self._dispatching: Message | None = None
 
         self._client_disconnect_callback: Callable[
             [Client], Coroutine
         ] = client_disconnect_callback
 
-        self.peer_address: tuple[str, int] = tcp_writer.transport.get_extra_info(
-            "peername"
+        self.peer_address: tuple[str, int] | None = (
+            None
+            if tcp_writer is None
+            else tcp_writer.transport.get_extra_info("peername")
         )
+        if tcp_writer is not None:
+            tcp_writer.transport.set_write_buffer_limits(self.WRITE_BUFFER_SIZE)
         self.reconnect_timeout = reconnect_timeout
 
+        # A ping is sent every heartbeat_interval seconds, None disables heartbeats
+        # If heartbeat_misses pings in a row go unanswered, the connection is assumed dead
+        self.heartbeat_interval: float | None = heartbeat_interval
+        self.heartbeat_misses: int = heartbeat_misses
+        self._unanswered_pings: int = 0
+        self._rtt: float | None = None
+
+        # The client's own limits, then those shared by every client, see Hurricane.ratelimit
+        self._rate_limiters: tuple[RateLimiter, ...] = tuple(
+            limiter
+            for limiter in (rate_limiter, shared_rate_limiter)
+            if limiter is not None
+        )
+        self._disconnect_throttled_after: float | None = (
+            None if rate_limiter is None else rate_limiter.limit.disconnect_after
+        )
+        # When the client started being throttled without a break, None if it is not
+        self._throttled_since: float | None = None
+
     def __hash__(self) -> int:
         return self._uuid.int
 
@@ -65,40 +211,200 @@ class Client:
     def uuid(self) -> UUID:
         return self._uuid
 
+    @property
+    def rtt(self) -> float | None:
+        # Smoothed round trip time in seconds, measured by heartbeats
+        # None until the first heartbeat is answered
+        return self._rtt
+
+    @property
+    def last_received_sequence(self) -> int:
+        # Sent to the client when it reconnects, so it only resends what was lost
+        return self._stream.last_received
+
+    @property
+    def last_acknowledged_sequence(self) -> int:
+        # Every message sent with a sequence number up to this has arrived
+        return self._stream.last_acknowledged
+
+    @property
+    def reconnections(self) -> int:
+        return self._reconnections
+
     async def _read_from_socket(self) -> None:
+        # Reads whatever has arrived, and handles every frame it completes
+        # So a burst of small frames costs one read, rather than two for each frame
+        reader = self._tcp_reader
+        received_at_ns = time.time_ns()
+        read_at = time.perf_counter()
+        # When the start of a frame that has not completely arrived was read
+        read_started_at = partial_frame_read_at = read_at
         while True:
+            # Left over from the last read, or from another process, see Hurricane.handoff
+            while self._unhandled_frames:
+                encrypted_data = self._unhandled_frames.popleft()
+                self._handle_frame(encrypted_data, received_at_ns, read_started_at)
+                read_started_at = read_at
+                if self._rate_limiters:
+                    await self._throttle(framing.LENGTH.size + len(encrypted_data))
+                    if self._state == ClientState.CLOSED:
+                        return
+
+            if self._tcp_reader is None:
+                # Handed over without its connection, so wait for the client to reconnect
+                await self._handle_disconnection()
+            if reader is not self._tcp_reader:
+                # Anything left of a frame on the old connection is resent by the client
+                reader = self._tcp_reader
+                self._decoder = framing.FrameDecoder()
             try:
-                message_size = await self._tcp_reader.readexactly(2)
-                message_size = int.from_bytes(message_size, "big", signed=False)
+                data = await reader.read(self.READ_SIZE)
+                if not data:
+                    raise ConnectionError("Connection closed by the client")
+            except ConnectionError:
+                # EOF was received, nothing more can be read
+                # Assume that the client has stopped listening
+                # Unless it has already reconnected, and this is the old connection closing
+                if reader is self._tcp_reader:
+                    await self._handle_disconnection()
+                continue
+
+            read_at = time.perf_counter()
+            received_at_ns = time.time_ns()
+            read_started_at = partial_frame_read_at if len(self._decoder) else read_at
+            self._unhandled_frames.extend(self._decoder.feed(data))
+            # The next frame started in this read if any frame was completed by it
+            partial_frame_read_at = (
+                read_at if self._unhandled_frames else read_started_at
+            )
+
+    async def _throttle(self, size: int) -> None:
+        # Stops reading while the client is over its rate limits
+        # Anything else it sends waits in the socket, so TCP slows the client down,
+        # rather than the server buffering it or spending time handling it
+        now = time.monotonic()
+        wait = max(limiter.take(size, now) for limiter in self._rate_limiters)
+        if not wait:
+            self._throttled_since = None
+            return
 
-                encrypted_data = await self._tcp_reader.readexactly(message_size)
-                received_at = datetime.now()
+        if self._throttled_since is None:
+            self._throttled_since = now
+        elif (
+            self._disconnect_throttled_after is not None
+            and now - self._throttled_since > self._disconnect_throttled_after
+        ):
+            self._metrics.rate_limit_disconnections.inc()
+            self.shutdown()
+            return
+        self._metrics.throttled_messages.inc()
+        await asyncio.sleep(wait)
 
-                raw_data = self._encrypter.decrypt(encrypted_data)
-                sent_at, data = raw_data[:8], raw_data[8:]  # Double is 8 bytes long
+    def _handle_frame(
+        self, encrypted_data: bytes, received_at_ns: int, read_started_at: float
+    ) -> None:
+        started_at = time.perf_counter()
+        raw_data = self._encrypter.decrypt(encrypted_data)
+        frame = framing.parse_plaintext(raw_data, self._compressor)
+        # Anything arriving proves the connection is alive
+        self._unanswered_pings = 0
+        self._stream.acknowledge(frame.acknowledged)
+        if frame.flags & framing.CONTROL:
+            self._handle_control_frame(frame)
+            return
+        if not self._stream.receive(frame.sequence):
+            return  # Already received before a reconnection
+        decrypted_at = time.perf_counter()
+        contents = serialisation.loads(frame.data)
+        deserialised_at = time.perf_counter()
+
+        message = Message(contents, frame.sent_at_ns, received_at_ns, self)
+
+        self._incoming_message_queue.push(message)
+        if self._stream.needs_acknowledgement:
+            self._write_frame(self._encrypt_frame(b"", framing.ACK))
+
+        self._metrics.decrypt_seconds.observe(decrypted_at - started_at)
+        self._metrics.deserialise_seconds.observe(deserialised_at - decrypted_at)
+        self._metrics.bytes_received.inc(framing.LENGTH.size + len(encrypted_data))
+        self._metrics.messages_received.inc()
+
+        hooks = self._hooks
+        if hooks.frame_read:
+            hooks.run(hooks.frame_read, self, read_started_at, started_at)
+        if hooks.decrypt:
+            hooks.run(hooks.decrypt, self, started_at, decrypted_at)
+        if hooks.deserialise:
+            hooks.run(hooks.deserialise, self, decrypted_at, deserialised_at)
+
+    def _handle_control_frame(self, frame: framing.Frame) -> None:
+        if frame.flags & framing.PING:
+            self._write_frame(self._encrypt_frame(frame.data, framing.PONG))
+        elif frame.flags & framing.PONG:
+            (ping_sent_at,) = framing.HEARTBEAT.unpack(frame.data)
+            sample = time.monotonic() - ping_sent_at
+            if self._rtt is None:
+                self._rtt = sample
+            else:
+                # Smoothed the same way as TCP, see RFC 6298
+                self._rtt = 0.875 * self._rtt + 0.125 * sample
+
+    def _send_heartbeat(self) -> None:
+        self._heartbeat_timer = self._timers.schedule(
+            self.heartbeat_interval, self._send_heartbeat
+        )
+        if self._state != ClientState.OPEN:
+            self._unanswered_pings = 0
+            return
 
-                sent_at = datetime.fromtimestamp(struct.unpack("!d", sent_at)[0])
-                contents = serialisation.loads(data)
+        if self._unanswered_pings >= self.heartbeat_misses:
+            # The read task sees the connection close, and starts waiting for a reconnection
+            self._tcp_writer.transport.abort()
+            return
 
-                message = Message(contents, sent_at, received_at, self)
+        self._unanswered_pings += 1
+        ping = framing.HEARTBEAT.pack(time.monotonic())
+        self._write_frame(self._encrypt_frame(ping, framing.PING))
 
-                self._incoming_message_queue.push(message)
-            except (asyncio.IncompleteReadError, ConnectionError):
-                # EOF was received, nothing more can be read
-                # Assume that the client has stopped listening
-                await self._handle_disconnection()
+    def _encrypt_frame(self, data: bytes, flags: int = 0, sequence: int = 0) -> bytes:
+        # Every frame acknowledges the messages received so far
+        compressor = None if flags & framing.CONTROL else self._compressor
+        plaintext = framing.build_plaintext(
+            data, compressor, flags, sequence, self._stream.acknowledgement()
+        )
+        return self._encrypter.encrypt(plaintext)
+
+    def _write_frame(self, data: bytes) -> None:
+        if self._held_frames is not None:
+            self._held_frames += (framing.LENGTH.pack(len(data)), data)
+            return
+        # One write, so the length and data go out in one send rather than two
+        self._tcp_writer.writelines((framing.LENGTH.pack(len(data)), data))
 
     async def _dispatch_messages_to_callback(
         self, callback: Callable[[Message], Coroutine]
     ) -> None:
         while True:
             message = await self._incoming_message_queue.async_pop()
+            started_at = time.perf_counter()
+            self._dispatching = message
             await callback(message)
+            self._dispatching = None
+            finished_at = time.perf_counter()
+            self._metrics.callback_seconds.observe(finished_at - started_at)
+            if self._hooks.dispatch:
+                self._hooks.run(self._hooks.dispatch, self, started_at, finished_at)
 
     async def _handle_disconnection(self) -> None:
+        self._cancel_sendfile()
+        if self._state == ClientState.RECONNECTING:
+            # Both sending and receiving can notice the same disconnection
+            await self._reconnect_event.wait()
+            return
+
         self._reconnect_event.clear()
         self._state = ClientState.RECONNECTING
-        self._disconnect_task_handle = asyncio.get_running_loop().call_later(
+        self._disconnect_task_handle = self._timers.schedule(
             self.reconnect_timeout, self.shutdown
         )
         await self._reconnect_event.wait()
@@ -106,50 +412,495 @@ class Client:
     def start_receiving(self, callback: Callable[[Message], Coroutine] | None) -> None:
         if not self._socket_read_task:  # Make sure this is idempotent
             self._socket_read_task = asyncio.create_task(self._read_from_socket())
+            self._write_task = asyncio.create_task(self._write_from_lanes())
             if callback:
                 self._message_dispatch_task = asyncio.create_task(
                     self._dispatch_messages_to_callback(callback)
                 )
+            if self.heartbeat_interval is not None:
+                self._heartbeat_timer = self._timers.schedule(
+                    self.heartbeat_interval, self._send_heartbeat
+                )
+
+    async def _suspend(self) -> None:
+        # Stops everything reading, writing and dispatching, so the session can be handed
+        # over to another process without anything happening halfway, see Hurricane.handoff
+        self._suspended = True
+        tasks = [
+            task
+            for task in (
+                self._socket_read_task,
+                self._write_task,
+                self._message_dispatch_task,
+            )
+            if task is not None
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._sendfile is not None:
+            # Left to finish, as the client cannot be handed half a frame
+            await asyncio.wait((self._sendfile,))
+        self._socket_read_task = None
+        self._write_task = None
+        self._message_dispatch_task = None
+        if self._heartbeat_timer is not None:
+            self._heartbeat_timer.cancel()
+            self._heartbeat_timer = None
+        if self._disconnect_task_handle is not None:
+            self._disconnect_task_handle.cancel()
+
+        if self._dispatching is not None:
+            # The callback was interrupted, so the message is handled again from the start
+            self._incoming_message_queue.push_front(self._dispatching)
+            self._dispatching = None
+        if self._tcp_writer is not None:
+            self._tcp_writer.transport.pause_reading()
+
+    def _resume(self, callback: Callable[[Message], Coroutine] | None) -> None:
+        # Undoes _suspend, if the session was not handed over after all
+        self._suspended = False
+        if self._tcp_writer is not None:
+            self._tcp_writer.transport.resume_reading()
+        if self._state == ClientState.RECONNECTING:
+            self._disconnect_task_handle = self._timers.schedule(
+                self.reconnect_timeout, self.shutdown
+            )
+        self.start_receiving(callback)
+        self._messages_waiting.set()
 
     async def reconnect(self, proto: ClientBuilder) -> None:
+        if self._state == ClientState.OPEN:
+            # The client noticed the disconnection before the server did
+            self._tcp_writer.transport.abort()
+        else:
+            self._disconnect_task_handle.cancel()
+        self._cancel_sendfile()
+
         self._tcp_reader = proto.reader
         self._tcp_writer = proto.writer
+        self._tcp_writer.transport.set_write_buffer_limits(self.WRITE_BUFFER_SIZE)
+        # Frames read from the old connection but not yet handled, such as while reading
+        # was throttled, cannot be decrypted with the new encrypter, and as they were not
+        # acknowledged the client resends them
+        self._unhandled_frames.clear()
+        self._decoder = framing.FrameDecoder()
         self._encrypter = proto.encrypter
-        self._disconnect_task_handle.cancel()
+        self._compressor = proto.compressor
+        self._unanswered_pings = 0
         self._state = ClientState.OPEN
+        self._reconnections += 1
 
-        while self._outgoing_message_queue:
-            await self.send(self._outgoing_message_queue.pop())
-        self._reconnect_event.set()
+        # Resend whatever the client did not receive before the connection was lost
+        self._stream.acknowledge(proto.last_received_sequence)
+        for sequence, data, flags in self._stream.unacknowledged_frames():
+            self._write_frame(self._encrypt_frame(bytes(data), flags, sequence))
+            self._metrics.replayed_messages.inc()
+        await self._tcp_writer.drain()
 
-    async def send(self, message: Any) -> None:
-        if self.state == ClientState.RECONNECTING:
-            self._outgoing_message_queue.push(message)
-            return
+        # Then anything sent since, from the lanes
+        self._messages_waiting.set()
+        self._reconnect_event.set()
 
+    async def send(
+        self,
+        message: Any,
+        priority: int = NORMAL,
+        conflate_key: Hashable | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        started_at = time.perf_counter()
         data = serialisation.dumps(message)
-        header = struct.pack("!d", datetime.now().timestamp())
-        plaintext = header + data
+        serialised_at = time.perf_counter()
+
+        self._metrics.serialise_seconds.observe(serialised_at - started_at)
+        if self._hooks.serialise:
+            self._hooks.run(self._hooks.serialise, self, started_at, serialised_at)
 
-        data = self._encrypter.encrypt(plaintext)
+        await self.send_serialised(data, priority, conflate_key, ttl)
 
-        self._tcp_writer.write(len(data).to_bytes(2, "big", signed=False))
-        self._tcp_writer.write(data)
+    async def send_serialised(
+        self,
+        data: bytes,
+        priority: int = NORMAL,
+        conflate_key: Hashable | None = None,
+        ttl: float | None = None,
+    ) -> int | None:
+        # Sends data from serialisation.dumps, so a message sent to many clients
+        # only needs to be serialised once
+        # priority picks a lane from Hurricane.lanes, it only matters while messages wait
+        # to be written, then those with a higher priority are written first
+        # While it waits, a message sent later with the same conflate_key takes its place,
+        # so a client that falls behind or reconnects only gets the latest for each key
+        # Once ttl seconds have passed, a message still waiting is dropped instead of sent
+        # Returns the message's sequence number, None if it is queued until a reconnection,
+        # replaced or dropped
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        if self._state != ClientState.OPEN or self._suspended:
+            self._queue(
+                _Outgoing(data, None, key=conflate_key, expires_at=expires_at),
+                priority,
+            )
+            return None
+
+        writer = self._tcp_writer
+        if (
+            self._outgoing_message_queue
+            or self._corked
+            or len(data) > self._part_size
+            or writer.transport.get_write_buffer_size() >= self.WRITE_BUFFER_SIZE
+        ):
+            # Written by _write_from_lanes, when its turn comes
+            written = asyncio.get_running_loop().create_future()
+            self._queue(
+                _Outgoing(data, written, key=conflate_key, expires_at=expires_at),
+                priority,
+            )
+            self._messages_waiting.set()
+            return await written
+
+        # Nothing is waiting, so the message is written straight away
+        started_at = time.perf_counter()
+        sequence = self._write_message_frame(data)
+        self._corked = True
+        asyncio.get_running_loop().call_soon(self._uncork)
+        encrypted_at = time.perf_counter()
+        self._metrics.messages_sent.inc()
         try:
-            await self._tcp_writer.drain()
+            await writer.drain()
         except ConnectionError:
-            await self._handle_disconnection()
+            # The message is resent after a reconnection, as it was never acknowledged
+            if writer is self._tcp_writer:
+                await self._handle_disconnection()
+
+        hooks = self._hooks
+        if hooks.encrypt:
+            hooks.run(hooks.encrypt, self, started_at, encrypted_at)
+        if hooks.write:
+            hooks.run(hooks.write, self, encrypted_at, time.perf_counter())
+        return sequence
+
+    async def send_file(
+        self, path: str, name: str | None = None, priority: int = BULK
+    ) -> int | None:
+        # Sends the file at path, received as a ReceivedFile called name, or the file's own
+        # name, see ServerConnection.on_file
+        # It is written a chunk at a time from its lane, like a message sent in parts, and
+        # when frames are not encrypted, with loop.sendfile, so it is never read into Python
+        # Chunks are read again from path to resend them, so the file must not change until
+        # the client has received it
+        # Returns the sequence number of its last frame, None if it is queued until a
+        # reconnection, or the client closes before it is sent
+        if self._state == ClientState.CLOSED:
+            return None
+        file = open(path, "rb")
+        size = os.fstat(file.fileno()).st_size
+        if name is None:
+            name = os.path.basename(path)
+        message = _Outgoing(
+            framing.FILE_START.pack(size) + name.encode(), None, path=path
+        )
+        message.file = file
+        if self._state != ClientState.OPEN or self._suspended:
+            self._queue(message, priority)
+            return None
+
+        message.written = asyncio.get_running_loop().create_future()
+        self._queue(message, priority)
+        self._messages_waiting.set()
+        return await message.written
+
+    def _queue(self, message: _Outgoing, priority: int) -> None:
+        if message.key is not None:
+            queued = self._conflated.get(message.key)
+            if queued is not None and queued.offset == 0:
+                # Replaced where it stands, as none of it has been written
+                if queued.written is not None and not queued.written.done():
+                    queued.written.set_result(None)
+                queued.data = message.data
+                queued.written = message.written
+                queued.expires_at = message.expires_at
+                self._metrics.conflated_messages.inc()
+                return
+            self._conflated[message.key] = message
+        self._outgoing_message_queue.push(message, priority)
+
+        if len(self._outgoing_message_queue) >= self._sweep_at:
+            now = time.monotonic()
+            for expired in self._outgoing_message_queue.remove_if(
+                lambda waiting: waiting.offset == 0
+                and waiting.expires_at is not None
+                and waiting.expires_at <= now
+            ):
+                self._expire(expired)
+            self._sweep_at = max(2 * len(self._outgoing_message_queue), self.SWEEP_SIZE)
+
+    def _forget(self, message: _Outgoing) -> None:
+        # Called once message has been taken out of the lanes
+        if message.key is not None and self._conflated.get(message.key) is message:
+            del self._conflated[message.key]
+
+    def _expire(self, message: _Outgoing) -> None:
+        self._forget(message)
+        self._metrics.expired_messages.inc()
+        if message.written is not None and not message.written.done():
+            message.written.set_result(None)
+
+    def _uncork(self) -> None:
+        self._corked = False
+
+    def _write_message_frame(
+        self, data: bytes, flags: int = 0, recorded: _FileChunk | None = None
+    ) -> int:
+        # Returns the frame's sequence number
+        # recorded is kept to resend the frame with instead of data, see _FileChunk
+        started_at = time.perf_counter()
+        sequence = self._stream.record(data if recorded is None else recorded, flags)
+        data = self._encrypt_frame(data, flags, sequence)
+        self._metrics.encrypt_seconds.observe(time.perf_counter() - started_at)
+        self._write_frame(data)
+        self._metrics.bytes_sent.inc(framing.LENGTH.size + len(data))
+        return sequence
+
+    async def _write_from_lanes(self) -> None:
+        # Writes waiting messages one frame at a time, waiting for each to leave the transport
+        # Messages are taken from the lanes in turn, see PriorityLanes, and those bigger than
+        # CHUNK_SIZE are split into parts, so nothing waits behind a whole big message
+        while True:
+            if not self._outgoing_message_queue or self._state != ClientState.OPEN:
+                self._messages_waiting.clear()
+                await self._messages_waiting.wait()
+                continue
+
+            writer = self._tcp_writer
+            started_at = time.perf_counter()
+            if not self._write_next_frame():
+                continue
+            encrypted_at = time.perf_counter()
+            try:
+                sending = self._sendfile
+                if sending is not None:
+                    await asyncio.wait((sending,))
+                    if sending.cancelled() or sending.exception() is not None:
+                        raise ConnectionError("The file could not be sent")
+                await writer.drain()
+            except ConnectionError:
+                if writer is self._tcp_writer:
+                    await self._handle_disconnection()
+
+            hooks = self._hooks
+            if hooks.encrypt:
+                hooks.run(hooks.encrypt, self, started_at, encrypted_at)
+            if hooks.write:
+                hooks.run(hooks.write, self, encrypted_at, time.perf_counter())
+
+    def _write_next_frame(self) -> bool:
+        # Returns False if nothing was written, as every message waiting had expired
+        lanes = self._outgoing_message_queue
+        waiting = self._peek_unexpired()
+        if waiting is None:
+            return False
+
+        priority, message = waiting
+        if message.path is not None:
+            self._write_file_frame(priority, message)
+            return True
+        data = message.data
+        part_size = self._part_size
+        if message.offset == 0 and len(data) <= part_size:
+            self._write_batch()
+            return True
+
+        end = min(message.offset + part_size, len(data))
+        if message.offset == 0:
+            message.first_sequence = self._stream.next_sequence
+        flags = framing.PART | (framing.MORE if end < len(data) else 0)
+        sequence = self._write_message_frame(
+            framing.PART_KEY.pack(message.first_sequence) + data[message.offset : end],
+            flags,
+        )
+        lanes.charge(priority, end - message.offset)
+        message.offset = end
+        if end < len(data):
+            return True
+
+        self._forget(lanes.pop(priority))
+        self._metrics.messages_sent.inc()
+        if message.written is not None and not message.written.done():
+            message.written.set_result(sequence)
+        return True
+
+    @property
+    def _part_size(self) -> int:
+        # CHUNK_SIZE, unless a part that big would not fit in one frame along with the
+        # header, its key and what encryption adds, see framing.LENGTH
+        largest = 0xFFFF - framing.HEADER.size - framing.PART_KEY.size
+        return min(self.CHUNK_SIZE, largest - self._encrypter.overhead)
+
+    def _write_batch(self) -> None:
+        # Takes small messages from the lanes in turn until _part_size is reached, and
+        # writes them as one BATCH frame, or a plain one if there is only one of them
+        lanes = self._outgoing_message_queue
+        batch: list[_Outgoing] = []
+        size = 0
+        limit = self._part_size
+        while (waiting := self._peek_unexpired()) is not None:
+            priority, message = waiting
+            message_size = framing.LENGTH.size + len(message.data)
+            if batch and (
+                message.offset
+                or message.path is not None
+                or size + message_size > limit
+            ):
+                break
+            lanes.charge(priority, len(message.data))
+            self._forget(lanes.pop(priority))
+            batch.append(message)
+            size += message_size
+
+        if len(batch) == 1:
+            sequence = self._write_message_frame(batch[0].data)
+        else:
+            data = framing.pack_batch([message.data for message in batch])
+            sequence = self._write_message_frame(data, framing.BATCH)
+        self._metrics.messages_sent.inc(len(batch))
+        for message in batch:
+            # Every message in a batch has the sequence number of the frame
+            if message.written is not None and not message.written.done():
+                message.written.set_result(sequence)
+
+    def _write_file_frame(self, priority: int, message: _Outgoing) -> None:
+        # Writes the FILE frame with the file's size and name, then one with each chunk
+        lanes = self._outgoing_message_queue
+        (size,) = framing.FILE_START.unpack_from(message.data)
+        if message.first_sequence == 0:
+            message.first_sequence = self._stream.next_sequence
+            sequence = self._write_message_frame(
+                framing.FILE_KEY.pack(message.first_sequence) + message.data,
+                framing.FILE | (framing.MORE if size else 0),
+            )
+            lanes.charge(priority, len(message.data))
+        else:
+            if message.file is None:
+                # Handed over from another process, see Hurricane.handoff
+                message.file = open(message.path, "rb")
+            # Frames are at most 64 KiB, see framing.LENGTH
+            largest = 0xFFFF - framing.HEADER.size - framing.FILE_KEY.size
+            count = min(
+                self.CHUNK_SIZE,
+                largest - self._encrypter.overhead,
+                size - message.offset,
+            )
+            end = message.offset + count
+            flags = framing.FILE | (framing.MORE if end < size else 0)
+            key = framing.FILE_KEY.pack(message.first_sequence)
+            chunk = _FileChunk(key, message.path, message.offset, count)
+            if type(self._encrypter) is NullEncryption:
+                sequence = self._sendfile_chunk(message.file, chunk, flags)
+            else:
+                data = key + _read_chunk(message.file, message.offset, count)
+                sequence = self._write_message_frame(data, flags, chunk)
+            lanes.charge(priority, count)
+            message.offset = end
+        if message.offset < size:
+            return
+
+        self._forget(lanes.pop(priority))
+        self._close_when_sent(message.file)
+        self._metrics.messages_sent.inc()
+        if message.written is not None and not message.written.done():
+            message.written.set_result(sequence)
+
+    def _sendfile_chunk(self, file: BinaryIO, chunk: _FileChunk, flags: int) -> int:
+        # Frames are sent as they are, so the chunk can go straight from the file to the
+        # socket, never being copied into Python, with only the header written before it
+        # It is not compressed, as that would need it to be read
+        sequence = self._stream.record(chunk, flags)
+        header = framing.build_plaintext(
+            chunk.prefix, None, flags, sequence, self._stream.acknowledgement()
+        )
+        writer = self._tcp_writer
+        writer.write(framing.LENGTH.pack(len(header) + chunk.count) + header)
+        self._metrics.bytes_sent.inc(framing.LENGTH.size + len(header) + chunk.count)
+        self._held_frames = []
+        self._sendfile = asyncio.create_task(
+            self._send_file_range(writer, file, chunk.offset, chunk.count)
+        )
+        return sequence
+
+    async def _send_file_range(
+        self, writer: StreamWriter, file: BinaryIO, offset: int, count: int
+    ) -> None:
+        try:
+            sent = await asyncio.get_running_loop().sendfile(
+                writer.transport, file, offset, count
+            )
+            if sent < count:
+                writer.transport.write(bytes(count - sent))  # See _read_chunk
+        except BaseException:
+            # Half a frame was written, so the connection cannot be used again
+            self._held_frames = None
+            writer.transport.abort()
+            raise
+        finally:
+            self._sendfile = None
+        held, self._held_frames = self._held_frames, None
+        if held and writer is self._tcp_writer:
+            writer.transport.writelines(held)
+
+    def _close_when_sent(self, file: BinaryIO) -> None:
+        # Not before loop.sendfile has finished with it
+        if self._sendfile is None:
+            file.close()
+        else:
+            self._sendfile.add_done_callback(lambda _: file.close())
+
+    def _cancel_sendfile(self) -> None:
+        # Its connection has been lost, along with anything held back while it was sent
+        if self._sendfile is not None:
+            self._sendfile.cancel()
+        self._held_frames = None
+
+    def _peek_unexpired(self) -> tuple[int, _Outgoing] | None:
+        # The next message to write and its priority, dropping any expired on the way
+        lanes = self._outgoing_message_queue
+        now = time.monotonic()
+        while lanes:
+            priority, message = lanes.peek()
+            if message.offset or message.expires_at is None or message.expires_at > now:
+                return priority, message
+            self._expire(lanes.pop(priority))
+        return None
+
+    def _release_senders(self) -> None:
+        # Nothing waiting will be written, so whoever sent it stops waiting
+        for _, message in self._outgoing_message_queue:
+            if message.file is not None:
+                self._close_when_sent(message.file)
+            if message.written is not None and not message.written.done():
+                message.written.set_result(None)
 
     async def receive(self) -> Message:
         return await self._incoming_message_queue.async_pop()
 
     def shutdown(self) -> None:
         self._state = ClientState.CLOSED
-        self._tcp_writer.close()
-        self._socket_read_task.cancel()
-        self._socket_read_task = None
-        self._message_dispatch_task.cancel()
-        self._message_dispatch_task = None
+        if self._tcp_writer is not None:
+            self._tcp_writer.close()
+        if self._socket_read_task:
+            self._socket_read_task.cancel()
+            self._socket_read_task = None
+        if self._write_task:
+            self._write_task.cancel()
+            self._write_task = None
+        if self._message_dispatch_task:
+            self._message_dispatch_task.cancel()
+            self._message_dispatch_task = None
+        if self._heartbeat_timer:
+            self._heartbeat_timer.cancel()
+            self._heartbeat_timer = None
+        self._cancel_sendfile()
+        self._release_senders()
 
         if self._client_disconnect_callback:
             asyncio.create_task(self._client_disconnect_callback(self))
@@ -162,7 +913,18 @@ class ClientBuilder:
         self.disconnect_callback: Callable[[Client], Coroutine] | None = None
         self.uuid: UUID | None = None
         self.reconnect_timeout: int | None = None
-        self.encrypter: ServerEncryption | None = None
+        self.encrypter: Encryption | None = None
+        self.compressor: Compressor | None = None
+        self.metrics: ServerMetrics | None = None
+        self.hooks: ProfilingHooks | None = None
+        self.heartbeat_interval: float | None = None
+        self.heartbeat_misses: int = 3
+        self.replay_buffer_size: int = 1024
+        self.rate_limiter: RateLimiter | None = None
+        self.shared_rate_limiter: RateLimiter | None = None
+        self.timers: TimingWheel | None = None
+        # The last message the client received, sent by the client during the handshake
+        self.last_received_sequence: int = 0
 
     def construct(self) -> Client:
         return Client(
@@ -172,4 +934,13 @@ class ClientBuilder:
             self.disconnect_callback,
             self.reconnect_timeout,
             self.encrypter,
+            self.compressor,
+            self.metrics,
+            self.hooks,
+            self.heartbeat_interval,
+            self.heartbeat_misses,
+            self.replay_buffer_size,
+            self.rate_limiter,
+            self.shared_rate_limiter,
+            self.timers,
         )
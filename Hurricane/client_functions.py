@@ -1,20 +1,47 @@
 from __future__ import annotations
 
-from Crypto.Cipher import PKCS1_OAEP
-from Crypto.PublicKey import RSA
-from datetime import datetime
+from collections import deque
+from enum import Enum
+import queue
 import socket
+import ssl
 import struct
-from typing import Any
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Any, BinaryIO, Callable, Sequence
 from uuid import uuid4
 
 
-from Hurricane import serialisation
-from Hurricane.message import AnonymousMessage
-from Hurricane.encryption import ClientEncryption
+from Hurricane import compression, framing, serialisation
+from Hurricane.backoff import Backoff
+from Hurricane.message import AnonymousMessage, ReceivedFile
+from Hurricane.encryption import Encryption
+from Hurricane.reliability import ReliableStream
+from Hurricane.security import AESSecurity, TransportSecurity
+
+
+class ReconnectState(Enum):
+    DISCONNECTED = 1  # The connection was lost, reconnecting starts
+    RECONNECTING = 2  # An attempt is about to be made
+    RECONNECTED = 3
+    FAILED = 4  # Gave up, the connection is closed
+
+
+def _temporary_file(name: str, size: int) -> BinaryIO:
+    # Where received files are written by default, kept after they are closed
+    return tempfile.NamedTemporaryFile(prefix="hurricane-", delete=False)
 
 
 class ServerConnection:
+    # Most bytes read from the socket at once
+    RECEIVE_SIZE: int = 64 * 1024
+    # Seconds an attempt to reconnect waits for the server before trying again
+    # The lock is held meanwhile, so every other thread waits too
+    HANDSHAKE_TIMEOUT: float = 10.0
+
     def __init__(
         self,
         address: str,
@@ -23,34 +50,101 @@ class ServerConnection:
         type: socket.SocketKind = socket.SOCK_STREAM,  # Shadows builtin 'type()', kept to match socket.socket()
         proto: int = 0,
         fileno: int = None,
+        *,
+        compression: Sequence[str] = (),
+        compression_threshold: int = 256,
+        replay_buffer_size: int = 1024,
+        security: TransportSecurity | None = None,
+        backoff: Backoff | None = None,
     ) -> None:
         self._socket = socket.socket(
             family=family, type=type, proto=proto, fileno=fileno
         )
-        self._address = address
-        self._port = port
-        self._socket.connect((address, port))
+        # Reconnections go to the same address, None if it is not known
+        self._peer: tuple[str, int] | str | None = (address, port)
+        if hasattr(socket, "AF_UNIX") and family == socket.AF_UNIX:
+            self._peer = address
+        # Must be the same kind of TransportSecurity as the server uses
+        self._security: TransportSecurity = security or AESSecurity()
+        # Names of compressors to offer the server, in order of preference
+        self._offered_compressors: Sequence[str] = compression
+        self.compression_threshold: int = compression_threshold
+        # Reconnections are attempted after a lost connection is noticed, see Backoff
+        self.backoff: Backoff = backoff or Backoff()
+        # Sent messages are kept until acknowledged, to resend after reconnecting
+        self._stream: ReliableStream = ReliableStream(replay_buffer_size)
+        # Messages the server split up, by the first part's sequence number, each part is
+        # deserialised as it arrives rather than all of them once the last has
+        self._partial_messages: dict[int, serialisation.Decoder] = {}
+        # Messages from a BATCH frame not yet returned, with when it was sent and received
+        self._batched_messages: deque[tuple[bytes, int, int]] = deque()
+        # Files being received, by the sequence number of their first frame
+        self._incoming_files: dict[int, ReceivedFile] = {}
+        self._file_callback: Callable[[str, int], BinaryIO] = _temporary_file
+        self._prepare_threading()
+        self._socket.connect(self._peer)
         self._prepare_encryption()
         self._create_uuid()
         self._send_uuid()
+        self._exchange_hello()
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._socket.shutdown(0)
-        self._socket.close()
+        self.close()
 
-    def _prepare_encryption(self):
-        n = int.from_bytes(self._socket.recv(256), "big", signed=False)
-        e = int.from_bytes(self._socket.recv(256), "big", signed=False)
-        rsa_key = RSA.construct((n, e))
-        rsa_cipher = PKCS1_OAEP.new(rsa_key)
+    def _prepare_threading(self) -> None:
+        # Held while writing to the socket, using the reliable stream, or reconnecting
+        # So one connection can be shared by any number of threads
+        self._lock: threading.RLock = threading.RLock()
+        self._closed: bool = False
+        # Set by close, so a thread waiting to reconnect stops without waiting for the lock
+        self._close_requested: threading.Event = threading.Event()
+        self._reconnecting: bool = False
+        self._reconnect_state_callback: Callable[
+            [ReconnectState, int], Any
+        ] | None = None
+        self._receive_thread: threading.Thread | None = None
+        # Received messages, if start_receiving was called without a callback
+        self.incoming: queue.Queue[AnonymousMessage] | None = None
+        # Held by the thread reading from the socket, by recv or by send, see _drain
+        # Taken before _lock when both are needed, and never waited for while holding it
+        self._read_lock: threading.Lock = threading.Lock()
+        # Splits what is read into frames, for the socket it was read from
+        self._frame_decoder: framing.FrameDecoder = framing.FrameDecoder()
+        self._decoded_socket: socket.socket | None = None
+        # Frames read but not yet received, with the socket they were read from and when
+        self._read_frames: deque[tuple[socket.socket, framing.Frame, int]] = deque()
 
-        self._encrypter: ClientEncryption = ClientEncryption()
+    def close(self) -> None:
+        self._close_requested.set()
+        try:
+            # Wakes a reconnection waiting on the server, which holds the lock
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # Already disconnected
+        with self._lock:
+            self._closed = True
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # Already disconnected
+            self._socket.close()
 
-        aes_secret_encrypted = rsa_cipher.encrypt(self._encrypter.aes_secret)
-        self._socket.sendall(aes_secret_encrypted)
+        if (
+            self._receive_thread is not None
+            and self._receive_thread is not threading.current_thread()
+        ):
+            self._receive_thread.join()
+
+    def _prepare_encryption(self):
+        # The security may wrap the socket, such as with TLS
+        server_hostname = self._peer[0] if isinstance(self._peer, tuple) else None
+        self._encrypter: Encryption
+        self._socket, self._encrypter = self._security.connect(
+            self._socket, server_hostname
+        )
 
     def _create_uuid(self) -> None:
         self._uuid = uuid4()
@@ -59,68 +153,396 @@ class ServerConnection:
         encrypted_uuid = self._encrypter.encrypt(self._uuid.bytes)
         self._socket.sendall(encrypted_uuid)
 
-    def _reconnect(self) -> None:
-        print("reconnecting")
-        new_socket = socket.socket(self._socket.family, self._socket.type, self._socket.proto)
-        new_socket.connect((self._address, self._port))
-        self._socket = new_socket
-        self._prepare_encryption()
-        self._send_uuid()
+    def _exchange_hello(self) -> None:
+        # Offers compressors, and tells the server which message was last received
+        hello = framing.CLIENT_HELLO.pack(self._stream.last_received)
+        hello += compression.offer(self._offered_compressors)
+        hello = self._encrypter.encrypt(hello)
+        self._socket.sendall(framing.LENGTH.pack(len(hello)) + hello)
+
+        (reply_size,) = framing.LENGTH.unpack(self._recv_exactly(framing.LENGTH.size))
+        reply = self._encrypter.decrypt(self._recv_exactly(reply_size))
+        chosen, resumed, last_received = framing.SERVER_HELLO.unpack(reply)
+        self._compressor: compression.Compressor | None = compression.from_identifier(
+            chosen, self.compression_threshold
+        )
+
+        if not resumed:
+            # The server has no record of this client, so nothing can be resent
+            self._stream = ReliableStream(self._stream.maximum_size)
+            self._partial_messages.clear()
+            for received in self._incoming_files.values():
+                received.file.close()
+            self._incoming_files.clear()
+            return
+
+        # Resend whatever the server did not receive before the connection was lost
+        self._stream.acknowledge(last_received)
+        for sequence, data in self._stream.unacknowledged():
+            self._send_frame(data, sequence=sequence)
+
+    def _recv_exactly(self, size: int, sock: socket.socket | None = None) -> bytes:
+        # socket.recv can return less than was asked for, even on a blocking socket
+        if sock is None:
+            sock = self._socket
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Socket closed before all data was received")
+            data += chunk
+        return bytes(data)
+
+    def on_reconnect_state(
+        self, callback: Callable[[ReconnectState, int], Any]
+    ) -> Callable[[ReconnectState, int], Any]:
+        # callback(state, attempt) is called on the thread that is reconnecting, with the
+        # number of the attempt about to be made or last made, 0 when DISCONNECTED
+        self._reconnect_state_callback = callback
+        return callback
+
+    def on_file(
+        self, callback: Callable[[str, int], BinaryIO]
+    ) -> Callable[[str, int], BinaryIO]:
+        # callback(name, size) is called as a file sent with Client.send_file starts to
+        # arrive, and returns the binary file to write it to, which is closed once it has
+        # been written and returned as a ReceivedFile
+        # By default it is written to a temporary file, which is never deleted
+        self._file_callback = callback
+        return callback
+
+    def _report_reconnect_state(self, state: ReconnectState, attempt: int) -> None:
+        if self._reconnect_state_callback is None:
+            return
+        try:
+            self._reconnect_state_callback(state, attempt)
+        except Exception as e:
+            traceback.print_exception(e, file=sys.stderr)
+
+    def _reconnect(self, failed_socket: socket.socket) -> None:
+        with self._lock:
+            if failed_socket is not self._socket:
+                return  # Another thread has already reconnected
+            if self._closed:
+                raise ConnectionError("Connection has been closed")
+            if self._peer is None:
+                raise ConnectionError(
+                    "Connection lost, and the address to reconnect to is unknown"
+                )
+            if self._reconnecting:
+                # Resending during the handshake failed, the attempt under way is retried
+                raise ConnectionError("Connection lost while reconnecting")
+            try:
+                # Also wakes any thread still waiting to receive on it
+                failed_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            failed_socket.close()
+
+            self._report_reconnect_state(ReconnectState.DISCONNECTED, 0)
+            lost_at = time.monotonic()
+            attempts = 0
+            while not self.backoff.exhausted(attempts, time.monotonic() - lost_at):
+                delay = self.backoff.delay(attempts)
+                if self.backoff.deadline is not None:
+                    remaining = self.backoff.deadline - (time.monotonic() - lost_at)
+                    delay = min(delay, max(remaining, 0))
+                # Waits without busy looping, and spread out from other clients
+                if self._close_requested.wait(delay):
+                    raise ConnectionError("Connection has been closed")
+
+                attempts += 1
+                self._report_reconnect_state(ReconnectState.RECONNECTING, attempts)
+                self._socket = socket.socket(
+                    failed_socket.family, failed_socket.type, failed_socket.proto
+                )
+                self._socket.settimeout(self.HANDSHAKE_TIMEOUT)
+                self._reconnecting = True
+                try:
+                    self._socket.connect(self._peer)
+                    self._prepare_encryption()
+                    self._send_uuid()
+                    self._exchange_hello()
+                    self._socket.settimeout(None)
+                except (OSError, ValueError, struct.error):
+                    # Refused, or the server went away again or answered with something
+                    # malformed partway through the handshake
+                    self._socket.close()
+                    continue
+                finally:
+                    self._reconnecting = False
+                self._report_reconnect_state(ReconnectState.RECONNECTED, attempts)
+                return
+
+            self._closed = True
+            self._report_reconnect_state(ReconnectState.FAILED, attempts)
+            raise ConnectionError(f"Gave up reconnecting after {attempts} attempts")
 
     @staticmethod
-    def from_socket(sock: socket.socket) -> ServerConnection:
+    def from_socket(
+        sock: socket.socket,
+        *,
+        compression: Sequence[str] = (),
+        compression_threshold: int = 256,
+        replay_buffer_size: int = 1024,
+        security: TransportSecurity | None = None,
+    ) -> ServerConnection:
+        # The socket must already be connected, such as one end of socket.socketpair()
         obj = ServerConnection.__new__(ServerConnection)
         obj._socket = sock
+        obj._peer = None
+        obj._security = security or AESSecurity()
+        obj._offered_compressors = compression
+        obj.compression_threshold = compression_threshold
+        obj.backoff = Backoff()
+        obj._stream = ReliableStream(replay_buffer_size)
+        obj._partial_messages = {}
+        obj._batched_messages = deque()
+        obj._incoming_files = {}
+        obj._file_callback = _temporary_file
+        obj._prepare_threading()
         obj._prepare_encryption()
         obj._create_uuid()
         obj._send_uuid()
+        obj._exchange_hello()
         return obj
 
+    @staticmethod
+    def unix(
+        path: str,
+        *,
+        compression: Sequence[str] = (),
+        compression_threshold: int = 256,
+        replay_buffer_size: int = 1024,
+        security: TransportSecurity | None = None,
+        backoff: Backoff | None = None,
+    ) -> ServerConnection:
+        # Connects to a server listening with Server.start_unix
+        return ServerConnection(
+            path,
+            0,
+            socket.AF_UNIX,
+            compression=compression,
+            compression_threshold=compression_threshold,
+            replay_buffer_size=replay_buffer_size,
+            security=security,
+            backoff=backoff,
+        )
+
     @property
     def socket(self) -> socket.socket:
         return self._socket
 
+    @property
+    def receiving(self) -> bool:
+        # Whether start_receiving was called, and its thread has not stopped
+        return self._receive_thread is not None and self._receive_thread.is_alive()
+
     def send(self, message: Any) -> None:
+        # Safe to call from several threads at once
         data = serialisation.dumps(message)
-        header = struct.pack("!d", datetime.now().timestamp())
-        plaintext = header + data
-        ciphertext = self._encrypter.encrypt(plaintext)
+        with self._lock:
+            # Frames must be written in the order their sequence numbers were given out
+            sequence = self._stream.record(data)
+            self._send_frame(data, sequence=sequence)
+            # The server acknowledges every ACKNOWLEDGE_EVERY messages, so by now it is
+            # likely to have, and a connection that never receives still frees its replay buffer
+            if len(self._stream) >= ReliableStream.ACKNOWLEDGE_EVERY:
+                self._drain()
+
+    def _send_frame(self, data: bytes, flags: int = 0, sequence: int = 0) -> None:
+        with self._lock:
+            # Every frame acknowledges the messages received so far
+            compressor = None if flags & framing.CONTROL else self._compressor
+            plaintext = framing.build_plaintext(
+                data, compressor, flags, sequence, self._stream.acknowledgement()
+            )
+            # Encrypted under the lock, so nonces are used in the order frames are written
+            ciphertext = self._encrypter.encrypt(plaintext)
+
+            sock = self._socket
+            try:
+                sock.sendall(framing.LENGTH.pack(len(ciphertext)) + ciphertext)
+            except (ConnectionError, OSError):
+                # Anything unacknowledged, including this frame if it was a message, is resent
+                self._reconnect(sock)
 
+    def _drain(self) -> None:
+        # Handles the acknowledgements and PINGs that have already arrived, without waiting
+        # The messages they came with are kept for recv
+        if len(self._read_frames) >= self._stream.maximum_size:
+            return  # Left in the socket, so a server sending what nobody receives slows down
+        # Another thread receiving handles them itself
+        if not self._read_lock.acquire(blocking=False):
+            return
         try:
-            self._socket.sendall(len(ciphertext).to_bytes(2, "big", signed=False))
-            self._socket.sendall(ciphertext)
+            with self._lock:
+                self._read(wait=False)
+        finally:
+            self._read_lock.release()
+
+    def _read(self, wait: bool = True) -> None:
+        # Call holding _read_lock, and also _lock unless wait
+        # Reads what has arrived, waiting for something if wait, and handles the
+        # acknowledgement and any PING in each frame completed, keeping the rest for _recv
+        with self._lock:
+            # Never seen halfway through a reconnection by another thread
+            sock = self._socket
+            encrypter = self._encrypter
+            compressor = self._compressor
+        if sock is not self._decoded_socket:
+            self._frame_decoder = framing.FrameDecoder()
+            self._decoded_socket = sock
+
+        try:
+            if wait:
+                data = sock.recv(self.RECEIVE_SIZE)
+            else:
+                # Safe to change, as holding both locks means nothing else is using it
+                timeout = sock.gettimeout()
+                sock.settimeout(0)
+                try:
+                    data = sock.recv(self.RECEIVE_SIZE)
+                finally:
+                    sock.settimeout(timeout)
+            if not data:
+                raise ConnectionError("Socket closed by the server")
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return  # Nothing has arrived
         except (ConnectionError, OSError):
-            self._reconnect()
+            self._reconnect(sock)
+            return
+        received_at_ns = time.time_ns()
 
-    def recv(self) -> AnonymousMessage:
+        for encrypted_data in self._frame_decoder.feed(data):
+            raw_data = encrypter.decrypt(encrypted_data)
+            frame = framing.parse_plaintext(raw_data, compressor)
+            with self._lock:
+                if sock is not self._socket:
+                    return  # Read just before a reconnection, the server resends it
+                self._stream.acknowledge(frame.acknowledged)
+                if frame.flags & framing.PING:
+                    self._send_frame(frame.data, framing.PONG)
+            if not frame.flags & framing.CONTROL:
+                self._read_frames.append((sock, frame, received_at_ns))
+
+    def start_receiving(
+        self, callback: Callable[[AnonymousMessage], Any] | None = None
+    ) -> None:
+        # Receives messages on a background thread, after which recv must not be called
+        # Each message is passed to callback on that thread, or put on self.incoming if there is none
+        if self._receive_thread is not None:
+            raise RuntimeError("Messages are already being received")
+        self.incoming = queue.Queue()
+        self._receive_thread = threading.Thread(
+            target=self._receive_forever, args=(callback,), daemon=True
+        )
+        self._receive_thread.start()
+
+    def _receive_forever(
+        self, callback: Callable[[AnonymousMessage], Any] | None
+    ) -> None:
         while True:
             try:
-                message_size = self._socket.recv(2)
-            except (ConnectionError, OSError):
-                self._reconnect()
-                continue
+                message = self._recv()
+            except Exception as e:
+                if not self._closed:
+                    traceback.print_exception(e, file=sys.stderr)
+                return
 
-            if not message_size:
-                self._reconnect()
+            if callback is None:
+                self.incoming.put(message)
                 continue
+            try:
+                callback(message)
+            except Exception as e:
+                traceback.print_exception(e, file=sys.stderr)
 
-            message_size = int.from_bytes(message_size, "big", signed=False)
+    def _join_part(self, frame: framing.Frame) -> list[Any] | None:
+        # Returns a list of the message once its last part arrives, None until then
+        (first_sequence,) = framing.PART_KEY.unpack_from(frame.data)
+        decoder = self._partial_messages.get(first_sequence)
+        if decoder is None:
+            decoder = self._partial_messages[first_sequence] = serialisation.Decoder()
+        contents = decoder.feed(memoryview(frame.data)[framing.PART_KEY.size :])
+        if frame.flags & framing.MORE:
+            return None
+        del self._partial_messages[first_sequence]
+        if len(contents) != 1 or len(decoder):
+            raise serialisation.MalformedDataError("Parts do not make one message")
+        return contents
 
-            try:
-                encrypted_data = self._socket.recv(message_size)
-                received_at = datetime.now()
-            except (ConnectionError, OSError):
-                self._reconnect()
-                continue
+    def _receive_file_part(self, frame: framing.Frame) -> ReceivedFile | None:
+        # Returns the file once its last frame has been written, None until then
+        (first_sequence,) = framing.FILE_KEY.unpack_from(frame.data)
+        data = memoryview(frame.data)[framing.FILE_KEY.size :]
+        if first_sequence == frame.sequence:
+            (size,) = framing.FILE_START.unpack_from(data)
+            name = bytes(data[framing.FILE_START.size :]).decode()
+            received = ReceivedFile(name, size, self._file_callback(name, size))
+            self._incoming_files[first_sequence] = received
+        else:
+            received = self._incoming_files.get(first_sequence)
+            if received is None:
+                return None  # Its start was lost with a session the server forgot
+            received.file.write(data)
+        if frame.flags & framing.MORE:
+            return None
+        del self._incoming_files[first_sequence]
+        received.file.close()
+        return received
 
-            if not encrypted_data:
-                self._reconnect()
-                continue
+    def recv(self) -> AnonymousMessage:
+        if self._receive_thread is not None:
+            raise RuntimeError("Messages are being received by a background thread")
+        return self._recv()
+
+    def _recv(self) -> AnonymousMessage:
+        with self._read_lock:
+            while True:
+                if self._batched_messages:
+                    data, sent_at_ns, received_at_ns = self._batched_messages.popleft()
+                    return AnonymousMessage(
+                        serialisation.loads(data), sent_at_ns, received_at_ns
+                    )
+                if not self._read_frames:
+                    self._read()
+                    continue
+                message = self._receive_frame(*self._read_frames.popleft())
+                if message is not None:
+                    return message
+
+    def _receive_frame(
+        self, sock: socket.socket, frame: framing.Frame, received_at_ns: int
+    ) -> AnonymousMessage | None:
+        # Returns the message the frame completes, None if it completes nothing
+        with self._lock:
+            if sock is not self._socket:
+                return None  # Read just before a reconnection, the server resends it
+            if not self._stream.receive(frame.sequence):
+                return None  # Already received before a reconnection
+            if self._stream.needs_acknowledgement:
+                self._send_frame(b"", framing.ACK)
+
+            if frame.flags & framing.FILE:
+                received = self._receive_file_part(frame)
+                if received is None:
+                    return None
+                return AnonymousMessage(received, frame.sent_at_ns, received_at_ns)
+
+            if frame.flags & framing.PART:
+                contents = self._join_part(frame)
+                if contents is None:
+                    return None
+                return AnonymousMessage(contents[0], frame.sent_at_ns, received_at_ns)
+            data = frame.data
 
-            raw_data = self._encrypter.decrypt(encrypted_data)
-            sent_at_bytes, data = raw_data[:8], raw_data[8:]
+        if frame.flags & framing.BATCH:
+            data, *rest = framing.unpack_batch(data)
+            self._batched_messages.extend(
+                (message, frame.sent_at_ns, received_at_ns) for message in rest
+            )
 
-            sent_at = datetime.fromtimestamp(struct.unpack("!d", sent_at_bytes)[0])
-            contents = serialisation.loads(data)
+        contents = serialisation.loads(data)
 
-            return AnonymousMessage(contents, sent_at, received_at)
+        return AnonymousMessage(contents, frame.sent_at_ns, received_at_ns)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import abc
+from typing import Iterable
+import zlib
+
+try:
+    import lz4.block
+except ImportError:  # lz4 is an optional dependency
+    lz4 = None
+
+from Hurricane.serialisation import MAXIMUM_SIZE
+
+
+class DecompressionError(Exception):
+    pass
+
+
+class Compressor(abc.ABC):
+    # Sent during the handshake to agree on a compressor, 0 means no compression
+    identifier: int
+    name: str
+    # Whether compressing or decompressing a message depends on earlier ones
+    # A connection using one cannot be carried on by another process
+    stateful: bool = False
+
+    def __init__(self, minimum_size: int = 256):
+        # Data smaller than this is sent uncompressed, it is unlikely to shrink
+        self.minimum_size: int = minimum_size
+
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        ...
+
+
+class ZlibCompressor(Compressor):
+    identifier = 1
+    name = "zlib"
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = zlib.decompressobj()
+        # Bounded so a small frame cannot expand into an arbitrarily large one
+        decompressed = decompressor.decompress(data, MAXIMUM_SIZE + 1)
+        if len(decompressed) > MAXIMUM_SIZE or not decompressor.eof:
+            raise DecompressionError("Decompressed data is too large or incomplete")
+        return decompressed
+
+
+class ZlibStreamCompressor(Compressor):
+    # One zlib stream is kept per connection, so later messages can refer back to earlier ones
+    # Consecutive messages are usually similar, so this compresses far better than ZlibCompressor
+    # Every compressed message must be decompressed, in order, by the other end of the connection
+    identifier = 2
+    name = "zlib-stream"
+    stateful = True
+
+    def __init__(self, minimum_size: int = 256):
+        super().__init__(minimum_size)
+        self._compressor = zlib.compressobj()
+        self._decompressor = zlib.decompressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressed = self._decompressor.decompress(data, MAXIMUM_SIZE + 1)
+        if len(decompressed) > MAXIMUM_SIZE or self._decompressor.unconsumed_tail:
+            raise DecompressionError("Decompressed data is too large")
+        return decompressed
+
+
+class LZ4Compressor(Compressor):
+    # Compresses less than zlib, but is much faster in both directions
+    identifier = 3
+    name = "lz4"
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4.block.compress(data, store_size=True)
+
+    def decompress(self, data: bytes) -> bytes:
+        if int.from_bytes(data[:4], "little") > MAXIMUM_SIZE:
+            raise DecompressionError("Decompressed data is too large")
+        try:
+            return lz4.block.decompress(data)
+        except lz4.block.LZ4BlockError as e:
+            raise DecompressionError(e)
+
+
+available_compressors: dict[str, type[Compressor]] = {
+    ZlibCompressor.name: ZlibCompressor,
+    ZlibStreamCompressor.name: ZlibStreamCompressor,
+}
+if lz4 is not None:
+    available_compressors[LZ4Compressor.name] = LZ4Compressor
+
+_identifier_to_compressor: dict[int, type[Compressor]] = {
+    compressor.identifier: compressor for compressor in available_compressors.values()
+}
+
+
+def offer(names: Iterable[str]) -> bytes:
+    # Compressors are offered in order of preference
+    # Any that are not installed are silently left out
+    return bytes(
+        available_compressors[name].identifier
+        for name in names
+        if name in available_compressors
+    )
+
+
+def choose(offered: bytes, accepted: Iterable[str] | None) -> int:
+    # Picks the first offered compressor that is accepted, or 0 if there are none
+    # If accepted is None, any installed compressor is accepted
+    if accepted is None:
+        accepted = available_compressors.keys()
+    accepted_identifiers = set(offer(accepted))
+    for identifier in offered:
+        if identifier in accepted_identifiers:
+            return identifier
+    return 0
+
+
+def from_identifier(identifier: int, minimum_size: int) -> Compressor | None:
+    if identifier == 0:
+        return None
+    if identifier not in _identifier_to_compressor:
+        raise ValueError(f"Unknown compressor {identifier}")
+    return _identifier_to_compressor[identifier](minimum_size)
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Any, Iterable
+from weakref import WeakKeyDictionary
+
+from Hurricane import serialisation
+from Hurricane.client import Client
+
+# Kinds of change, the first item of every change
+REPLACE = 0  # (REPLACE, new value)
+DICT = 1  # (DICT, {key: change}, [removed keys])
+LIST = 2  # (LIST, new length, {index: change})
+# (OBJECT, {attribute: change}, [removed attributes]), for @make_serialisable objects
+OBJECT = 3
+
+
+def diff(old: Any, new: Any) -> tuple | None:
+    # Returns the changes that turn old into new, None if they are equal
+    # Only dicts, lists and @make_serialisable objects are compared item by item,
+    # anything else is replaced whole if it is not equal
+    if type(old) is not type(new):
+        return (REPLACE, new)
+
+    if type(new) is dict:
+        changes = _diff_items(old, new)
+        removed = [key for key in old if key not in new]
+        if changes or removed:
+            return (DICT, changes, removed)
+    elif type(new) is list:
+        changes = {}
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            change = diff(old_item, new_item)
+            if change is not None:
+                changes[index] = change
+        for index in range(len(old), len(new)):
+            changes[index] = (REPLACE, new[index])
+        if changes or len(old) != len(new):
+            return (LIST, len(new), changes)
+    elif type(new) in serialisation._user_defined_serialisable_types:
+        old_attributes, new_attributes = _attributes(old), _attributes(new)
+        changes = _diff_items(old_attributes, new_attributes)
+        removed = [name for name in old_attributes if name not in new_attributes]
+        if changes or removed:
+            return (OBJECT, changes, removed)
+    elif old != new:
+        return (REPLACE, new)
+    return None
+
+
+def patch(old: Any, change: tuple | None) -> Any:
+    # Returns old with change applied. Anything changed is copied rather than modified,
+    # so unchanged parts are shared between old and the result, and old stays as it was
+    if change is None:
+        return old
+
+    kind = change[0]
+    if kind == REPLACE:
+        return change[1]
+    elif kind == DICT:
+        _, changes, removed = change
+        new = dict(old)
+        for key in removed:
+            del new[key]
+        for key, item_change in changes.items():
+            new[key] = patch(new.get(key, None), item_change)
+        return new
+    elif kind == LIST:
+        _, length, changes = change
+        new = old[:length]
+        new.extend([None] * (length - len(new)))
+        for index, item_change in changes.items():
+            new[index] = patch(new[index], item_change)
+        return new
+    elif kind == OBJECT:
+        _, changes, removed = change
+        object_class = type(old)
+        new = object_class.__new__(object_class)
+        attributes = _attributes(old)
+        for name in removed:
+            del attributes[name]
+        for name, item_change in changes.items():
+            attributes[name] = patch(attributes.get(name, None), item_change)
+        for name, value in attributes.items():
+            setattr(new, name, value)
+        return new
+    raise ValueError(f"Unknown kind of change {kind}")
+
+
+def _diff_items(old: dict, new: dict) -> dict:
+    changes = {}
+    for key, new_item in new.items():
+        if key in old:
+            change = diff(old[key], new_item)
+            if change is not None:
+                changes[key] = change
+        else:
+            changes[key] = (REPLACE, new_item)
+    return changes
+
+
+def _attributes(obj: Any) -> dict[str, Any]:
+    # Slots that are set and the contents of __dict__, as serialisation sees them
+    attributes = {}
+    for name in getattr(obj, "__slots__", ()):
+        if name != "__dict__" and hasattr(obj, name):
+            attributes[name] = getattr(obj, name)
+    attributes.update(getattr(obj, "__dict__", {}))
+    return attributes
+
+
+@serialisation.make_serialisable
+class StateUpdate:
+    # Sent by DeltaSync, and applied by StateReplica
+    # changes turns the state at base_version into the state at version
+    # If base_version is 0, changes is the whole state
+    __slots__ = ("name", "version", "base_version", "changes")
+
+    def __init__(
+        self, name: str, version: int, base_version: int, changes: Any
+    ) -> None:
+        self.name: str = name
+        self.version: int = version
+        self.base_version: int = base_version
+        self.changes: Any = changes
+
+
+@serialisation.make_serialisable
+class ResyncRequest:
+    # Sent by a client whose StateReplica diverged, the server should call DeltaSync.resync
+    __slots__ = ("name",)
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+
+
+class StateDiverged(Exception):
+    pass
+
+
+class _ClientView:
+    # What the server knows a client has of the state
+    __slots__ = ("base_version", "base", "pending", "reconnections")
+
+    def __init__(self, reconnections: int) -> None:
+        # The newest version the client has acknowledged, 0 if there is none
+        self.base_version: int = 0
+        self.base: Any = None
+        # Sequence number, version and state of each update sent but not acknowledged
+        self.pending: deque[tuple[int, int, Any]] = deque()
+        self.reconnections: int = reconnections
+
+
+class DeltaSync:
+    # Sends a state, such as a game world, to clients each time publish is called
+    # Each client is sent only what has changed since the newest version it acknowledged
+    # Clients that acknowledged the same version share one update, diffed and serialised once
+    # Acknowledgements are those every frame already carries, so nothing extra is sent,
+    # but a client that sends nothing only acknowledges every ReliableStream.ACKNOWLEDGE_EVERY
+    # messages, so history must be more than that
+    def __init__(self, name: str = "state", history: int = 32) -> None:
+        # Matches StateUpdate.name, so one connection can carry several states
+        self.name: str = name
+        # The whole state is resent to a client with more than this many unacknowledged updates
+        self.history: int = history
+        self.version: int = 0
+        self._views: WeakKeyDictionary[Client, _ClientView] = WeakKeyDictionary()
+
+    async def publish(self, state: Any, clients: Iterable[Client]) -> None:
+        self.version += 1
+        # A copy that later changes to state cannot affect, and is exactly what clients see
+        snapshot = serialisation.loads(serialisation.dumps(state))
+
+        by_base_version: dict[int, list[tuple[Client, _ClientView]]] = {}
+        for client in clients:
+            view = self._view(client)
+            by_base_version.setdefault(view.base_version, []).append((client, view))
+
+        sends = []
+        for base_version, members in by_base_version.items():
+            if base_version == 0:
+                changes = snapshot
+            else:
+                changes = diff(members[0][1].base, snapshot)
+            data = serialisation.dumps(
+                StateUpdate(self.name, self.version, base_version, changes)
+            )
+            sends += [
+                self._send(client, view, data, self.version, snapshot)
+                for client, view in members
+            ]
+        await asyncio.gather(*sends)
+
+    def resync(self, client: Client) -> None:
+        # The whole state is sent to client on the next publish
+        self._views.pop(client, None)
+
+    async def _send(
+        self,
+        client: Client,
+        view: _ClientView,
+        data: bytes,
+        version: int,
+        snapshot: Any,
+    ) -> None:
+        sequence = await client.send_serialised(data)
+        if sequence is not None:
+            view.pending.append((sequence, version, snapshot))
+
+    def _view(self, client: Client) -> _ClientView:
+        view = self._views.get(client, None)
+        if view is not None:
+            acknowledged = client.last_acknowledged_sequence
+            while view.pending and view.pending[0][0] <= acknowledged:
+                _, view.base_version, view.base = view.pending.popleft()
+
+        if (
+            view is None
+            or view.reconnections != client.reconnections
+            or len(view.pending) >= self.history
+        ):
+            # Updates may have been lost, so the client starts again from the whole state
+            view = self._views[client] = _ClientView(client.reconnections)
+        return view
+
+
+class StateReplica:
+    # Rebuilds the state a DeltaSync publishes, from the StateUpdates received
+    # Versions the server may still send changes from are kept, sharing unchanged parts,
+    # so the state returned must not be modified
+    def __init__(self, name: str = "state", history: int = 32) -> None:
+        self.name: str = name
+        # Must be at least DeltaSync.history, the server never goes further back than that
+        self.history: int = history
+        self.version: int = 0
+        self._history: dict[int, Any] = {}
+
+    @property
+    def state(self) -> Any:
+        # None until the first update
+        return self._history.get(self.version, None)
+
+    def apply(self, update: StateUpdate) -> Any:
+        # Returns the new state
+        # Raises StateDiverged if the update cannot be applied, send a ResyncRequest then
+        if update.base_version == 0:
+            state = update.changes
+        elif update.base_version in self._history:
+            state = patch(self._history[update.base_version], update.changes)
+        else:
+            raise StateDiverged(
+                f"Version {update.base_version} of {self.name!r} is not known"
+            )
+
+        self._history[update.version] = state
+        self.version = update.version
+        # The server never goes back to anything older than a version it has used
+        for version in list(self._history):
+            if version >= update.base_version and len(self._history) <= self.history:
+                break
+            del self._history[version]
+        return state
@@ -5,13 +5,16 @@ from Crypto.Cipher import AES
 import hmac
 from itertools import count
 import os
-from typing import Iterator, TYPE_CHECKING
+from typing import Iterator, TYPE_CHECKING, Union
 
 if TYPE_CHECKING:
     from Crypto.Cipher._mode_ctr import CtrMode as CtrAES
 
 
 class BaseEncryption(abc.ABC):
+    # Number of bytes encrypt adds to the data, the HMAC
+    overhead: int = 32
+
     def __init__(self, secret: bytes | None = None):
         self._secret: bytes
         if secret is None:
@@ -33,6 +36,24 @@ class BaseEncryption(abc.ABC):
     def aes_secret(self) -> bytes:
         return self._secret
 
+    def export_state(self) -> tuple[bytes, int, int]:
+        # The secret and the next nonce in each direction
+        # So another process can carry on the connection, see Hurricane.handoff
+        server_nonce = next(self._server_counter)
+        client_nonce = next(self._client_counter)
+        self._server_counter = count(server_nonce)
+        self._client_counter = count(client_nonce)
+        return self._secret, server_nonce, client_nonce
+
+    @classmethod
+    def from_state(
+        cls, secret: bytes, server_nonce: int, client_nonce: int
+    ) -> BaseEncryption:
+        encrypter = cls(secret)
+        encrypter._server_counter = count(server_nonce)
+        encrypter._client_counter = count(client_nonce)
+        return encrypter
+
     def get_aes_key(self, nonce: bytes) -> CtrAES:
         return AES.new(self._secret, AES.MODE_CTR, nonce=nonce)
 
@@ -73,3 +94,43 @@ class ClientEncryption(BaseEncryption):
 
     def get_decryption_nonce(self) -> int:
         return next(self._server_counter)
+
+
+class BaseIntegrity(BaseEncryption):
+    # Frames are authenticated but not encrypted, for links that are already private
+    # The nonce is part of the HMAC, so frames cannot be replayed or reordered
+    def encrypt(self, data: bytes) -> bytes:
+        nonce = self.get_encryption_nonce().to_bytes(8, "big", signed=False)
+        return self.get_hmac(nonce + data) + data
+
+    def decrypt(self, data: bytes) -> bytes:
+        hmac_digest_received, data = data[:32], data[32:]
+        nonce = self.get_decryption_nonce().to_bytes(8, "big", signed=False)
+        hmac_digest_computed = self.get_hmac(nonce + data)
+        if not hmac.compare_digest(hmac_digest_received, hmac_digest_computed):
+            raise ValueError("HMAC is incorrect")
+        return data
+
+
+class ServerIntegrity(BaseIntegrity, ServerEncryption):
+    pass
+
+
+class ClientIntegrity(BaseIntegrity, ClientEncryption):
+    pass
+
+
+class NullEncryption:
+    # Used when frames need no protection of their own, on trusted links or inside TLS
+    # Data is passed through unchanged
+    overhead: int = 0
+
+    def encrypt(self, data: bytes) -> bytes:
+        return data
+
+    def decrypt(self, data: bytes) -> bytes:
+        return data
+
+
+# Anything frames can be encrypted with
+Encryption = Union[BaseEncryption, NullEncryption]
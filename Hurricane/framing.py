@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import struct
+import time
+from typing import NamedTuple
+
+from Hurricane.compression import Compressor
+
+# Every frame on the wire is a length, then that many bytes of encrypted data
+LENGTH = struct.Struct("!H")
+
+# The encrypted data starts with a header, followed by the serialised message
+# The header is the time the frame was sent at in nanoseconds since the epoch, a byte of
+# flags, the frame's sequence number, then the sequence number of the last message
+# received from the other end
+# Only messages have sequence numbers, control frames always use 0
+HEADER = struct.Struct("!QBQQ")
+
+# Flags
+COMPRESSED = 0b0000_0001
+PING = 0b0000_0010  # Heartbeat, must be answered with a PONG carrying the same data
+PONG = 0b0000_0100
+ACK = 0b0000_1000  # Carries an acknowledgement in the header and nothing else
+# Carries part of a message too big to send in one go, see Client.CHUNK_SIZE
+# Each part has its own sequence number, so frames of other messages can go between them
+PART = 0b0001_0000
+MORE = 0b0010_0000  # Another part of the same message follows
+# Carries several messages, so they share one header, encryption and write
+# The data is each message preceded by its LENGTH, see pack_batch
+BATCH = 0b0100_0000
+# Carries part of a file, see Client.send_file, MORE is set on all but the last
+FILE = 0b1000_0000
+
+# Frames with any of these flags are handled by the connection, not passed on as messages
+CONTROL = PING | PONG | ACK
+
+# Data of a PART starts with the sequence number of the message's first part,
+# which identifies the message the part belongs to
+PART_KEY = struct.Struct("!Q")
+
+# Data of a FILE starts with the sequence number of the transfer's first frame
+# That frame's data goes on with FILE_START, then the file's name in UTF-8, and the data of
+# the rest goes on with the file's contents, in order
+FILE_KEY = struct.Struct("!Q")
+# The size of the file in bytes
+FILE_START = struct.Struct("!Q")
+
+# Data of a PING, the sender's time.monotonic() so the round trip time can be measured
+HEARTBEAT = struct.Struct("!d")
+
+# Sent by the client after its UUID, followed by the identifiers of the compressors it offers
+# The last message the client received, so the server knows what to resend after a reconnection
+CLIENT_HELLO = struct.Struct("!Q")
+
+# The server's reply, the chosen compressor, whether an existing session was resumed,
+# and the last message the server received from the client in that session
+SERVER_HELLO = struct.Struct("!B?Q")
+
+
+class Frame(NamedTuple):
+    sent_at_ns: int
+    flags: int
+    sequence: int
+    acknowledged: int
+    data: bytes
+
+
+class FrameDecoder:
+    # Splits a stream of bytes into the encrypted data of each frame, however the bytes
+    # were divided when they arrived
+    # Push-based, so it can be fed from a StreamReader, a Protocol's data_received, or a socket
+    def __init__(self) -> None:
+        # The start of a frame that has not completely arrived yet
+        self._buffer: bytearray = bytearray()
+        # The size of that frame including its length, 0 until its length has arrived
+        self._needed: int = 0
+
+    def __len__(self) -> int:
+        # Bytes fed in, but not yet returned as part of a frame
+        return len(self._buffer)
+
+    def buffered(self) -> bytes:
+        # The bytes counted by len, so another decoder can carry on from them
+        return bytes(self._buffer)
+
+    def feed(self, data: bytes | bytearray | memoryview) -> list[bytes]:
+        buffer = self._buffer
+        if len(buffer) + len(data) < self._needed:
+            buffer += data  # The length has already been read, no need to read it again
+            return []
+
+        if buffer:
+            buffer += data
+            data = buffer
+        view = memoryview(data)
+        frames = []
+        offset = 0
+        while len(view) - offset >= LENGTH.size:
+            (size,) = LENGTH.unpack_from(view, offset)
+            end = offset + LENGTH.size + size
+            if end > len(view):
+                self._needed = end - offset
+                break
+            frames.append(bytes(view[offset + LENGTH.size : end]))
+            offset = end
+        else:
+            self._needed = 0
+        view.release()
+
+        # Only the start of the next frame is kept
+        if data is buffer:
+            del buffer[:offset]
+        else:
+            buffer += data[offset:]
+        return frames
+
+
+def pack_batch(messages: list[bytes]) -> bytes:
+    return b"".join(LENGTH.pack(len(message)) + message for message in messages)
+
+
+def unpack_batch(data: bytes) -> list[bytes]:
+    view = memoryview(data)
+    messages = []
+    offset = 0
+    while offset < len(view):
+        (size,) = LENGTH.unpack_from(view, offset)
+        offset += LENGTH.size
+        if offset + size > len(view):
+            raise ValueError("A message in the batch runs past its end")
+        messages.append(bytes(view[offset : offset + size]))
+        offset += size
+    view.release()
+    return messages
+
+
+def build_plaintext(
+    data: bytes,
+    compressor: Compressor | None,
+    flags: int = 0,
+    sequence: int = 0,
+    acknowledged: int = 0,
+) -> bytes:
+    if compressor is not None and len(data) >= compressor.minimum_size:
+        data = compressor.compress(data)
+        flags |= COMPRESSED
+
+    header = HEADER.pack(time.time_ns(), flags, sequence, acknowledged)
+    return header + data
+
+
+def parse_plaintext(plaintext: bytes, compressor: Compressor | None) -> Frame:
+    sent_at_ns, flags, sequence, acknowledged = HEADER.unpack_from(plaintext)
+    data = plaintext[HEADER.size :]
+
+    if flags & COMPRESSED:
+        if compressor is None:
+            raise ValueError("Received compressed data but no compressor was agreed")
+        data = compressor.decompress(data)
+
+    return Frame(sent_at_ns, flags, sequence, acknowledged, data)
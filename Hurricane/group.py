@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Iterable
+from typing import Any, Hashable, Iterable
 from weakref import WeakSet
 
 from Hurricane.client import Client
+from Hurricane.lanes import NORMAL
 
 
 class Group:
@@ -23,10 +24,34 @@ class Group:
     def __len__(self) -> len:
         return len(self._members)
 
-    async def send(self, message: Any) -> None:
-        await self.checked_send(message, set())
+    async def send(
+        self,
+        message: Any,
+        priority: int = NORMAL,
+        conflate_key: Hashable | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        await self.checked_send(message, set(), False, priority, conflate_key, ttl)
 
-    async def checked_send(self, message: Any, already_sent_to: set) -> None:
+    async def send_serialised(
+        self,
+        data: bytes,
+        priority: int = NORMAL,
+        conflate_key: Hashable | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        # Sends data from serialisation.dumps, serialising once instead of once per client
+        await self.checked_send(data, set(), True, priority, conflate_key, ttl)
+
+    async def checked_send(
+        self,
+        message: Any,
+        already_sent_to: set,
+        serialised: bool = False,
+        priority: int = NORMAL,
+        conflate_key: Hashable | None = None,
+        ttl: float | None = None,
+    ) -> None:
         new_already_sent_to = already_sent_to.copy()
         for member in self._members:
             new_already_sent_to.add(member)
@@ -42,11 +67,31 @@ class Group:
 
         await asyncio.gather(
             *[
-                member.checked_send(message, new_already_sent_to)
+                member.checked_send(
+                    message,
+                    new_already_sent_to,
+                    serialised,
+                    priority,
+                    conflate_key,
+                    ttl,
+                )
                 for member in groups_to_send_to
             ]
         )
-        await asyncio.gather(*[member.send(message) for member in clients_to_send_to])
+        if serialised:
+            await asyncio.gather(
+                *[
+                    member.send_serialised(message, priority, conflate_key, ttl)
+                    for member in clients_to_send_to
+                ]
+            )
+        else:
+            await asyncio.gather(
+                *[
+                    member.send(message, priority, conflate_key, ttl)
+                    for member in clients_to_send_to
+                ]
+            )
 
     def add(self, new_member: Group | Client) -> None:
         self._members.add(new_member)
@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import struct
+import sys
+import time
+import traceback
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Iterator
+from uuid import UUID
+
+from Hurricane import compression, framing, serialisation
+from Hurricane.client import Client, ClientState, _Outgoing
+from Hurricane.encryption import NullEncryption, ServerEncryption, ServerIntegrity
+from Hurricane.message import Message
+from Hurricane.reliability import ReliableStream
+
+if TYPE_CHECKING:
+    from Hurricane.server import Server
+
+# Restarts a server without dropping its clients
+# The running process listens on a Unix socket at Server.handoff_path. A new process
+# connects to it, and is sent the listening sockets, every client's socket, and every
+# session: the encryption secret and nonces, sequence numbers, and the messages not yet
+# sent, acknowledged or dispatched. Clients carry on without noticing
+# A session whose connection cannot be carried on, such as one inside TLS, is handed over
+# without it, and its client reconnects to the new process to resume it
+# Only what Hurricane keeps is handed over, anything the application keeps is not
+
+# Seconds either process waits for the other before giving up
+TIMEOUT: float = 10.0
+
+# Numbers of file descriptors and records that follow
+_PRELUDE = struct.Struct("!II")
+_RECORD_SIZE = struct.Struct("!I")
+# Sequence number and flags of an unacknowledged message
+_UNACKNOWLEDGED = struct.Struct("!QB")
+# Priority, how much has been written, the first part's sequence number, see _Outgoing,
+# and the size of the serialised conflate_key, seconds until expiry and path of a file
+# sent with Client.send_file that follow, before the message's data
+_OUTGOING = struct.Struct("!BIQH")
+_TIMESTAMPS = struct.Struct("!QQ")
+# Sent by the new process once it has everything, after which the old one lets go
+_ACKNOWLEDGED = b"\x01"
+# Linux refuses to pass more than 253 in one message
+_FDS_PER_MESSAGE = 200
+
+# Encryption a connection can be carried on with, by the name it is handed over as
+_encryption_kinds: dict[type, str] = {
+    ServerEncryption: "aes",
+    ServerIntegrity: "integrity",
+    NullEncryption: "none",
+}
+_kind_to_encryption: dict[str, type] = {
+    kind: encryption for encryption, kind in _encryption_kinds.items()
+}
+
+# A listening socket, and how to listen on it again if the handoff fails
+_Listener = tuple[Callable[..., Coroutine[Any, Any, asyncio.Server]], socket.socket]
+
+
+async def hand_over(server: Server, sock: socket.socket) -> bool:
+    # Sends everything to the process connected to sock
+    # Returns True once it has taken over, after which server stops serving
+    # Returns False if it failed, and server carries on as it was
+
+    # Closed here, but kept open by these copies, so connections wait in the backlog
+    listeners: list[_Listener] = [
+        (start_listening, socket.socket(fileno=os.dup(listening_socket.fileno())))
+        for listener, start_listening in server._listeners
+        for listening_socket in listener.sockets
+    ]
+    for listener, _ in server._listeners:
+        listener.close()
+    server._listeners.clear()
+
+    clients: list[Client] = []
+    try:
+        acknowledged = await _send_sessions(server, sock, listeners, clients)
+    except OSError:
+        acknowledged = False  # The new process went away
+    except Exception as e:
+        traceback.print_exception(e, file=sys.stderr)
+        acknowledged = False
+
+    if not acknowledged:
+        for start_listening, listening_socket in listeners:
+            listener = await start_listening(sock=listening_socket)
+            server._listeners.append((listener, start_listening))
+        for client in clients:
+            if client._suspended:
+                client._resume(server._received_message_callback)
+        return False
+
+    for _, listening_socket in listeners:
+        listening_socket.close()
+    for metrics_server in server._metrics_servers:
+        metrics_server.close()
+    for client in clients:
+        # The new process has its own copy of each socket, closing this one leaves the
+        # connection open, unless it was not handed over, so the client reconnects
+        client._state = ClientState.CLOSED
+        client._release_senders()
+        if client._tcp_writer is not None:
+            client._tcp_writer.transport.abort()
+    server._clients.clear()
+    return True
+
+
+async def _send_sessions(
+    server: Server,
+    sock: socket.socket,
+    listeners: list[_Listener],
+    clients: list[Client],
+) -> bool:
+    # Suspends every client and sends them to the new process, returning whether it
+    # acknowledged them
+    # Each client is added to clients once it is suspended, so hand_over can resume them
+    # however this fails
+    loop = asyncio.get_running_loop()
+    # Handshakes already under way finish first, so those clients are handed over too
+    if server._handshakes:
+        _, unfinished = await asyncio.wait(server._handshakes, timeout=TIMEOUT)
+        for task in unfinished:
+            task.cancel()
+
+    clients += [
+        client
+        for client in server._clients.values()
+        if client.state != ClientState.CLOSED
+    ]
+    await asyncio.gather(*(client._suspend() for client in clients))
+    # Whatever was written reaches the client before its socket changes hands
+    deadline = loop.time() + TIMEOUT
+    while loop.time() < deadline and any(
+        client._tcp_writer is not None
+        and client._tcp_writer.transport.get_write_buffer_size()
+        for client in clients
+    ):
+        await asyncio.sleep(0.01)
+
+    fds = [listening_socket.fileno() for _, listening_socket in listeners]
+    records = [serialisation.dumps((len(listeners), len(clients)))]
+    for client in clients:
+        fd = _connection_to_hand_over(client)
+        if fd is not None:
+            fds.append(fd)
+        # Fails if a message was sent with a conflate_key that cannot be serialised
+        records += _export(server, client, fd is not None)
+
+    await asyncio.to_thread(_send, sock, fds, records)
+    return await asyncio.to_thread(sock.recv, 1) == _ACKNOWLEDGED
+
+
+async def take_over(server: Server, path: str) -> bool:
+    # Takes over from the process listening at path
+    # Returns False if there is none, such as the first time a server starts
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The old process may wait TIMEOUT for handshakes, then again for writes, before sending
+    sock.settimeout(3 * TIMEOUT)
+    with sock:
+        try:
+            await asyncio.to_thread(sock.connect, path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+
+        fds, records = await asyncio.to_thread(_receive, sock)
+        try:
+            listener_count, sessions = _parse(records)
+            # Nothing is read or written until the old process has let go
+            await asyncio.to_thread(sock.sendall, _ACKNOWLEDGED)
+        except BaseException:
+            for fd in fds:
+                os.close(fd)
+            raise
+
+    server._inherited_sockets += [
+        socket.socket(fileno=fd) for fd in fds[:listener_count]
+    ]
+    connection_fds = iter(fds[listener_count:])
+    for session in sessions:
+        fd = next(connection_fds) if session["connected"] else None
+        await _restore(server, session, fd)
+    return True
+
+
+def _connection_to_hand_over(client: Client) -> int | None:
+    # The file descriptor of the client's socket, None if only the session can be handed over
+    writer = client._tcp_writer
+    if client.state != ClientState.OPEN or writer is None:
+        return None
+    if writer.transport.is_closing() or writer.transport.get_write_buffer_size():
+        return None
+    if writer.get_extra_info("sslcontext") is not None:
+        return None  # The TLS state is inside the ssl module, and cannot be exported
+    if client._compressor is not None and client._compressor.stateful:
+        return None
+    if type(client._encrypter) not in _encryption_kinds:
+        return None
+    return writer.get_extra_info("socket").fileno()
+
+
+def _export(server: Server, client: Client, connected: bool) -> list[bytes]:
+    unacknowledged = list(client._stream.unacknowledged_frames())
+    outgoing = list(client._outgoing_message_queue)
+    incoming = list(client._incoming_message_queue)
+    subscriptions = sorted(server.topics.subscriptions(client))
+    now = time.monotonic()
+    header = {
+        "uuid": client.uuid.bytes,
+        "connected": connected,
+        "encryption": None,
+        "compressor": None,
+        "stream": client._stream.export_state(),
+        "unacknowledged": len(unacknowledged),
+        "outgoing": len(outgoing),
+        "incoming": len(incoming),
+        "reconnections": client.reconnections,
+        "rtt": client.rtt,
+        "subscriptions": len(subscriptions),
+    }
+    records = [b""]
+    if connected:
+        encrypter = client._encrypter
+        kind = _encryption_kinds[type(encrypter)]
+        state = None if kind == "none" else encrypter.export_state()
+        header["encryption"] = (kind, state)
+        if client._compressor is not None:
+            header["compressor"] = (
+                client._compressor.identifier,
+                client._compressor.minimum_size,
+            )
+        # Anything read but not yet handled, in the order it arrived
+        records.append(
+            b"".join(
+                framing.LENGTH.pack(len(frame)) + frame
+                for frame in client._unhandled_frames
+            )
+            + client._decoder.buffered()
+            # StreamReader has no public way to take what it holds without waiting
+            + bytes(client._tcp_reader._buffer)
+        )
+    records[0] = serialisation.dumps(header)
+
+    records += [
+        # A chunk of a file is read from it again
+        _UNACKNOWLEDGED.pack(sequence, flags) + bytes(data)
+        for sequence, data, flags in unacknowledged
+    ]
+    for priority, message in outgoing:
+        remaining = None if message.expires_at is None else message.expires_at - now
+        conflation = serialisation.dumps((message.key, remaining, message.path))
+        records.append(
+            _OUTGOING.pack(
+                priority, message.offset, message.first_sequence, len(conflation)
+            )
+            + conflation
+            + message.data
+        )
+    records += [
+        _TIMESTAMPS.pack(message.sent_at_ns, message.received_at_ns)
+        + serialisation.dumps(message.contents)
+        for message in incoming
+    ]
+    # Each pattern is a record of its own, as a client can have more than fit in one
+    records += [pattern.encode() for pattern in subscriptions]
+    return records
+
+
+def _parse(records: list[bytes]) -> tuple[int, list[dict[str, Any]]]:
+    # Returns the number of listening sockets, and every session, before anything is used
+    records = iter(records)
+    listener_count, session_count = serialisation.loads(next(records))
+    sessions = []
+    for _ in range(session_count):
+        session = serialisation.loads(next(records))
+        session["input"] = next(records) if session["connected"] else b""
+        unacknowledged = []
+        for record in _take(records, session["unacknowledged"]):
+            sequence, flags = _UNACKNOWLEDGED.unpack_from(record)
+            unacknowledged.append((sequence, record[_UNACKNOWLEDGED.size :], flags))
+        session["unacknowledged"] = unacknowledged
+        session["outgoing"] = [
+            _parse_outgoing(record) for record in _take(records, session["outgoing"])
+        ]
+        session["incoming"] = [
+            (
+                *_TIMESTAMPS.unpack_from(record),
+                serialisation.loads(record[_TIMESTAMPS.size :]),
+            )
+            for record in _take(records, session["incoming"])
+        ]
+        session["subscriptions"] = [
+            record.decode() for record in _take(records, session["subscriptions"])
+        ]
+        sessions.append(session)
+    return listener_count, sessions
+
+
+def _parse_outgoing(
+    record: bytes,
+) -> tuple[int, int, int, Any, float | None, str | None, bytes]:
+    # Priority, offset, first part's sequence number, conflate_key, seconds until expiry,
+    # path and data
+    priority, offset, first_sequence, size = _OUTGOING.unpack_from(record)
+    end = _OUTGOING.size + size
+    key, remaining, path = serialisation.loads(record[_OUTGOING.size : end])
+    return priority, offset, first_sequence, key, remaining, path, record[end:]
+
+
+def _take(records: Iterator[bytes], count: int) -> list[bytes]:
+    return [next(records) for _ in range(count)]
+
+
+async def _restore(server: Server, session: dict[str, Any], fd: int | None) -> None:
+    reader = writer = None
+    if fd is not None:
+        reader, writer = await server._open_accepted_socket(socket.socket(fileno=fd))
+
+    builder = server._client_builder(reader, writer)
+    builder.uuid = UUID(bytes=session["uuid"])
+    if session["encryption"] is not None:
+        kind, state = session["encryption"]
+        encryption = _kind_to_encryption[kind]
+        builder.encrypter = (
+            encryption() if state is None else encryption.from_state(*state)
+        )
+    if session["compressor"] is not None:
+        builder.compressor = compression.from_identifier(*session["compressor"])
+
+    client = builder.construct()
+    client._stream = ReliableStream.from_state(
+        session["stream"], session["unacknowledged"]
+    )
+    now = time.monotonic()
+    for outgoing in session["outgoing"]:
+        priority, offset, first_sequence, key, remaining, path, data = outgoing
+        expires_at = None if remaining is None else now + remaining
+        client._queue(
+            _Outgoing(data, None, offset, first_sequence, key, expires_at, path),
+            priority,
+        )
+    for sent_at_ns, received_at_ns, contents in session["incoming"]:
+        client._incoming_message_queue.push(
+            Message(contents, sent_at_ns, received_at_ns, client)
+        )
+    client._reconnections = session["reconnections"]
+    client._rtt = session["rtt"]
+    client._unhandled_frames.extend(client._decoder.feed(session["input"]))
+    for pattern in session["subscriptions"]:
+        server.topics.subscribe(client, pattern)
+
+    if writer is None:
+        # Resumed when the client reconnects, as it does once the old process lets go
+        client._state = ClientState.RECONNECTING
+        client._disconnect_task_handle = client._timers.schedule(
+            client.reconnect_timeout, client.shutdown
+        )
+    server._clients[client.uuid] = client
+    client.start_receiving(server._received_message_callback)
+
+
+def _send(sock: socket.socket, fds: list[int], records: list[bytes]) -> None:
+    sock.sendall(_PRELUDE.pack(len(fds), len(records)))
+    for start in range(0, len(fds), _FDS_PER_MESSAGE):
+        socket.send_fds(sock, [b"F"], fds[start : start + _FDS_PER_MESSAGE])
+    for record in records:
+        sock.sendall(_RECORD_SIZE.pack(len(record)) + record)
+
+
+def _receive(sock: socket.socket) -> tuple[list[int], list[bytes]]:
+    fd_count, record_count = _PRELUDE.unpack(_recv_exactly(sock, _PRELUDE.size))
+    fds: list[int] = []
+    try:
+        while len(fds) < fd_count:
+            data, received, _, _ = socket.recv_fds(sock, 1, _FDS_PER_MESSAGE)
+            if not data:
+                raise ConnectionError("Handoff ended before every socket was received")
+            fds += received
+        records = []
+        for _ in range(record_count):
+            (size,) = _RECORD_SIZE.unpack(_recv_exactly(sock, _RECORD_SIZE.size))
+            records.append(_recv_exactly(sock, size))
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+    return fds, records
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Handoff ended before everything was received")
+        data += chunk
+    return bytes(data)
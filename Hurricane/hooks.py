@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import sys
+import traceback
+from typing import Any, Callable
+
+# Called with the client, and the time.perf_counter() values when the stage started and finished
+Hook = Callable[[Any, float, float], None]
+
+
+class ProfilingHooks:
+    # Places in the send and receive paths that hooks can be attached to
+    STAGES: tuple[str, ...] = (
+        "handshake",  # Server._client_setup, the whole key exchange
+        "frame_read",  # From a frame's length arriving until the whole frame has arrived
+        "decrypt",  # Decrypting and decompressing a received frame
+        "deserialise",  # Deserialising a received frame
+        "dispatch",  # Running the message received callback
+        "serialise",  # Serialising a message to send
+        "encrypt",  # Compressing and encrypting a message to send
+        "write",  # Writing a frame to the socket and waiting for it to drain
+    )
+
+    def __init__(self) -> None:
+        # Stages without hooks have an empty list, so checking them costs almost nothing
+        self.handshake: list[Hook] = []
+        self.frame_read: list[Hook] = []
+        self.decrypt: list[Hook] = []
+        self.deserialise: list[Hook] = []
+        self.dispatch: list[Hook] = []
+        self.serialise: list[Hook] = []
+        self.encrypt: list[Hook] = []
+        self.write: list[Hook] = []
+
+    def add(self, stage: str, hook: Hook) -> Hook:
+        if stage not in self.STAGES:
+            raise ValueError(f"{stage} is not a stage, choose from {self.STAGES}")
+        getattr(self, stage).append(hook)
+        return hook
+
+    def remove(self, stage: str, hook: Hook) -> None:
+        getattr(self, stage).remove(hook)
+
+    def on(self, stage: str) -> Callable[[Hook], Hook]:
+        # For use as a decorator
+        def decorator(hook: Hook) -> Hook:
+            return self.add(stage, hook)
+
+        return decorator
+
+    @staticmethod
+    def run(
+        hooks: list[Hook], client: Any, started_at: float, finished_at: float
+    ) -> None:
+        # A broken hook must not break the connection it is profiling
+        for hook in hooks:
+            try:
+                hook(client, started_at, finished_at)
+            except Exception as e:
+                traceback.print_exception(e, file=sys.stderr)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Callable, Generic, Iterator, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Priorities a message can be sent with, see Client.send
+URGENT = 0
+NORMAL = 1
+BULK = 2
+
+# Share of the connection each priority gets while every one has something waiting
+DEFAULT_WEIGHTS: tuple[int, ...] = (16, 4, 1)
+
+
+class PriorityLanes(Generic[T]):
+    # One FIFO per priority, served by deficit round robin
+    # Each lane with something waiting is given bytes in proportion to its weight, so
+    # urgent items overtake bulk ones, but bulk ones still get a share and are never starved
+    def __init__(
+        self, weights: Sequence[int] = DEFAULT_WEIGHTS, quantum: int = 16 * 1024
+    ) -> None:
+        if not weights or min(weights) < 1:
+            raise ValueError("Every lane needs a weight of at least 1")
+        self.weights: tuple[int, ...] = tuple(weights)
+        # Bytes a lane with a weight of 1 is given each round
+        self.quantum: int = quantum
+        self._lanes: list[deque[T]] = [deque() for _ in self.weights]
+        self._deficits: list[int] = [0] * len(self.weights)
+        self._deficits[0] = self.weights[0] * quantum
+        self._current: int = 0
+        self._length: int = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[tuple[int, T]]:
+        # Every item and its priority, without removing them
+        return iter(
+            [
+                (priority, item)
+                for priority, lane in enumerate(self._lanes)
+                for item in lane
+            ]
+        )
+
+    def push(self, item: T, priority: int = NORMAL) -> None:
+        if not 0 <= priority < len(self._lanes):
+            raise ValueError(f"Priority must be from 0 to {len(self._lanes) - 1}")
+        self._lanes[priority].append(item)
+        self._length += 1
+
+    def peek(self) -> tuple[int, T]:
+        # The priority of the lane to take from next, and the item at its head
+        if not self._length:
+            raise IndexError("peek from empty PriorityLanes")
+        while True:
+            lane = self._lanes[self._current]
+            if lane and self._deficits[self._current] > 0:
+                return self._current, lane[0]
+            if not lane:
+                # An idle lane does not save up its share for later
+                self._deficits[self._current] = 0
+            self._current = (self._current + 1) % len(self._lanes)
+            self._deficits[self._current] += self.weights[self._current] * self.quantum
+
+    def remove_if(self, predicate: Callable[[T], bool]) -> list[T]:
+        # Removes and returns every item predicate is true for, the rest keep their order
+        removed = []
+        for priority, lane in enumerate(self._lanes):
+            kept = deque()
+            for item in lane:
+                (removed if predicate(item) else kept).append(item)
+            self._lanes[priority] = kept
+        self._length -= len(removed)
+        return removed
+
+    def charge(self, priority: int, size: int) -> None:
+        # Counts size bytes taken from a lane, an item can be taken a part at a time
+        self._deficits[priority] -= size
+
+    def pop(self, priority: int) -> T:
+        # Removes the item at the head of a lane, once all of it has been taken
+        item = self._lanes[priority].popleft()
+        self._length -= 1
+        return item
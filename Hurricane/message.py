@@ -2,7 +2,8 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, TYPE_CHECKING
+from functools import cached_property
+from typing import Any, BinaryIO, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from Hurricane import client
@@ -11,10 +12,29 @@ if TYPE_CHECKING:
 @dataclass
 class AnonymousMessage:
     contents: Any
-    sent_at: datetime
-    received_at: datetime
+    # Nanoseconds since the epoch, from time.time_ns()
+    sent_at_ns: int
+    received_at_ns: int
+
+    # Only created when used, most messages never need them
+    @cached_property
+    def sent_at(self) -> datetime:
+        return datetime.fromtimestamp(self.sent_at_ns / 1e9)
+
+    @cached_property
+    def received_at(self) -> datetime:
+        return datetime.fromtimestamp(self.received_at_ns / 1e9)
 
 
 @dataclass
 class Message(AnonymousMessage):
     author: client.Client
+
+
+@dataclass
+class ReceivedFile:
+    # The contents of the message returned once a file sent with Client.send_file arrives
+    name: str
+    size: int
+    # Where it was written, already closed, see ServerConnection.on_file
+    file: BinaryIO
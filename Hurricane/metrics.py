@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import asyncio
+from asyncio import StreamReader, StreamWriter
+from bisect import bisect_left
+import json
+from typing import Any, Callable, Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from Hurricane.client import Client
+    from uuid import UUID
+
+# Upper bounds in seconds, suitable for anything from serialising a message to an RSA handshake
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name: str = name
+        self.description: str = description
+        self.value: int = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def snapshot(self) -> int:
+        return self.value
+
+    def prometheus_samples(self) -> Iterable[str]:
+        yield f"{self.name} {self.value}"
+
+
+class Gauge:
+    # The value is computed when it is read, so nothing needs updating on the hot path
+    # If label is given, function returns a dict of label value to gauge value
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        function: Callable[[], float | dict[str, float]],
+        label: str | None = None,
+    ) -> None:
+        self.name: str = name
+        self.description: str = description
+        self.label: str | None = label
+        self._function: Callable[[], float | dict[str, float]] = function
+
+    def snapshot(self) -> float | dict[str, float]:
+        return self._function()
+
+    def prometheus_samples(self) -> Iterable[str]:
+        value = self._function()
+        if self.label is None:
+            yield f"{self.name} {value}"
+        else:
+            for label_value, sample in value.items():
+                yield f'{self.name}{{{self.label}="{label_value}"}} {sample}'
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name: str = name
+        self.description: str = description
+        self.buckets: list[float] = sorted(buckets)
+        # One extra bucket for observations larger than every bound
+        self._bucket_counts: list[int] = [0] * (len(self.buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self._bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def _cumulative_counts(self) -> list[tuple[str, int]]:
+        bounds = [repr(bound) for bound in self.buckets] + ["+Inf"]
+        cumulative = []
+        total = 0
+        for bound, bucket_count in zip(bounds, self._bucket_counts):
+            total += bucket_count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(self._cumulative_counts()),
+        }
+
+    def prometheus_samples(self) -> Iterable[str]:
+        for bound, cumulative_count in self._cumulative_counts():
+            yield f'{self.name}_bucket{{le="{bound}"}} {cumulative_count}'
+        yield f"{self.name}_sum {self.sum}"
+        yield f"{self.name}_count {self.count}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def __getitem__(self, name: str) -> Counter | Gauge | Histogram:
+        return self._metrics[name]
+
+    def register(self, metric: Counter | Gauge | Histogram) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"A metric named {metric.name} already exists")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self.register(Counter(name, description))
+
+    def gauge(
+        self,
+        name: str,
+        description: str,
+        function: Callable[[], float | dict[str, float]],
+        label: str | None = None,
+    ) -> Gauge:
+        return self.register(Gauge(name, description, function, label))
+
+    def histogram(
+        self, name: str, description: str, buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, description, buckets))
+
+    def snapshot(self) -> dict[str, Any]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def to_prometheus(self) -> str:
+        # See https://prometheus.io/docs/instrumenting/exposition_formats/
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.prometheus_samples())
+        return "\n".join(lines) + "\n"
+
+    async def _handle_http_request(
+        self, reader: StreamReader, writer: StreamWriter
+    ) -> None:
+        try:
+            request_line = await reader.readline()
+            # The rest of the request is ignored, but must be read before replying
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b""
+            if path == b"/metrics":
+                status, content_type = "200 OK", "text/plain; version=0.0.4"
+                body = self.to_prometheus().encode("utf-8")
+            elif path == b"/snapshot":
+                status, content_type = "200 OK", "application/json"
+                body = json.dumps(self.snapshot()).encode("utf-8")
+            else:
+                status, content_type = "404 Not Found", "text/plain"
+                body = b"Not found, try /metrics or /snapshot\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode("ascii")
+            )
+            writer.write(body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9100) -> asyncio.Server:
+        # Serves /metrics in the Prometheus text format and /snapshot as JSON
+        # Binds to localhost by default, the metrics are not meant to be public
+        return await asyncio.start_server(
+            self._handle_http_request, host=host, port=port
+        )
+
+
+class ServerMetrics(MetricsRegistry):
+    # Every metric recorded by a Server and the Clients connected to it
+    def __init__(self, clients: dict[UUID, Client] | None = None) -> None:
+        super().__init__()
+        self._clients: dict[UUID, Client] = {} if clients is None else clients
+
+        self.connections: Gauge = self.gauge(
+            "hurricane_connections",
+            "Number of clients in each state",
+            self.connection_counts,
+            label="state",
+        )
+        self.handshake_seconds: Histogram = self.histogram(
+            "hurricane_handshake_seconds", "Time taken to set up a connection"
+        )
+        self.bytes_received: Counter = self.counter(
+            "hurricane_received_bytes_total", "Bytes received from clients"
+        )
+        self.bytes_sent: Counter = self.counter(
+            "hurricane_sent_bytes_total", "Bytes sent to clients"
+        )
+        self.messages_received: Counter = self.counter(
+            "hurricane_received_messages_total", "Messages received from clients"
+        )
+        self.messages_sent: Counter = self.counter(
+            "hurricane_sent_messages_total", "Messages sent to clients"
+        )
+        self.replayed_messages: Counter = self.counter(
+            "hurricane_replayed_messages_total",
+            "Unacknowledged messages resent after a client reconnected",
+        )
+        self.conflated_messages: Counter = self.counter(
+            "hurricane_conflated_messages_total",
+            "Waiting messages replaced by a later one sent with the same conflate_key",
+        )
+        self.expired_messages: Counter = self.counter(
+            "hurricane_expired_messages_total",
+            "Messages dropped as their ttl passed before they could be written",
+        )
+        self.throttled_messages: Counter = self.counter(
+            "hurricane_throttled_messages_total",
+            "Messages after which reading paused, as a client was over a rate limit",
+        )
+        self.rate_limit_disconnections: Counter = self.counter(
+            "hurricane_rate_limit_disconnections_total",
+            "Clients disconnected for staying over their rate limit",
+        )
+        self.serialise_seconds: Histogram = self.histogram(
+            "hurricane_serialise_seconds", "Time taken to serialise a message"
+        )
+        self.deserialise_seconds: Histogram = self.histogram(
+            "hurricane_deserialise_seconds", "Time taken to deserialise a message"
+        )
+        self.encrypt_seconds: Histogram = self.histogram(
+            "hurricane_encrypt_seconds", "Time taken to compress and encrypt a message"
+        )
+        self.decrypt_seconds: Histogram = self.histogram(
+            "hurricane_decrypt_seconds",
+            "Time taken to decrypt and decompress a message",
+        )
+        self.callback_seconds: Histogram = self.histogram(
+            "hurricane_callback_seconds", "Time taken by the message received callback"
+        )
+        self.incoming_queue_depth: Gauge = self.gauge(
+            "hurricane_incoming_queue_depth",
+            "Received messages waiting to be handled, across all clients",
+            lambda: sum(len(c._incoming_message_queue) for c in self._clients.values()),
+        )
+        self.outgoing_queue_depth: Gauge = self.gauge(
+            "hurricane_outgoing_queue_depth",
+            "Messages waiting to be written, or for a client to reconnect, across all clients",
+            lambda: sum(len(c._outgoing_message_queue) for c in self._clients.values()),
+        )
+
+    def connection_counts(self) -> dict[str, int]:
+        from Hurricane.client import ClientState
+
+        counts = {state.name: 0 for state in ClientState}
+        for client in self._clients.values():
+            counts[client.state.name] += 1
+        return counts
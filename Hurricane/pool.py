@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import threading
+import time
+from typing import Any, Callable, Iterator
+
+from Hurricane.client_functions import ServerConnection
+from Hurricane.message import AnonymousMessage
+
+ROUND_ROBIN = "round-robin"
+LEAST_LOADED = "least-loaded"
+
+
+class _PooledConnection:
+    __slots__ = ("connection", "leases", "last_used")
+
+    def __init__(self, connection: ServerConnection) -> None:
+        self.connection: ServerConnection = connection
+        # Number of callers currently using the connection
+        self.leases: int = 0
+        self.last_used: float = time.monotonic()
+
+
+class ConnectionPool:
+    # Keeps connections open and handshaken, so callers do not pay for a new connection,
+    # and the key exchange, every time they talk to the same server
+    # Connections are thread-safe, so one connection can be leased to several callers at once
+    # A new connection is only opened when every existing one is in use
+    # Each connection receives on a thread of its own, see ServerConnection.start_receiving,
+    # so acknowledgements are read and PINGs answered however long it is idle
+    def __init__(
+        self,
+        connect: Callable[[], ServerConnection],
+        *,
+        minimum_size: int = 1,
+        maximum_size: int = 8,
+        strategy: str = LEAST_LOADED,
+        idle_timeout: float = 60,
+        health_check_interval: float | None = 10,
+        on_message: Callable[[AnonymousMessage], Any] | None = None,
+    ) -> None:
+        if not 0 <= minimum_size <= maximum_size or maximum_size < 1:
+            raise ValueError(
+                "Pool sizes must satisfy 0 <= minimum_size <= maximum_size"
+            )
+        if strategy not in (ROUND_ROBIN, LEAST_LOADED):
+            raise ValueError(f"Unknown strategy {strategy!r}")
+
+        # Opens a new connection, such as functools.partial(ServerConnection, host, port)
+        self._connect: Callable[[], ServerConnection] = connect
+        self.minimum_size: int = minimum_size
+        self.maximum_size: int = maximum_size
+        self.strategy: str = strategy
+        # Connections above minimum_size are closed once unused for this many seconds
+        self.idle_timeout: float = idle_timeout
+        # Called with each message the server sends on any connection, on that
+        # connection's thread, if None they are put on each connection's incoming queue
+        self.on_message: Callable[[AnonymousMessage], Any] | None = on_message
+
+        # Notified when a connection is added, or one being opened fails, or the pool closes,
+        # for callers waiting because the pool is at maximum_size with nothing to lease
+        self._lock: threading.Condition = threading.Condition()
+        self._connections: list[_PooledConnection] = []
+        # Connections being opened count towards maximum_size, but cannot be leased yet
+        self._opening: int = 0
+        self._next: int = 0
+        self._closed: threading.Event = threading.Event()
+
+        self._fill()
+
+        # Checks idle connections are still alive, and closes those no longer needed
+        self._maintenance_thread: threading.Thread | None = None
+        if health_check_interval is not None:
+            self._maintenance_thread = threading.Thread(
+                target=self._maintain, args=(health_check_interval,), daemon=True
+            )
+            self._maintenance_thread.start()
+
+    def __enter__(self) -> ConnectionPool:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    @contextmanager
+    def connection(self) -> Iterator[ServerConnection]:
+        pooled = self._acquire()
+        try:
+            yield pooled.connection
+        finally:
+            with self._lock:
+                pooled.leases -= 1
+                pooled.last_used = time.monotonic()
+
+    def send(self, message: Any) -> None:
+        with self.connection() as connection:
+            connection.send(message)
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._lock.notify_all()
+        for pooled in connections:
+            pooled.connection.close()
+        if self._maintenance_thread is not None:
+            self._maintenance_thread.join()
+
+    def _acquire(self) -> _PooledConnection:
+        with self._lock:
+            while True:
+                if self._closed.is_set():
+                    raise RuntimeError("Connection pool is closed")
+
+                all_in_use = all(pooled.leases for pooled in self._connections)
+                can_grow = len(self._connections) + self._opening < self.maximum_size
+                if self._connections and not (all_in_use and can_grow):
+                    pooled = self._choose()
+                    pooled.leases += 1
+                    return pooled
+                if can_grow:
+                    break
+                # Empty, and every connection it may have is being opened by other callers
+                self._lock.wait()
+            # Opened without holding the lock, so other callers are not held up
+            self._opening += 1
+
+        return self._open(leases=1)
+
+    def _open(self, leases: int) -> _PooledConnection:
+        # Call with _opening counting the connection, until it is added in the same step,
+        # so the pool never seems to have room for another in between
+        try:
+            pooled = _PooledConnection(self._connect())
+            if not pooled.connection.receiving:
+                pooled.connection.start_receiving(self.on_message)
+        except BaseException:
+            with self._lock:
+                self._opening -= 1
+                # A caller waiting for it can open one of its own instead
+                self._lock.notify_all()
+            raise
+        pooled.leases = leases
+        with self._lock:
+            self._opening -= 1
+            self._connections.append(pooled)
+            self._lock.notify_all()
+        return pooled
+
+    def _choose(self) -> _PooledConnection:
+        if self.strategy == ROUND_ROBIN:
+            self._next += 1
+            return self._connections[self._next % len(self._connections)]
+        return min(self._connections, key=lambda pooled: pooled.leases)
+
+    def _fill(self) -> None:
+        # Opens connections until there are at least minimum_size
+        while True:
+            with self._lock:
+                if (
+                    self._closed.is_set()
+                    or len(self._connections) + self._opening >= self.minimum_size
+                ):
+                    return
+                self._opening += 1
+            self._open(leases=0)
+
+    def _maintain(self, interval: float) -> None:
+        while not self._closed.wait(interval):
+            to_close = []
+            now = time.monotonic()
+            with self._lock:
+                for pooled in list(self._connections):
+                    if pooled.leases:
+                        continue
+                    # Receiving stops once the connection gives up reconnecting
+                    if not pooled.connection.receiving:
+                        to_close.append(pooled)
+                    elif (
+                        now - pooled.last_used > self.idle_timeout
+                        and len(self._connections) - len(to_close) > self.minimum_size
+                    ):
+                        to_close.append(pooled)
+                for pooled in to_close:
+                    self._connections.remove(pooled)
+
+            for pooled in to_close:
+                try:
+                    pooled.connection.close()
+                except OSError:
+                    pass  # Already broken
+            try:
+                self._fill()
+            except OSError:
+                pass  # The server is unreachable, try again next time
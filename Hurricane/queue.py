@@ -1,6 +1,6 @@
 from asyncio.locks import Lock
 from collections import deque
-from typing import TypeVar, Generic
+from typing import Iterator, TypeVar, Generic
 
 T = TypeVar("T")
 
@@ -19,6 +19,10 @@ class Queue(Generic[T]):
     def __len__(self) -> int:
         return len(self._q)
 
+    def __iter__(self) -> Iterator[T]:
+        # Items in the order they will be popped, without popping them
+        return iter(list(self._q))
+
     def __str__(self) -> str:
         return f"Queue(length={len(self)})"
 
@@ -27,6 +31,12 @@ class Queue(Generic[T]):
         if self._has_item.locked():
             self._has_item.release()
 
+    def push_front(self, value: T) -> None:
+        # The next pop returns value, such as to put back something taken too early
+        self._q.appendleft(value)
+        if self._has_item.locked():
+            self._has_item.release()
+
     def pop(self) -> T:
         if len(self) == 0:
             raise IndexError("pop from an empty Queue")
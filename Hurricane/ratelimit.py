@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import time
+from typing import NamedTuple
+
+
+class RateLimit(NamedTuple):
+    # None means unlimited
+    messages_per_second: float | None = None
+    bytes_per_second: float | None = None
+    # How many seconds' worth of messages and bytes can arrive at once after a quiet spell
+    burst: float = 1.0
+    # A client throttled for this many seconds without a break is disconnected
+    # Only used for each client's own limit, None never disconnects
+    disconnect_after: float | None = None
+
+
+class TokenBucket:
+    # Fills at rate tokens per second, holding at most capacity
+    # Taking more than it holds puts it in debt instead of refusing, so a caller that has
+    # already read something can count it, then wait for the debt to be paid off
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self._tokens: float = capacity
+        self._updated_at: float = time.monotonic()
+
+    def take(self, amount: float, now: float | None = None) -> float:
+        # Returns how many seconds until the bucket is out of debt, 0 if it is not in debt
+        if now is None:
+            now = time.monotonic()
+        elapsed = max(now - self._updated_at, 0)
+        self._tokens = min(self._tokens + elapsed * self.rate, self.capacity)
+        self._updated_at = now
+
+        self._tokens -= amount
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+
+class RateLimiter:
+    # Enforces a RateLimit, for one client or shared by every client of a server
+    def __init__(self, limit: RateLimit) -> None:
+        self.limit: RateLimit = limit
+        self._messages: TokenBucket | None = None
+        if limit.messages_per_second is not None:
+            self._messages = TokenBucket(
+                limit.messages_per_second,
+                max(limit.messages_per_second * limit.burst, 1),
+            )
+        self._bytes: TokenBucket | None = None
+        if limit.bytes_per_second is not None:
+            # Always room for the largest frame, or it could never be read without debt
+            self._bytes = TokenBucket(
+                limit.bytes_per_second,
+                max(limit.bytes_per_second * limit.burst, 64 * 1024),
+            )
+
+    def take(self, size: int, now: float | None = None) -> float:
+        # Counts one message of size bytes
+        # Returns how many seconds to wait before reading anything else
+        if now is None:
+            now = time.monotonic()
+        wait = 0.0
+        if self._messages is not None:
+            wait = self._messages.take(1, now)
+        if self._bytes is not None:
+            wait = max(wait, self._bytes.take(size, now))
+        return wait
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Iterable, Iterator
+
+
+class ReliableStream:
+    # Tracks sequence numbers in both directions of one connection, across reconnections
+    # Sent messages are kept until the other end acknowledges them, so they can be resent
+    # after a reconnection instead of being silently lost with the old socket
+
+    # A standalone acknowledgement is sent after this many messages are received
+    # without anything being sent back to carry the acknowledgement
+    ACKNOWLEDGE_EVERY: int = 16
+
+    def __init__(self, maximum_size: int = 1024) -> None:
+        # Oldest messages are forgotten once more than maximum_size are unacknowledged
+        self.maximum_size: int = maximum_size
+        # Sequence number, data and flags of each message
+        self._unacknowledged: deque[tuple[int, bytes, int]] = deque()
+        self._next_sequence: int = 1
+        self.last_received: int = 0  # 0 means nothing has been received
+        self.last_acknowledged: int = 0  # 0 means nothing has been acknowledged
+        self._received_since_acknowledgement: int = 0
+        self.overflowed: int = 0  # Messages forgotten before being acknowledged
+
+    def __len__(self) -> int:
+        return len(self._unacknowledged)
+
+    def export_state(self) -> tuple[int, int, int, int, int]:
+        # Everything but the unacknowledged messages, see Hurricane.handoff
+        return (
+            self.maximum_size,
+            self._next_sequence,
+            self.last_received,
+            self.last_acknowledged,
+            self.overflowed,
+        )
+
+    @classmethod
+    def from_state(
+        cls,
+        state: tuple[int, int, int, int, int],
+        unacknowledged: Iterable[tuple[int, bytes, int]],
+    ) -> ReliableStream:
+        (
+            maximum_size,
+            next_sequence,
+            last_received,
+            last_acknowledged,
+            overflowed,
+        ) = state
+        stream = cls(maximum_size)
+        stream._next_sequence = next_sequence
+        stream.last_received = last_received
+        stream.last_acknowledged = last_acknowledged
+        stream.overflowed = overflowed
+        stream._unacknowledged.extend(unacknowledged)
+        return stream
+
+    @property
+    def next_sequence(self) -> int:
+        # The sequence number record returns next
+        return self._next_sequence
+
+    def record(self, data: bytes, flags: int = 0) -> int:
+        # Returns the sequence number to send data with
+        # flags are kept to resend the frame with, such as framing.PART
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        self._unacknowledged.append((sequence, data, flags))
+        if len(self._unacknowledged) > self.maximum_size:
+            self._unacknowledged.popleft()
+            self.overflowed += 1
+        return sequence
+
+    def acknowledge(self, sequence: int) -> None:
+        # Acknowledgements are cumulative, everything up to and including sequence arrived
+        if sequence > self.last_acknowledged:
+            self.last_acknowledged = sequence
+        while self._unacknowledged and self._unacknowledged[0][0] <= sequence:
+            self._unacknowledged.popleft()
+
+    def unacknowledged(self) -> Iterator[tuple[int, bytes]]:
+        return iter([(sequence, data) for sequence, data, _ in self._unacknowledged])
+
+    def unacknowledged_frames(self) -> Iterator[tuple[int, bytes, int]]:
+        # Like unacknowledged, with the flags each was recorded with
+        return iter(list(self._unacknowledged))
+
+    def receive(self, sequence: int) -> bool:
+        # Returns False if the message was already received, and should be ignored
+        if sequence <= self.last_received:
+            return False
+        self.last_received = sequence
+        self._received_since_acknowledgement += 1
+        return True
+
+    def acknowledgement(self) -> int:
+        # Call when sending anything, the returned value is carried to the other end
+        self._received_since_acknowledgement = 0
+        return self.last_received
+
+    @property
+    def needs_acknowledgement(self) -> bool:
+        return self._received_since_acknowledgement >= self.ACKNOWLEDGE_EVERY
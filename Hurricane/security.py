@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import abc
+from asyncio import StreamReader, StreamWriter
+import hmac
+import os
+import socket
+import ssl
+
+from Crypto.Cipher import PKCS1_OAEP
+from Crypto.PublicKey import RSA
+
+from Hurricane.encryption import (
+    ClientEncryption,
+    ClientIntegrity,
+    Encryption,
+    NullEncryption,
+    ServerEncryption,
+    ServerIntegrity,
+)
+
+
+class TransportSecurity(abc.ABC):
+    # Decides how a connection is secured, the same kind must be used by the server and client
+    # Passed to asyncio when the server starts listening, None if TLS is not used
+    ssl_context: ssl.SSLContext | None = None
+
+    def prepare(self) -> None:
+        # Run by the server before it accepts connections, for any slow setup
+        pass
+
+    @abc.abstractmethod
+    async def accept(self, reader: StreamReader, writer: StreamWriter) -> Encryption:
+        # Run by the server for each new connection
+        # Returns what the connection's frames are encrypted with
+        ...
+
+    @abc.abstractmethod
+    def connect(
+        self, sock: socket.socket, server_hostname: str | None
+    ) -> tuple[socket.socket, Encryption]:
+        # Run by the client after connecting, and again after every reconnection
+        # Returns the socket to use from now on, which may be a wrapped version of sock
+        ...
+
+
+class AESSecurity(TransportSecurity):
+    # The client picks an AES key and sends it encrypted with the server's RSA key
+    # Frames are then encrypted with AES-CTR and authenticated with HMAC-SHA256
+    # Most decisions informed by
+    # https://www.daemonology.net/blog/2009-06-11-cryptographic-right-answers.html
+    def __init__(self, rsa_key_path: str | None = None):
+        self._rsa_key_path: str | None = rsa_key_path
+        self._rsa_key: RSA.RsaKey | None = None
+        self._rsa_cipher: PKCS1_OAEP.PKCS1OAEP_Cipher | None = None
+
+    def prepare(self) -> None:
+        # Only the server needs a key, and generating one takes a while
+        if self._rsa_key is not None:
+            return
+        if self._rsa_key_path:
+            self._rsa_key = RSA.import_key(self._rsa_key_path)
+        else:
+            # Secure default settings
+            # Speed is unimportant - only used for AES key exchange
+            self._rsa_key = RSA.generate(bits=2048, e=65537)
+        self._rsa_cipher = PKCS1_OAEP.new(self._rsa_key)
+
+    async def accept(self, reader: StreamReader, writer: StreamWriter) -> Encryption:
+        self.prepare()
+        writer.write(self._rsa_key.n.to_bytes(256, "big", signed=False))
+        writer.write(self._rsa_key.e.to_bytes(256, "big", signed=False))
+
+        aes_secret_encrypted = await reader.readexactly(256)
+        aes_secret = self._rsa_cipher.decrypt(aes_secret_encrypted)
+        return ServerEncryption(secret=aes_secret)
+
+    def connect(
+        self, sock: socket.socket, server_hostname: str | None
+    ) -> tuple[socket.socket, Encryption]:
+        n = int.from_bytes(_recv_exactly(sock, 256), "big", signed=False)
+        e = int.from_bytes(_recv_exactly(sock, 256), "big", signed=False)
+        rsa_cipher = PKCS1_OAEP.new(RSA.construct((n, e)))
+
+        encrypter = ClientEncryption()
+        sock.sendall(rsa_cipher.encrypt(encrypter.aes_secret))
+        return sock, encrypter
+
+
+class IntegritySecurity(TransportSecurity):
+    # For trusted links, frames are authenticated with a secret shared in advance
+    # but are not encrypted, and there is no RSA exchange
+    # Both ends send random salt, so each connection uses a different HMAC key
+    SALT_SIZE = 16
+
+    def __init__(self, secret: bytes):
+        self._secret: bytes = secret
+
+    def _connection_secret(self, server_salt: bytes, client_salt: bytes) -> bytes:
+        return hmac.digest(self._secret, server_salt + client_salt, "sha256")
+
+    async def accept(self, reader: StreamReader, writer: StreamWriter) -> Encryption:
+        server_salt = os.urandom(self.SALT_SIZE)
+        writer.write(server_salt)
+        client_salt = await reader.readexactly(self.SALT_SIZE)
+        return ServerIntegrity(self._connection_secret(server_salt, client_salt))
+
+    def connect(
+        self, sock: socket.socket, server_hostname: str | None
+    ) -> tuple[socket.socket, Encryption]:
+        server_salt = _recv_exactly(sock, self.SALT_SIZE)
+        client_salt = os.urandom(self.SALT_SIZE)
+        sock.sendall(client_salt)
+        return sock, ClientIntegrity(self._connection_secret(server_salt, client_salt))
+
+
+class NullSecurity(TransportSecurity):
+    # No handshake, authentication or encryption at all
+    # Only for links where every process able to connect is trusted, such as a
+    # Unix domain socket with restrictive permissions
+    async def accept(self, reader: StreamReader, writer: StreamWriter) -> Encryption:
+        return NullEncryption()
+
+    def connect(
+        self, sock: socket.socket, server_hostname: str | None
+    ) -> tuple[socket.socket, Encryption]:
+        return sock, NullEncryption()
+
+
+class TLSSecurity(TransportSecurity):
+    # The whole connection is wrapped with the ssl module, so frames are not encrypted again
+    # The server needs a context with its certificate loaded, see ssl.create_default_context
+    def __init__(self, context: ssl.SSLContext, server_hostname: str | None = None):
+        self.ssl_context = context
+        # Checked against the server's certificate, defaults to the address connected to
+        self.server_hostname: str | None = server_hostname
+
+    async def accept(self, reader: StreamReader, writer: StreamWriter) -> Encryption:
+        # asyncio has already completed the TLS handshake
+        return NullEncryption()
+
+    def connect(
+        self, sock: socket.socket, server_hostname: str | None
+    ) -> tuple[socket.socket, Encryption]:
+        if self.server_hostname is not None:
+            server_hostname = self.server_hostname
+        return (
+            self.ssl_context.wrap_socket(sock, server_hostname=server_hostname),
+            NullEncryption(),
+        )
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    # socket.recv can return less than was asked for, even on a blocking socket
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Socket closed before all data was received")
+        data += chunk
+    return bytes(data)
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import importlib
+import itertools
 from io import BytesIO
 import struct
 from types import NoneType
-from typing import Any, Dict, Callable
+from typing import Any, Callable, Dict, Generator, Iterator
 
 
 class ObjectTooLargeException(Exception):
@@ -20,31 +21,145 @@ class MalformedDataError(Exception):
         self.caused_by: Exception = causing_exception
 
 
+class _TypedArray:
+    # Never instantiated, only used as the type for the typed array discriminant
+    # A homogeneous container of ints, floats or strs is packed in one call instead of item by item
+    pass
+
+
+class _BackReference:
+    # Never instantiated, only used as the type for the back reference discriminant
+    # Followed by the index in the memo of something that has already been written
+    pass
+
+
+class _Finished(int):
+    # Marks the end of a tuple or frozenset's items, so it can refer to itself no longer
+    pass
+
+
+# Set in the memo while a tuple or frozenset is read, as it does not exist until its end
+_UNFINISHED = object()
+
+
+class _Raw(bytes):
+    # Written to the stream as it is, used for markers within a custom object
+    pass
+
+
+_SLOT_SET = _Raw(b"\xFE")
+_SLOT_UNSET = _Raw(b"\xFF")
+
+
 class Serialiser:
     MAXIMUM_SIZE: int = 64 * 1024 - 1  # 64 KiB
+    # Containers shorter than this are always written item by item
+    # The typed array header costs more than it saves on very small containers
+    ARRAY_THRESHOLD: int = 8
 
     def __init__(self, stream: BytesIO):
         self.stream: BytesIO = stream
 
     def serialise(self, obj: Any) -> None:
-        serialiser = self._type_to_serialiser.get(type(obj), None)
-        if serialiser is not None:
-            self.stream.write(_type_to_discriminant[type(obj)].to_bytes(1, "big"))
-            serialiser(self, obj)
-        elif type(obj) in _user_defined_serialisable_types:
-            self._serialise_object(obj)
+        # Containers are written using an explicit stack of iterators over their items,
+        # rather than recursion, so any depth of nesting can be serialised
+        # Strings, containers and custom objects are numbered in the order they are
+        # written, and any that appear again are written as a back reference to that
+        # number. Repeated dict keys are only written once, and shared references and
+        # cycles are kept
+        stream = self.stream
+        leaf_serialisers = self._type_to_serialiser
+        memoised_strings: dict[str, int] = {}
+        memoised_objects: dict[int, int] = {}  # Keyed by id
+        memo_size = 0
+        # Objects are memoised by id, so they must be kept alive until the end
+        keep_alive = []
+        # Tuples and frozensets are only created once all their items have been read,
+        # so cannot be referred to from inside themselves
+        unfinished = set()
+        stack = [iter((obj,))]
+        while stack:
+            for item in stack[-1]:
+                item_type = type(item)
+                if item_type is str and item:
+                    index = memoised_strings.get(item, None)
+                    if index is not None:
+                        stream.write(_BACK_REFERENCE_BYTE)
+                        stream.write(_U16.pack(index))
+                        continue
+                    if memo_size < _MEMO_LIMIT:
+                        memoised_strings[item] = memo_size
+                        memo_size += 1
+
+                if item_type in leaf_serialisers:
+                    stream.write(_type_to_discriminant_byte[item_type])
+                    leaf_serialisers[item_type](self, item)
+                elif item_type is _Raw:
+                    stream.write(item)
+                elif item_type is _Finished:
+                    unfinished.discard(item)
+                else:
+                    index = memoised_objects.get(id(item), None)
+                    if index is not None:
+                        if index in unfinished:
+                            raise CannotBeSerialised(
+                                f"{item_type} cannot contain a reference to itself"
+                            )
+                        stream.write(_BACK_REFERENCE_BYTE)
+                        stream.write(_U16.pack(index))
+                        continue
+                    if memo_size < _MEMO_LIMIT:
+                        index = memo_size
+                        memoised_objects[id(item)] = index
+                        keep_alive.append(item)
+                        memo_size += 1
+
+                    items = self._serialise_container(item)
+                    if items is not None:
+                        if index is not None and item_type in (tuple, frozenset):
+                            unfinished.add(index)
+                            items = itertools.chain(items, (_Finished(index),))
+                        stack.append(items)
+                        break  # Carries on with this container once the new one is done
+
+                if stream.tell() > MAXIMUM_SIZE:
+                    raise ObjectTooLargeException("Maximum size reached")
+            else:
+                stack.pop()
+
+        if stream.tell() > MAXIMUM_SIZE:
+            raise ObjectTooLargeException("Maximum size reached")
+
+    def get_data(self) -> bytes:
+        return self.stream.getvalue()
+
+    def _serialise_container(self, obj: Any) -> Iterator[Any] | None:
+        # Writes the start of obj, and returns the items still to be written after it
+        obj_type = type(obj)
+        if obj_type in _array_container_types and self._try_serialise_array(obj):
+            return None  # Homogeneous container written as a typed array
+
+        if obj_type in _array_container_types:
+            if len(obj) > self.MAXIMUM_SIZE:
+                raise ObjectTooLargeException
+            self.stream.write(_type_to_discriminant_byte[obj_type])
+            self.stream.write(_U16.pack(len(obj)))
+            return iter(obj)
+        elif obj_type is dict:
+            if len(obj) > self.MAXIMUM_SIZE // 2:
+                raise ObjectTooLargeException
+            self.stream.write(_type_to_discriminant_byte[dict])
+            self.stream.write(_U16.pack(len(obj)))
+            return itertools.chain.from_iterable(obj.items())
+        elif obj_type in _user_defined_serialisable_types:
+            return self._serialise_object(obj)
         else:
             raise CannotBeSerialised(
                 f"{type(obj)} cannot be serialised. Add an @serialisation.make_serialisable "
                 f"decorator to the class definition"
             )
-        if len(self.stream.getvalue()) > MAXIMUM_SIZE:
-            raise ObjectTooLargeException("Maximum size reached")
-
-    def get_data(self) -> bytes:
-        return self.stream.getvalue()
 
-    def _serialise_object(self, obj: Any) -> None:
+    def _serialise_object(self, obj: Any) -> Iterator[Any]:
         has_slots = hasattr(obj, "__slots__")
         has_dict = hasattr(obj, "__dict__")
 
@@ -55,7 +170,7 @@ class Serialiser:
 
         self.stream.write(b"\x00")  # Custom class
         self.stream.write(  # Used in deserialising to interpret the data as slots, dict, or both
-            (2 * has_slots + has_dict).to_bytes(1, "big")
+            _U8.pack(2 * has_slots + has_dict)
         )
         self._serialise_str(obj.__module__)
         if hasattr(type(obj), "__qualname__"):
@@ -65,20 +180,66 @@ class Serialiser:
         else:
             raise CannotBeSerialised
 
+        items = []
         if has_slots:
             for slot_name in obj.__slots__:
                 if hasattr(
                     obj, slot_name
                 ):  # An entry in __slots__ does not guarantee the attribute is initialised
-                    self.stream.write(b"\xFE")
-                    self.serialise(
-                        getattr(obj, slot_name),
-                    )
+                    items.append(_SLOT_SET)
+                    items.append(getattr(obj, slot_name))
                 else:
-                    self.stream.write(b"\xFF")
+                    items.append(_SLOT_UNSET)
 
         if has_dict:
-            self._serialise_dict(obj.__dict__)
+            # Written without a discriminant, it is always a dict
+            if len(obj.__dict__) > self.MAXIMUM_SIZE // 2:
+                raise ObjectTooLargeException
+            items.append(_Raw(_U16.pack(len(obj.__dict__))))
+            items.extend(itertools.chain.from_iterable(obj.__dict__.items()))
+
+        return iter(items)
+
+    def _try_serialise_array(self, obj: list | tuple | set | frozenset) -> bool:
+        # Returns False if nothing was written, so obj must be serialised item by item
+        if len(obj) < self.ARRAY_THRESHOLD:
+            return False
+        if len(obj) > self.MAXIMUM_SIZE:
+            raise ObjectTooLargeException
+
+        item_types = set(map(type, obj))
+        if len(item_types) != 1:
+            return False
+        item_type = item_types.pop()
+
+        if item_type is int:
+            smallest, largest = min(obj), max(obj)
+            for typecode in "bhiq":
+                limit = 2 ** (8 * _array_typecode_sizes[typecode] - 1)
+                if -limit <= smallest and largest < limit:
+                    break
+            else:
+                return False  # Does not fit in a signed 64-bit int
+            data = struct.pack(f"!{len(obj)}{typecode}", *obj)
+        elif item_type is float:
+            typecode = "d"
+            data = struct.pack(f"<{len(obj)}d", *obj)
+        elif item_type is str:
+            typecode = "s"
+            encoded = list(map(str.encode, obj))  # Defaults to utf-8
+            lengths = list(map(len, encoded))
+            if max(lengths) > self.MAXIMUM_SIZE:
+                raise ObjectTooLargeException("String too large to be serialised.")
+            data = struct.pack(f"!{len(obj)}H", *lengths) + b"".join(encoded)
+        else:
+            return False
+
+        self.stream.write(_type_to_discriminant_byte[_TypedArray])
+        self.stream.write(_type_to_discriminant_byte[type(obj)])
+        self.stream.write(typecode.encode("ascii"))
+        self.stream.write(_U16.pack(len(obj)))
+        self.stream.write(data)
+        return True
 
     def _serialise_int(self, obj: int) -> None:
         raw_bytes = obj.to_bytes(
@@ -94,7 +255,7 @@ class Serialiser:
         if len(raw_bytes) == 0:
             raw_bytes = b"\x00"
 
-        self.stream.write(len(raw_bytes).to_bytes(2, "big"))
+        self.stream.write(_U16.pack(len(raw_bytes)))
         self.stream.write(raw_bytes)
 
     def _serialise_str(self, obj: str) -> None:
@@ -103,7 +264,7 @@ class Serialiser:
         if len(encoded) > self.MAXIMUM_SIZE:
             raise ObjectTooLargeException("String too large to be serialised.")
 
-        self.stream.write(len(encoded).to_bytes(2, "big"))
+        self.stream.write(_U16.pack(len(encoded)))
         self.stream.write(encoded)
 
     def _serialise_bool(self, obj: bool) -> None:
@@ -112,70 +273,23 @@ class Serialiser:
         else:
             self.stream.write(b"\x00")
 
-    def _serialise_tuple(self, obj: tuple) -> None:
-        if len(obj) > self.MAXIMUM_SIZE:
-            raise ObjectTooLargeException
-
-        self.stream.write(len(obj).to_bytes(2, "big"))
-
-        for item in obj:
-            self.serialise(item)
-
-    def _serialise_list(self, obj: list) -> None:
-        if len(obj) > self.MAXIMUM_SIZE:
-            raise ObjectTooLargeException
-
-        self.stream.write(len(obj).to_bytes(2, "big"))
-
-        for item in obj:
-            self.serialise(item)
-
-    def _serialise_dict(self, obj: dict) -> None:
-        if len(obj) > self.MAXIMUM_SIZE // 2:
-            raise ObjectTooLargeException
-
-        self.stream.write(len(obj).to_bytes(2, "big"))
-
-        for key, value in obj.items():
-            self.serialise(key)
-            self.serialise(value)
-
-    def _serialise_set(self, obj: set) -> None:
-        if len(obj) > self.MAXIMUM_SIZE:
-            raise ObjectTooLargeException
-
-        self.stream.write(len(obj).to_bytes(2, "big"))
-
-        for item in obj:
-            self.serialise(item)
-
     def _serialise_float(self, obj: float) -> None:
-        self.stream.write(struct.pack("d", obj))
+        self.stream.write(_FLOAT.pack(obj))
 
     def _serialise_complex(self, obj: complex) -> None:
-        self._serialise_float(obj.real)
-        self._serialise_float(obj.imag)
+        self.stream.write(_COMPLEX.pack(obj.real, obj.imag))
 
     def _serialise_bytes(self, obj: bytes) -> None:
         if len(obj) > self.MAXIMUM_SIZE:
             raise ObjectTooLargeException
 
-        self.stream.write(len(obj).to_bytes(2, "big"))
+        self.stream.write(_U16.pack(len(obj)))
 
         self.stream.write(obj)
 
     def _serialise_bytearray(self, obj: bytearray) -> None:
         self._serialise_bytes(obj)
 
-    def _serialise_frozenset(self, obj: frozenset) -> None:
-        if len(obj) > self.MAXIMUM_SIZE:
-            raise ObjectTooLargeException
-
-        self.stream.write(len(obj).to_bytes(2, "big"))
-
-        for item in obj:
-            self.serialise(item)
-
     def _serialise_none(self, obj: None) -> None:
         # None is a singleton, no data is stored about it
         return
@@ -184,45 +298,182 @@ class Serialiser:
         int: _serialise_int,
         str: _serialise_str,
         bool: _serialise_bool,
-        tuple: _serialise_tuple,
-        list: _serialise_list,
-        dict: _serialise_dict,
-        set: _serialise_set,
         float: _serialise_float,
         complex: _serialise_complex,
         bytes: _serialise_bytes,
         bytearray: _serialise_bytearray,
-        frozenset: _serialise_frozenset,
         type(None): _serialise_none,
     }
 
 
 class Deserialiser:
-    def __init__(self, stream: BytesIO):
-        self.stream: BytesIO = stream
+    # Reads directly from one memoryview, keeping track of the position in offset
+    # Nothing is copied until an object is created from the data
+    def __init__(self, data: bytes | bytearray | memoryview, offset: int = 0):
+        self.data: memoryview = memoryview(data)
+        self.offset: int = offset
 
     def deserialise(self) -> Any:
-        discriminant = int.from_bytes(self.stream.read(1), "big")
-        object_type = _discriminant_to_type.get(discriminant, None)
-        if object_type is not None:
-            deserialiser = self._type_to_deserialiser[object_type]
+        try:
+            return self._deserialise()
+        except Exception as e:
+            raise MalformedDataError(e)
+
+    def _deserialise(self) -> Any:
+        parser = self._parse(resumable=False)
+        try:
+            next(parser)
+        except StopIteration as e:
+            return e.value
+        raise ValueError("Data ended part way through an object")
+
+    def _parse(self, resumable: bool) -> Generator[int, None, Any]:
+        # Returns the object. If the data ends part way through it, first yields how many
+        # bytes from the offset are needed to carry on. self.data must be replaced with
+        # the longer data before resuming, and the offset can be moved along with it
+        # Only if resumable are strings and bytes cut short by the end of the data waited
+        # for, otherwise they are read as they are
+        # Containers are built using an explicit stack rather than recursion, so any depth
+        # of nesting can be deserialised
+        # The innermost unfinished container is kept in local variables, and the ones
+        # around it on the stack. A built-in container is a function to finish it, the
+        # object it is being read into, the items read so far, the number of items it has
+        # and its index in the memo. A custom object is a generator, which is sent each
+        # value as it is read
+        data = self.data
+        leaf_deserialisers = _discriminant_to_leaf_deserialiser
+        container_readers = _discriminant_to_container_reader
+        # Everything that can be referred back to, in the same order as Serialiser numbers it
+        memo = self._memo = []
+        finish, target, items, length, index = None, None, None, 0, None
+        stack = []
+        while True:
+            # A leaf or container header is only used once all of it has arrived
+            # Otherwise the offset is moved back to its start, to read it again later
+            token_start = self.offset
             try:
-                return deserialiser(self)
-            except Exception as e:
-                raise MalformedDataError(e)
-        else:
-            # Serialisability check inside _deserialise_object
-            try:
-                return self._deserialise_object()
-            except Exception as e:
-                raise MalformedDataError(e)
-
-    def _deserialise_object(self) -> Any:
-        contents = int.from_bytes(self.stream.read(1), "big")
+                discriminant = data[token_start]
+                self.offset += 1
+                leaf_deserialiser = leaf_deserialisers.get(discriminant, None)
+                if leaf_deserialiser is not None:
+                    value = leaf_deserialiser(self)
+                    if resumable and self.offset > len(data):
+                        raise IndexError("Cut short by the end of the data")
+                elif discriminant in container_readers:
+                    (new_length,) = _U16.unpack_from(data, self.offset)
+                    self.offset += 2
+            except (IndexError, struct.error):
+                needed = max(self.offset, len(data) + 1) - token_start
+                self.offset = token_start
+                data = None  # Lets the data be replaced while waiting
+                yield needed
+                data = self.data
+                continue
+
+            if leaf_deserialiser is not None:
+                pass  # Already read
+            elif discriminant in container_readers:
+                if discriminant == _DICT_DISCRIMINANT:
+                    new_length *= 2  # Keys and values are read alternately
+
+                start, new_finish = container_readers[discriminant]
+                new_items = []
+                # Mutable containers are memoised before their items are read, so the
+                # items can refer back to them
+                new_target = start(new_items)
+                new_index = None
+                if len(memo) < _MEMO_LIMIT:
+                    new_index = len(memo)
+                    memo.append(new_target)
+
+                if new_length:
+                    stack.append((finish, target, items, length, index))
+                    finish, target, items = new_finish, new_target, new_items
+                    length, index = new_length, new_index
+                    continue
+                value = new_finish(new_target, new_items)
+                if new_index is not None:
+                    memo[new_index] = value
+            elif discriminant == 0:  # Custom class
+                new_index = None
+                if len(memo) < _MEMO_LIMIT:
+                    new_index = len(memo)
+                    memo.append(_UNFINISHED)
+                # Serialisability check inside _deserialise_object
+                stack.append((finish, target, items, length, index))
+                finish, target, items, length, index = (
+                    self._deserialise_object(new_index),
+                    None,
+                    None,
+                    0,
+                    None,
+                )
+                value = None  # Starts the generator
+            else:
+                raise ValueError(f"Invalid discriminant {discriminant}")
+
+            # Pass the value to the container it is in, and so on outwards for any
+            # containers it completes
+            while True:
+                if items is not None:
+                    items.append(value)
+                    if len(items) < length:
+                        break
+                    value = finish(target, items)
+                    if index is not None:
+                        memo[index] = value
+                elif finish is None:
+                    return value  # Not in a container, so this is the whole object
+                else:
+                    try:
+                        needed = finish.send(value)
+                        # A custom object reads its header and markers itself
+                        while needed is not None:
+                            data = None
+                            yield needed
+                            data = self.data
+                            needed = finish.send(None)
+                        break
+                    except StopIteration as e:
+                        value = e.value
+                finish, target, items, length, index = stack.pop()
+
+    def _wait_for(self, size: int) -> Generator[int, None, None]:
+        # Used by _deserialise_object, yields until size bytes from the offset have arrived
+        while len(self.data) - self.offset < size:
+            yield size
+
+    def _wait_for_str(self) -> Generator[int, None, None]:
+        yield from self._wait_for(2)
+        yield from self._wait_for(2 + _U16.unpack_from(self.data, self.offset)[0])
+
+    def _read(self, size: int) -> memoryview:
+        # Like BytesIO.read, returns less than size if the data ends first
+        start = self.offset
+        self.offset += size
+        return self.data[start : self.offset]
+
+    def _read_u8(self) -> int:
+        (value,) = _U8.unpack_from(self.data, self.offset)
+        self.offset += 1
+        return value
+
+    def _read_u16(self) -> int:
+        (value,) = _U16.unpack_from(self.data, self.offset)
+        self.offset += 2
+        return value
+
+    def _deserialise_object(self, index: int | None) -> Generator[int | None, Any, Any]:
+        # Yields None whenever it needs the next value, which must be sent back to it
+        # Yields the number of bytes needed if its own fields have not arrived yet
+        yield from self._wait_for(1)
+        contents = self._read_u8()
         has_slots = bool(contents & 2)
         has_dict = bool(contents & 1)
 
+        yield from self._wait_for_str()
         module_name = self._deserialise_str()
+        yield from self._wait_for_str()
         class_name = self._deserialise_str()
         module = importlib.import_module(module_name)
         object_class = getattr(module, class_name)
@@ -234,108 +485,184 @@ class Deserialiser:
             )
 
         new_object = object_class.__new__(object_class)
+        if index is not None:
+            self._memo[index] = new_object
 
         if has_slots:
             for slot_name in new_object.__slots__:
-                if self.stream.read(1) == b"\xFE":
-                    setattr(new_object, slot_name, self.deserialise())
+                yield from self._wait_for(1)
+                if self._read_u8() == 0xFE:
+                    setattr(new_object, slot_name, (yield))
 
         if has_dict:
-            new_object.__dict__ = self._deserialise_dict()
+            new_dict = {}
+            yield from self._wait_for(2)
+            for _ in range(self._read_u16()):
+                key = yield
+                new_dict[key] = yield
+            new_object.__dict__ = new_dict
 
         return new_object
 
+    def _deserialise_array(self) -> list | tuple | set | frozenset:
+        container_type = _discriminant_to_type[self._read_u8()]
+        typecode = chr(self._read_u8())
+        length = self._read_u16()
+
+        if container_type not in _array_container_types:
+            raise TypeError(f"{container_type} is not a valid array container")
+
+        if typecode == "s":
+            lengths = struct.unpack_from(f"!{length}H", self._read(2 * length))
+            data = self._read(sum(lengths))
+            ends = list(itertools.accumulate(lengths))
+            starts = [0] + ends[:-1]
+            items = [str(data[start:end], "utf-8") for start, end in zip(starts, ends)]
+        elif typecode in _array_typecode_sizes:
+            item_size = _array_typecode_sizes[typecode]
+            byte_order = _array_typecode_byte_orders[typecode]
+            items = struct.unpack_from(
+                f"{byte_order}{length}{typecode}", self._read(item_size * length)
+            )
+        else:
+            raise TypeError(f"{typecode!r} is not a valid array typecode")
+
+        array = container_type(items)
+        # Not memoised if it was cut short, as it will be read again once it has all arrived
+        if len(self._memo) < _MEMO_LIMIT and self.offset <= len(self.data):
+            self._memo.append(array)
+        return array
+
+    # The most common types read their fields directly, as each method call adds up
     def _deserialise_int(self) -> int:
-        length = int.from_bytes(
-            self.stream.read(2),
-            "big",
-        )
-        return int.from_bytes(self.stream.read(length), "big", signed=True)
+        (length,) = _U16.unpack_from(self.data, self.offset)
+        start = self.offset + 2
+        self.offset = start + length
+        return int.from_bytes(self.data[start : self.offset], "big", signed=True)
 
     def _deserialise_str(self) -> str:
-        length = int.from_bytes(self.stream.read(2), "big")
-        return self.stream.read(length).decode("utf-8")
+        (length,) = _U16.unpack_from(self.data, self.offset)
+        start = self.offset + 2
+        self.offset = start + length
+        return str(self.data[start : self.offset], "utf-8")
+
+    def _deserialise_memoised_str(self) -> str:
+        # Strings written with a discriminant are memoised, unless they are empty
+        value = self._deserialise_str()
+        if value and len(self._memo) < _MEMO_LIMIT and self.offset <= len(self.data):
+            self._memo.append(value)
+        return value
+
+    def _deserialise_back_reference(self) -> Any:
+        (index,) = _U16.unpack_from(self.data, self.offset)
+        self.offset += 2
+        if index >= len(self._memo):
+            raise ValueError(f"Reference to {index}, which has not been read")
+        value = self._memo[index]
+        if value is _UNFINISHED:
+            raise ValueError("Reference to a tuple or frozenset from inside itself")
+        return value
 
     def _deserialise_bool(self) -> bool:
-        if self.stream.read(1)[0]:
+        value = self.data[self.offset]
+        self.offset += 1
+        if value:
             return True
         else:
             return False
 
-    def _deserialise_tuple(self) -> tuple:
-        length = int.from_bytes(self.stream.read(2), "big")
-
-        return tuple(self.deserialise() for _ in range(length))
-
-    def _deserialise_list(self) -> list:
-        length = int.from_bytes(self.stream.read(2), "big")
-
-        new_list = []
-        for i in range(length):
-            new_list.append(self.deserialise())
-
-        return new_list
-
-    def _deserialise_dict(self) -> dict:
-        length = int.from_bytes(self.stream.read(2), "big")
-
-        new_dict = {}
-        for _ in range(length):
-            key = self.deserialise()
-            value = self.deserialise()
-            new_dict[key] = value
-
-        return new_dict
-
-    def _deserialise_set(self) -> set:
-        length = int.from_bytes(self.stream.read(2), "big")
-
-        new_set = set()
-        for _ in range(length):
-            new_set.add(self.deserialise())
-
-        return new_set
-
     def _deserialise_float(self) -> float:
-        return struct.unpack("d", self.stream.read(8))[0]
+        (value,) = _FLOAT.unpack_from(self.data, self.offset)
+        self.offset += _FLOAT.size
+        return value
 
     def _deserialise_complex(self) -> complex:
-        real = self._deserialise_float()
-        imag = self._deserialise_float()
+        real, imag = _COMPLEX.unpack_from(self.data, self.offset)
+        self.offset += _COMPLEX.size
         return complex(real, imag)
 
     def _deserialise_bytes(self) -> bytes:
-        length = int.from_bytes(self.stream.read(2), "big")
-        return self.stream.read(length)
+        length = self._read_u16()
+        return bytes(self._read(length))
 
     def _deserialise_bytearray(self) -> bytearray:
-        return bytearray(self._deserialise_bytes())
-
-    def _deserialise_frozenset(self) -> frozenset:
-        length = int.from_bytes(self.stream.read(2), "big")
-
-        return frozenset(self.deserialise() for _ in range(length))
+        length = self._read_u16()
+        return bytearray(self._read(length))
 
     def _deserialise_none(self) -> None:
         return None
 
     _type_to_deserialiser: Dict[type, Callable[[Deserialiser], Any]] = {
         int: _deserialise_int,
-        str: _deserialise_str,
+        str: _deserialise_memoised_str,
         bool: _deserialise_bool,
-        tuple: _deserialise_tuple,
-        list: _deserialise_list,
-        dict: _deserialise_dict,
-        set: _deserialise_set,
         float: _deserialise_float,
         complex: _deserialise_complex,
         bytes: _deserialise_bytes,
         bytearray: _deserialise_bytearray,
-        frozenset: _deserialise_frozenset,
         type(None): _deserialise_none,
+        _TypedArray: _deserialise_array,
+        _BackReference: _deserialise_back_reference,
     }
 
 
+class Decoder:
+    # Push-based deserialisation of objects written one after another, such as by dump
+    # Bytes are fed in however they arrive, for example from a Protocol's data_received,
+    # and each object is returned as soon as its last byte has been fed in
+    # A partly read object is kept between feeds, so nothing already read is read again
+    def __init__(self) -> None:
+        self._buffer: bytearray = bytearray()
+        self._deserialiser: Deserialiser | None = None
+        # The object being read, None between objects
+        self._parser: Generator[int, None, Any] | None = None
+        # Bytes needed from the deserialiser's offset before reading can carry on
+        self._needed: int = 1
+
+    def __len__(self) -> int:
+        # Bytes fed in, but not yet returned as part of an object
+        return len(self._buffer)
+
+    def feed(self, data: bytes | bytearray | memoryview) -> list[Any]:
+        buffer = self._buffer
+        buffer += data
+        objects = []
+        offset = 0  # Where the next object starts, if there is not one part way through
+        try:
+            while True:
+                if self._parser is not None:
+                    offset = self._deserialiser.offset
+                if len(buffer) - offset < self._needed:
+                    break
+
+                if self._parser is None:
+                    self._deserialiser = Deserialiser(buffer, offset)
+                    self._parser = self._deserialiser._parse(resumable=True)
+                else:
+                    self._deserialiser.data = memoryview(buffer)
+
+                try:
+                    self._needed = self._parser.send(None)
+                except StopIteration as e:
+                    objects.append(e.value)
+                    offset = self._deserialiser.offset
+                    self._deserialiser, self._parser, self._needed = None, None, 1
+                # The buffer cannot be resized while it is viewed
+                if self._deserialiser is not None:
+                    self._deserialiser.data = None
+        except Exception as e:
+            # Nothing after this can be trusted
+            self._deserialiser, self._parser, self._needed = None, None, 1
+            self._buffer = bytearray()
+            raise MalformedDataError(e)
+
+        # Only what has not been read yet is kept
+        del buffer[:offset]
+        if self._deserialiser is not None:
+            self._deserialiser.offset -= offset
+        return objects
+
+
 _user_defined_serialisable_types: set[type] = set()
 
 
@@ -359,14 +686,18 @@ def dump(obj: Any, stream: BytesIO) -> bytes:
     return serialiser.get_data()
 
 
-def loads(data: bytes) -> Any:
-    stream = BytesIO(data)
-    return load(stream)
+def loads(data: bytes | bytearray | memoryview) -> Any:
+    deserialiser = Deserialiser(data)
+    return deserialiser.deserialise()
 
 
 def load(stream: BytesIO) -> Any:
-    deserialiser = Deserialiser(stream)
-    return deserialiser.deserialise()
+    # Leaves the stream just after the object, like reading it directly would
+    start = stream.tell()
+    deserialiser = Deserialiser(stream.read())
+    obj = deserialiser.deserialise()
+    stream.seek(start + deserialiser.offset)
+    return obj
 
 
 _discriminant_to_type = {
@@ -384,6 +715,8 @@ _discriminant_to_type = {
     11: bytearray,
     12: frozenset,
     13: NoneType,
+    14: _TypedArray,
+    15: _BackReference,
     254: ...,  # Reserved for use internally
     255: ...,  # Reserved for use internally
 }
@@ -392,5 +725,64 @@ _discriminant_to_type = {
 _type_to_discriminant = dict(
     zip(_discriminant_to_type.values(), _discriminant_to_type.keys())
 )
+# Discriminants as they are written, so they are not converted every time
+_type_to_discriminant_byte = {
+    object_type: bytes([discriminant])
+    for object_type, discriminant in _type_to_discriminant.items()
+}
+
+# Compiled once, rather than parsing a format string for every field
+_U8 = struct.Struct("!B")
+_U16 = struct.Struct("!H")  # Lengths
+# Floats have always been written little-endian, as that is the native order almost everywhere
+_FLOAT = struct.Struct("<d")
+_COMPLEX = struct.Struct("<dd")
+
+_array_container_types = {list, tuple, set, frozenset}
+
+
+# For each built-in container, how to create the object it is read into before its items
+# are read, and how to finish it once they have all been read
+def _finish_dict(target: dict, items: list) -> dict:
+    # Keys and values alternate
+    items = iter(items)
+    target.update(zip(items, items))
+    return target
+
+
+def _finish_set(target: set, items: list) -> set:
+    target.update(items)
+    return target
+
+
+_container_readers: Dict[
+    type, tuple[Callable[[list], Any], Callable[[Any, list], Any]]
+] = {
+    list: (lambda items: items, lambda target, items: items),
+    tuple: (lambda items: _UNFINISHED, lambda target, items: tuple(items)),
+    set: (lambda items: set(), _finish_set),
+    frozenset: (lambda items: _UNFINISHED, lambda target, items: frozenset(items)),
+    dict: (lambda items: {}, _finish_dict),
+}
+
+# Item size in bytes for each fixed width struct typecode used in typed arrays
+_array_typecode_sizes = {"b": 1, "h": 2, "i": 4, "q": 8, "d": 8}
+# Items are in the same byte order as a single int or float, see _FLOAT
+_array_typecode_byte_orders = {"b": "!", "h": "!", "i": "!", "q": "!", "d": "<"}
+
+# Looked up by the discriminant as it is read, rather than going through the type
+_discriminant_to_leaf_deserialiser = {
+    discriminant: Deserialiser._type_to_deserialiser[object_type]
+    for discriminant, object_type in _discriminant_to_type.items()
+    if object_type in Deserialiser._type_to_deserialiser
+}
+_discriminant_to_container_reader = {
+    _type_to_discriminant[object_type]: reader
+    for object_type, reader in _container_readers.items()
+}
+_DICT_DISCRIMINANT = _type_to_discriminant[dict]
+_BACK_REFERENCE_BYTE = _type_to_discriminant_byte[_BackReference]
+# Back references are 2 bytes, so only this many things can be memoised
+_MEMO_LIMIT = 2**16
 
 MAXIMUM_SIZE = Serialiser.MAXIMUM_SIZE
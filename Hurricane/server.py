@@ -2,16 +2,25 @@ from __future__ import annotations
 
 import asyncio
 from asyncio import StreamReader, StreamWriter
-from Crypto.Cipher import PKCS1_OAEP
-from Crypto.PublicKey import RSA
+import functools
+import os
+import socket
+import ssl
 import sys
+import time
 import traceback
-from typing import Awaitable, Callable, Coroutine
+from typing import Any, Awaitable, Callable, Coroutine, Iterable
 from uuid import UUID
 
+from Hurricane import compression, framing, handoff
 from Hurricane.message import Message
-from Hurricane.client import Client, ClientBuilder
-from Hurricane.encryption import ServerEncryption
+from Hurricane.client import Client, ClientBuilder, ClientState
+from Hurricane.hooks import ProfilingHooks
+from Hurricane.metrics import ServerMetrics
+from Hurricane.ratelimit import RateLimit, RateLimiter
+from Hurricane.security import AESSecurity, TransportSecurity
+from Hurricane.timers import TimingWheel
+from Hurricane.topics import TopicRouter
 
 # Used to keep a reference to any tasks
 # asyncio.create_task only creates a weak reference to the task
@@ -20,81 +29,383 @@ from Hurricane.encryption import ServerEncryption
 task_references = set()
 
 
+def _set_keepalive(sock: socket.socket, idle: int, interval: int, count: int) -> None:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Not every platform allows these to be set per socket
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+    elif hasattr(socket, "TCP_KEEPALIVE"):  # macOS
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+    if hasattr(socket, "TCP_KEEPCNT"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+
+
 class Server:
-    def __init__(self, *, timeout: int = 30, rsa_key_path: str = None) -> None:
+    def __init__(
+        self,
+        *,
+        timeout: int = 30,
+        rsa_key_path: str = None,
+        security: TransportSecurity | None = None,
+        compression: Iterable[str] | None = None,
+        compression_threshold: int = 256,
+        heartbeat_interval: float | None = None,
+        heartbeat_misses: int = 3,
+        replay_buffer_size: int = 1024,
+        keepalive: tuple[int, int, int] | None = (60, 10, 5),
+        rate_limit: RateLimit | None = None,
+        global_rate_limit: RateLimit | None = None,
+        handoff_path: str | None = None,
+    ) -> None:
         self._clients: dict[UUID, Client] = {}
         self._new_connection_callback: Callable[[Client], Coroutine] | None = None
         self._received_message_callback: Callable[[Message], Coroutine] | None = None
         self._client_disconnect_callback: Callable[[Client], Coroutine] | None = None
         self.reconnect_timeout: int = timeout
 
-        # Most decisions informed by
-        # https://www.daemonology.net/blog/2009-06-11-cryptographic-right-answers.html
+        # Names of the compressors clients may choose from, None accepts any that are installed
+        self._accepted_compressors: Iterable[str] | None = compression
+        self.compression_threshold: int = compression_threshold
 
-        self._rsa_key: RSA.RsaKey
-        if rsa_key_path:
-            self._rsa_key = RSA.import_key(rsa_key_path)
-        else:
-            # Secure default settings
-            # Speed is unimportant - only used for AES key exchange
-            self._rsa_key = RSA.generate(bits=2048, e=65537)
-        self._rsa_cipher: PKCS1_OAEP.PKCS1OAEP_Cipher = PKCS1_OAEP.new(self._rsa_key)
+        # See Client for how heartbeats detect dead connections
+        self.heartbeat_interval: float | None = heartbeat_interval
+        self.heartbeat_misses: int = heartbeat_misses
+
+        # Number of sent messages kept per client until acknowledged, to resend after reconnecting
+        self.replay_buffer_size: int = replay_buffer_size
+
+        # TCP keepalive idle time, probe interval and probe count for accepted sockets
+        # Catches dead connections even when heartbeats are disabled, None turns it off
+        self.keepalive: tuple[int, int, int] | None = keepalive
+
+        # Limits on what each client, and all clients together, can send
+        # A client over either stops being read from until it is back under
+        self.rate_limit: RateLimit | None = rate_limit
+        self._global_rate_limiter: RateLimiter | None = (
+            None if global_rate_limit is None else RateLimiter(global_rate_limit)
+        )
+
+        # A new process serving with the same handoff_path takes over from this one,
+        # along with its listening sockets and clients, see Hurricane.handoff
+        self.handoff_path: str | None = handoff_path
+        self._listeners: list[
+            tuple[asyncio.Server, Callable[..., Awaitable[asyncio.Server]]]
+        ] = []
+        self._metrics_servers: list[asyncio.Server] = []
+        # Listening sockets handed over by the process this one took over from
+        self._inherited_sockets: list[socket.socket] = []
+        self._handshakes: set[asyncio.Task] = set()
+        self._taking_over: asyncio.Future | None = None
+        self._handed_over: asyncio.Event = asyncio.Event()
+
+        # Every client's reconnect timeout and heartbeats share one timer in the event loop
+        self.timers: TimingWheel = TimingWheel()
+
+        self.metrics: ServerMetrics = ServerMetrics(self._clients)
+        self.hooks: ProfilingHooks = ProfilingHooks()
+        self.topics: TopicRouter = TopicRouter()
+
+        # How connections are secured, clients must use the same kind of TransportSecurity
+        # Defaults to an RSA key exchange then AES encryption, see Hurricane.security
+        if security is None:
+            security = AESSecurity(rsa_key_path)
+        elif rsa_key_path is not None:
+            raise ValueError("rsa_key_path is only used by the default security")
+        self.security: TransportSecurity = security
+        self.security.prepare()
+
+    def _new_client(
+        self,
+        reader: StreamReader,
+        writer: StreamWriter,
+        security: TransportSecurity | None = None,
+    ) -> None:
+        sock = writer.get_extra_info("socket")
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            if self.keepalive is not None:
+                _set_keepalive(sock, *self.keepalive)
+            if hasattr(socket, "TCP_NOTSENT_LOWAT"):
+                # The kernel only takes more once little of what it has is unsent, so the rest
+                # waits in the client's lanes, where urgent messages can overtake it
+                sock.setsockopt(
+                    socket.IPPROTO_TCP,
+                    socket.TCP_NOTSENT_LOWAT,
+                    Client.WRITE_BUFFER_SIZE,
+                )
+
+        new_client = self._client_builder(reader, writer)
+        new_task = asyncio.create_task(
+            self._client_setup(reader, writer, new_client, security or self.security)
+        )
+        task_references.add(new_task)
+        new_task.add_done_callback(task_references.remove)
+        self._handshakes.add(new_task)
+        new_task.add_done_callback(self._handshakes.discard)
 
-    def _new_client(self, reader: StreamReader, writer: StreamWriter) -> None:
+    def _client_builder(
+        self, reader: StreamReader | None, writer: StreamWriter | None
+    ) -> ClientBuilder:
         new_client = ClientBuilder()
         new_client.reader = reader
         new_client.writer = writer
-        new_client.disconnect_callback = self._client_disconnect_callback
+        new_client.disconnect_callback = self._client_disconnected
         new_client.reconnect_timeout = self.reconnect_timeout
-
-        new_task = asyncio.create_task(self._client_setup(reader, writer, new_client))
-        task_references.add(new_task)
-        new_task.add_done_callback(task_references.remove)
+        new_client.metrics = self.metrics
+        new_client.hooks = self.hooks
+        new_client.heartbeat_interval = self.heartbeat_interval
+        new_client.heartbeat_misses = self.heartbeat_misses
+        new_client.replay_buffer_size = self.replay_buffer_size
+        if self.rate_limit is not None:
+            new_client.rate_limiter = RateLimiter(self.rate_limit)
+        new_client.shared_rate_limiter = self._global_rate_limiter
+        new_client.timers = self.timers
+        return new_client
 
     async def _client_setup(
         self,
         tcp_reader: StreamReader,
         tcp_writer: StreamWriter,
         client_builder: ClientBuilder,
+        security: TransportSecurity,
     ) -> None:
-        tcp_writer.write(self._rsa_key.n.to_bytes(256, "big", signed=False))
-        tcp_writer.write(self._rsa_key.e.to_bytes(256, "big", signed=False))
+        started_at = time.perf_counter()
+        client_builder.encrypter = await security.accept(tcp_reader, tcp_writer)
 
-        aes_secret_encrypted = await tcp_reader.readexactly(256)
-        aes_secret = self._rsa_cipher.decrypt(aes_secret_encrypted)
-        client_builder.encrypter = ServerEncryption(secret=aes_secret)
-
-        uuid_data = await tcp_reader.readexactly(32 + 16)
+        uuid_data = await tcp_reader.readexactly(16 + client_builder.encrypter.overhead)
 
         uuid = client_builder.encrypter.decrypt(uuid_data)
         client_builder.uuid = UUID(bytes=uuid)
 
-        if client_builder.uuid in self._clients:
+        # The client offers the compressors it supports, and the server picks one of them
+        # Both ends say which message they last received, so lost messages can be resent
+        (hello_size,) = framing.LENGTH.unpack(
+            await tcp_reader.readexactly(framing.LENGTH.size)
+        )
+        hello = client_builder.encrypter.decrypt(
+            await tcp_reader.readexactly(hello_size)
+        )
+        (last_received_sequence,) = framing.CLIENT_HELLO.unpack_from(hello)
+        client_builder.last_received_sequence = last_received_sequence
+        offered = hello[framing.CLIENT_HELLO.size :]
+
+        chosen = compression.choose(offered, self._accepted_compressors)
+        client_builder.compressor = compression.from_identifier(
+            chosen, self.compression_threshold
+        )
+
+        client = self._clients.get(client_builder.uuid, None)
+        resuming = client is not None and client.state != ClientState.CLOSED
+        last_received_sequence = client.last_received_sequence if resuming else 0
+        reply = client_builder.encrypter.encrypt(
+            framing.SERVER_HELLO.pack(chosen, resuming, last_received_sequence)
+        )
+        tcp_writer.write(framing.LENGTH.pack(len(reply)) + reply)
+
+        if resuming:
             # Client is reconnecting
-            client = self._clients[client_builder.uuid]
             try:
                 await client.reconnect(client_builder)
             except ConnectionError:
-                pass  # Return to new client logic
-            else:
+                # The client's read task sees the connection close and waits again
+                # A new client would lose the session the client thinks it resumed
                 return
+            self._record_handshake(client, started_at)
+            return
 
         # Client is new or reconnection failed
         client = client_builder.construct()
         self._clients[client.uuid] = client
+        self._record_handshake(client, started_at)
 
         client.start_receiving(self._received_message_callback)
 
         if self._new_connection_callback:
             await self._new_connection_callback(client)
 
-    def start(self, host: str, port: int) -> None:
-        async def runner():
-            server = await asyncio.start_server(self._new_client, host=host, port=port)
-            async with server:
-                await server.serve_forever()
+    async def _client_disconnected(self, client: Client) -> None:
+        if self._clients.get(client.uuid, None) is client:
+            del self._clients[client.uuid]
+        self.topics.unsubscribe_all(client)
+
+        if self._client_disconnect_callback:
+            await self._client_disconnect_callback(client)
 
-        asyncio.run(runner())
+    def _record_handshake(self, client: Client, started_at: float) -> None:
+        finished_at = time.perf_counter()
+        self.metrics.handshake_seconds.observe(finished_at - started_at)
+        if self.hooks.handshake:
+            self.hooks.run(self.hooks.handshake, client, started_at, finished_at)
+
+    def start(
+        self,
+        host: str,
+        port: int,
+        *,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: int | None = None,
+    ) -> None:
+        asyncio.run(
+            self.serve(host, port, metrics_host=metrics_host, metrics_port=metrics_port)
+        )
+
+    def start_unix(
+        self,
+        path: str,
+        *,
+        security: TransportSecurity | None = None,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: int | None = None,
+    ) -> None:
+        asyncio.run(
+            self.serve_unix(
+                path,
+                security=security,
+                metrics_host=metrics_host,
+                metrics_port=metrics_port,
+            )
+        )
+
+    async def serve(
+        self,
+        host: str,
+        port: int,
+        *,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: int | None = None,
+    ) -> None:
+        # Like start, for use inside an already running event loop
+        await self._serve(
+            functools.partial(
+                asyncio.start_server,
+                self._new_client,
+                ssl=self.security.ssl_context,
+            ),
+            {"host": host, "port": port},
+            metrics_host,
+            metrics_port,
+        )
+
+    async def serve_unix(
+        self,
+        path: str,
+        *,
+        security: TransportSecurity | None = None,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: int | None = None,
+    ) -> None:
+        # Listens on a Unix domain socket, for clients on the same machine
+        # security overrides the server's for this socket, such as NullSecurity to skip
+        # the handshake and encryption when every process able to open path is trusted
+        security = security or self.security
+        security.prepare()
+        await self._serve(
+            functools.partial(
+                asyncio.start_unix_server,
+                functools.partial(self._new_client, security=security),
+                ssl=security.ssl_context,
+            ),
+            {"path": path},
+            metrics_host,
+            metrics_port,
+        )
+
+    async def serve_socket(
+        self, sock: socket.socket, *, security: TransportSecurity | None = None
+    ) -> None:
+        # Serves one already connected socket, such as one end of socket.socketpair()
+        # Must be called from the event loop the server is running in
+        security = security or self.security
+        security.prepare()
+
+        reader, writer = await self._open_accepted_socket(sock, security.ssl_context)
+        self._new_client(reader, writer, security)
+
+    async def _open_accepted_socket(
+        self, sock: socket.socket, ssl_context: ssl.SSLContext | None = None
+    ) -> tuple[StreamReader, StreamWriter]:
+        loop = asyncio.get_running_loop()
+        reader = StreamReader()
+        protocol = asyncio.StreamReaderProtocol(reader)
+        # Unlike asyncio.open_connection, this takes the server side of any TLS handshake
+        transport, _ = await loop.connect_accepted_socket(
+            lambda: protocol, sock, ssl=ssl_context
+        )
+        return reader, StreamWriter(transport, protocol, reader, loop)
+
+    async def _serve(
+        self,
+        start_listening: Callable[..., Awaitable[asyncio.Server]],
+        address: dict[str, Any],
+        metrics_host: str,
+        metrics_port: int | None,
+    ) -> None:
+        if self.handoff_path is not None:
+            # Shared by every call, however many sockets the server listens on
+            if self._taking_over is None:
+                self._taking_over = asyncio.ensure_future(self._take_over())
+            await asyncio.shield(self._taking_over)
+
+        if metrics_port is not None:
+            self._metrics_servers.append(
+                await self.metrics.serve(metrics_host, metrics_port)
+            )
+        inherited = self._inherit(address)
+        if inherited:
+            servers = [await start_listening(sock=sock) for sock in inherited]
+        else:
+            servers = [await start_listening(**address)]
+        self._listeners += [(server, start_listening) for server in servers]
+        try:
+            # Serves until another process takes over
+            await self._handed_over.wait()
+        finally:
+            for server in servers:
+                server.close()
+
+    def _inherit(self, address: dict[str, Any]) -> list[socket.socket]:
+        # The handed over listening sockets bound to address
+        # Matched on the port alone, a host can resolve to several addresses
+        inherited = []
+        for sock in self._inherited_sockets:
+            name = sock.getsockname()
+            if "path" in address:
+                matches = name == address["path"]
+            else:
+                matches = isinstance(name, tuple) and name[1] == address["port"]
+            if matches:
+                inherited.append(sock)
+        for sock in inherited:
+            self._inherited_sockets.remove(sock)
+        return inherited
+
+    async def _take_over(self) -> None:
+        await handoff.take_over(self, self.handoff_path)
+
+        # Waits for the next process to take over from this one
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.unlink(self.handoff_path)
+        except FileNotFoundError:
+            pass
+        listener.bind(self.handoff_path)
+        listener.listen()
+        listener.setblocking(False)
+        task = asyncio.create_task(self._wait_for_successor(listener))
+        task_references.add(task)
+        task.add_done_callback(task_references.remove)
+
+    async def _wait_for_successor(self, listener: socket.socket) -> None:
+        loop = asyncio.get_running_loop()
+        with listener:
+            while True:
+                sock, _ = await loop.sock_accept(listener)
+                sock.settimeout(handoff.TIMEOUT)
+                with sock:
+                    if await handoff.hand_over(self, sock):
+                        break
+        self._handed_over.set()
 
     def on_new_connection(
         self, coro: Callable[[Client], Awaitable]
@@ -124,7 +435,6 @@ class Server:
         self, coro: Callable[[Client], Awaitable]
     ) -> Callable[[Client], Awaitable]:
         async def wrapper(client: Client):
-            del self._clients[client.uuid]
             try:
                 await coro(client)
             except Exception as e:
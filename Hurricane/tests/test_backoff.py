@@ -0,0 +1,74 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+from Hurricane import Server
+from Hurricane.backoff import Backoff
+from Hurricane.client_functions import ReconnectState, ServerConnection
+
+
+def test_delay_grows_up_to_the_maximum():
+    backoff = Backoff(initial_delay=0.1, max_delay=1.0, multiplier=2.0)
+    for attempt, ceiling in enumerate([0.1, 0.2, 0.4, 0.8, 1.0, 1.0]):
+        delays = [backoff.delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        # Full jitter, so delays are spread over the whole range
+        assert max(delays) > ceiling / 2
+    assert backoff.delay(10_000) <= 1.0
+
+
+def test_exhausted():
+    assert Backoff(max_attempts=3, deadline=None).exhausted(3, 0)
+    assert not Backoff(max_attempts=3, deadline=None).exhausted(2, 1e9)
+    assert Backoff(max_attempts=None, deadline=5).exhausted(0, 5)
+    assert not Backoff(max_attempts=None, deadline=None).exhausted(10**6, 1e9)
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+def test_reconnects_then_gives_up(tmp_path):
+    path = str(tmp_path / "server")
+    states = []
+
+    async def run():
+        server = Server()
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+
+        backoff = Backoff(initial_delay=0.01, max_delay=0.05, max_attempts=3)
+        connection = await asyncio.to_thread(
+            ServerConnection.unix, path, backoff=backoff
+        )
+        connection.on_reconnect_state(
+            lambda state, attempt: states.append((state, attempt))
+        )
+
+        # Dropped on the client's side, so the next send reconnects
+        connection.socket.shutdown(socket.SHUT_RDWR)
+        await asyncio.to_thread(connection.send, 1)
+        assert states == [
+            (ReconnectState.DISCONNECTED, 0),
+            (ReconnectState.RECONNECTING, 1),
+            (ReconnectState.RECONNECTED, 1),
+        ]
+
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        os.unlink(path)
+        states.clear()
+        connection.socket.shutdown(socket.SHUT_RDWR)
+        with pytest.raises(ConnectionError):
+            await asyncio.to_thread(connection.send, 2)
+        assert states == [
+            (ReconnectState.DISCONNECTED, 0),
+            (ReconnectState.RECONNECTING, 1),
+            (ReconnectState.RECONNECTING, 2),
+            (ReconnectState.RECONNECTING, 3),
+            (ReconnectState.FAILED, 3),
+        ]
+        with pytest.raises(ConnectionError):
+            await asyncio.to_thread(connection.send, 3)
+
+    asyncio.run(run())
@@ -117,3 +117,28 @@ def test_class_value():
 def test_unserialisable():
     with pytest.raises(serialisation.CannotBeSerialised):
         serialisation.dumps(NotSerialisable())
+
+
+def test_shared_instance():
+    instance = HasDict(5)
+    result = serialisation.loads(serialisation.dumps([instance, instance]))
+    assert result[0] == instance
+    assert result[0] is result[1]
+
+
+def test_self_reference():
+    instance = HasSlots(None)
+    instance.slots_value = [instance]
+    result = serialisation.loads(serialisation.dumps(instance))
+    assert result.slots_value[0] is result
+
+
+def test_decoder_byte_by_byte():
+    instances = [HasDict(5), HasSlots("a"), HasSlots(None), HasDictAndSlots(1, 2)]
+    del instances[2].slots_value
+    data = b"".join(map(serialisation.dumps, instances))
+    decoder = serialisation.Decoder()
+    result = []
+    for index in range(len(data)):
+        result += decoder.feed(data[index : index + 1])
+    assert result == instances
@@ -0,0 +1,301 @@
+import asyncio
+import os
+import socket
+import uuid
+
+import pytest
+
+from Hurricane import Server, framing, serialisation
+
+from Hurricane.client import Client, ClientState
+from Hurricane.client_functions import ServerConnection
+from Hurricane.encryption import NullEncryption
+from Hurricane.lanes import BULK, URGENT
+from Hurricane.reliability import ReliableStream
+
+
+def disconnected_client():
+    client = Client(None, None, uuid.uuid4(), None, 60, NullEncryption())
+    client._state = ClientState.RECONNECTING
+    return client
+
+
+def waiting(client):
+    return [
+        (priority, message.data) for priority, message in client._outgoing_message_queue
+    ]
+
+
+def test_conflation_replaces_in_place():
+    client = disconnected_client()
+
+    async def send():
+        await client.send_serialised(b"a1", conflate_key="a")
+        await client.send_serialised(b"b1", BULK, conflate_key="b")
+        await client.send_serialised(b"x")
+        await client.send_serialised(b"a2", URGENT, conflate_key="a")
+        await client.send_serialised(b"b2", conflate_key="b")
+
+    asyncio.run(send())
+    # Each keeps the place and priority of the first message sent with its key
+    assert waiting(client) == [(1, b"a2"), (1, b"x"), (2, b"b2")]
+    assert client._metrics.conflated_messages.value == 2
+
+
+def test_conflation_after_writing_starts():
+    client = disconnected_client()
+
+    async def send():
+        await client.send_serialised(b"a1", conflate_key="a")
+        # Part of it has been written, so it can no longer be replaced
+        client._outgoing_message_queue.peek()[1].offset = 1
+        await client.send_serialised(b"a2", conflate_key="a")
+        await client.send_serialised(b"a3", conflate_key="a")
+
+    asyncio.run(send())
+    assert waiting(client) == [(1, b"a1"), (1, b"a3")]
+
+
+def test_written_and_expired_messages_leave_conflation():
+    client = disconnected_client()
+    writes = []
+    client._write_message_frame = lambda data, flags=0: writes.append(data) or 7
+
+    async def send():
+        await client.send_serialised(b"old", conflate_key="a", ttl=0)
+        await client.send_serialised(b"fresh", conflate_key="b", ttl=60)
+        assert client._write_next_frame()
+        assert not client._write_next_frame()
+        await client.send_serialised(b"new", conflate_key="a")
+
+    asyncio.run(send())
+    assert writes == [b"fresh"]
+    assert waiting(client) == [(1, b"new")]
+    assert list(client._conflated) == ["a"]
+    assert client._metrics.expired_messages.value == 1
+
+
+def test_expired_messages_are_swept():
+    client = disconnected_client()
+
+    async def send():
+        for index in range(Client.SWEEP_SIZE - 1):
+            await client.send_serialised(b"stale", ttl=0)
+        await client.send_serialised(b"kept", conflate_key="a")
+
+    asyncio.run(send())
+    assert waiting(client) == [(1, b"kept")]
+    assert client._metrics.expired_messages.value == Client.SWEEP_SIZE - 1
+    assert client._sweep_at == Client.SWEEP_SIZE
+
+
+def test_small_messages_are_batched():
+    client = disconnected_client()
+    writes = []
+    client._write_message_frame = (
+        lambda data, flags=0: writes.append((data, flags)) or 7
+    )
+
+    async def send():
+        await client.send_serialised(b"a")
+        await client.send_serialised(b"b", URGENT)
+        await client.send_serialised(b"c" * Client.CHUNK_SIZE)
+        await client.send_serialised(b"d")
+        assert client._write_next_frame()
+
+    asyncio.run(send())
+    # Taken in priority order, until the next would not fit
+    assert writes == [(framing.pack_batch([b"b", b"a"]), framing.BATCH)]
+    assert waiting(client) == [(1, b"c" * Client.CHUNK_SIZE), (1, b"d")]
+    assert client._metrics.messages_sent.value == 2
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+def test_urgent_message_overtakes_parts(tmp_path):
+    path = str(tmp_path / "server")
+    first, second = os.urandom(60_000), os.urandom(60_000)
+
+    async def run():
+        server = Server()
+        connected = asyncio.Queue()
+        server.on_new_connection(connected.put)
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        client = await connected.get()
+        # So the connection is soon full, and parts wait in their lane
+        client._tcp_writer.get_extra_info("socket").setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, 4096
+        )
+
+        sending = [
+            asyncio.create_task(client.send(first, BULK)),
+            asyncio.create_task(client.send(second, BULK)),
+        ]
+        # Not with peek, which would move the lanes on
+        while not any(message.offset for _, message in client._outgoing_message_queue):
+            await asyncio.sleep(0.01)
+        sending.append(asyncio.create_task(client.send("urgent", URGENT)))
+        await asyncio.sleep(0.01)
+
+        # The connection is lost after the first part arrives, so it is sent again
+        join_part = connection._join_part
+        disconnected = False
+
+        def join_part_then_disconnect(frame):
+            nonlocal disconnected
+            joined = join_part(frame)
+            if not disconnected:
+                disconnected = True
+                connection.socket.shutdown(socket.SHUT_RDWR)
+            return joined
+
+        connection._join_part = join_part_then_disconnect
+        received = [
+            (await asyncio.to_thread(connection.recv)).contents for _ in range(3)
+        ]
+        await asyncio.gather(*sending)
+
+        assert client.reconnections == 1
+        assert client._metrics.replayed_messages.value
+        assert not connection._partial_messages
+        connection.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        return received
+
+    assert asyncio.run(run()) == ["urgent", first, second]
+
+
+def test_connection_that_only_sends_frees_its_replay_buffer(tmp_path):
+    path = str(tmp_path / "server")
+    count = 4 * ReliableStream.ACKNOWLEDGE_EVERY
+
+    async def run():
+        server = Server()
+        received = asyncio.Queue()
+
+        async def collect(message):
+            await received.put(message.contents)
+
+        server.on_receiving_message(collect)
+        connected = asyncio.Queue()
+        server.on_new_connection(connected.put)
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        client = await connected.get()
+        await client.send("kept")
+
+        for index in range(count):
+            await asyncio.to_thread(connection.send, index)
+        for _ in range(count):
+            await asyncio.wait_for(received.get(), 5)
+        # The server's acknowledgements are read by the next send, without recv
+        await asyncio.sleep(0.1)
+        await asyncio.to_thread(connection.send, count)
+        assert len(connection._stream) < ReliableStream.ACKNOWLEDGE_EVERY
+
+        # The message read along with them is still received
+        assert (await asyncio.to_thread(connection.recv)).contents == "kept"
+        connection.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_parts_fit_in_frames(tmp_path, monkeypatch):
+    # A message or part as big as CHUNK_SIZE would overflow a frame with the header and HMAC
+    path = str(tmp_path / "server")
+    monkeypatch.setattr(Client, "CHUNK_SIZE", 64 * 1024)
+    sent = [os.urandom(size) for size in (65_520, 30_000, 100)]
+
+    async def run():
+        server = Server()
+        connected = asyncio.Queue()
+        server.on_new_connection(connected.put)
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        client = await connected.get()
+
+        for data in sent:
+            await client.send(data)
+        received = [(await asyncio.to_thread(connection.recv)).contents for _ in sent]
+        assert client.reconnections == 0
+        connection.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        return received
+
+    assert asyncio.run(run()) == sent
+
+
+def test_heartbeats(tmp_path):
+    path = str(tmp_path / "server")
+
+    async def run():
+        server = Server(heartbeat_interval=0.05, heartbeat_misses=3)
+        connected = asyncio.Queue()
+        server.on_new_connection(connected.put)
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        client = await connected.get()
+
+        # PINGs are answered while the connection is receiving
+        receiving = asyncio.create_task(asyncio.to_thread(connection.recv))
+        for _ in range(500):
+            if client.rtt is not None:
+                break
+            await asyncio.sleep(0.01)
+        assert 0 < client.rtt < 1
+        await client.send("done")
+        assert (await receiving).contents == "done"
+        assert client.state is ClientState.OPEN
+
+        # Then nothing reads them, so the server gives up waiting for PONGs
+        stopped_at = asyncio.get_running_loop().time()
+        for _ in range(500):
+            if client.state is not ClientState.OPEN:
+                break
+            await asyncio.sleep(0.01)
+        assert client.state is ClientState.RECONNECTING
+        elapsed = asyncio.get_running_loop().time() - stopped_at
+        # Not at the first unanswered PING, but after several
+        assert elapsed >= client.heartbeat_interval
+
+        connection.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def part(first_sequence, data, more=True):
+    flags = framing.PART | (framing.MORE if more else 0)
+    return framing.Frame(0, flags, 0, 0, framing.PART_KEY.pack(first_sequence) + data)
+
+
+def test_parts_are_decoded_as_they_arrive():
+    connection = ServerConnection.__new__(ServerConnection)
+    connection._partial_messages = {}
+    message = ["x" * 1000, list(range(1000)), {"nested": (1.5, None)}]
+    data = serialisation.dumps(message)
+    thirds = [data[: len(data) // 3], data[len(data) // 3 : -1], data[-1:]]
+
+    assert connection._join_part(part(1, thirds[0])) is None
+    assert connection._join_part(part(1, thirds[1])) is None
+    assert connection._join_part(part(1, thirds[2], more=False)) == [message]
+    assert not connection._partial_messages
+
+    # Two messages, or half of one, are not what the parts promised
+    with pytest.raises(serialisation.MalformedDataError):
+        connection._join_part(part(5, data + data, more=False))
+    with pytest.raises(serialisation.MalformedDataError):
+        connection._join_part(part(9, thirds[0], more=False))
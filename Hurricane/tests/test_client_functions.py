@@ -0,0 +1,236 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from Hurricane import Server, framing
+from Hurricane.backoff import Backoff
+from Hurricane.client_functions import ServerConnection
+from Hurricane.security import NullSecurity
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets"
+)
+
+
+async def start_serving(path):
+    server = Server()
+    received = asyncio.Queue()
+
+    async def collect(message):
+        await received.put(message.contents)
+
+    server.on_receiving_message(collect)
+    connected = asyncio.Queue()
+    server.on_new_connection(connected.put)
+    serving = asyncio.create_task(server.serve_unix(path))
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+    return serving, connected, received
+
+
+async def stop_serving(serving):
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+
+
+def test_concurrent_senders(tmp_path):
+    path = str(tmp_path / "server")
+    threads, count = 4, 200
+
+    async def run():
+        serving, _, received = await start_serving(path)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+
+        def send(thread):
+            for index in range(count):
+                connection.send((thread, index))
+
+        senders = [
+            threading.Thread(target=send, args=(thread,)) for thread in range(threads)
+        ]
+        for sender in senders:
+            sender.start()
+        contents = [
+            await asyncio.wait_for(received.get(), 10) for _ in range(threads * count)
+        ]
+        await asyncio.to_thread(lambda: [sender.join() for sender in senders])
+
+        # Interleaved, but each thread's messages arrive whole and in order
+        for thread in range(threads):
+            assert [index for sent_by, index in contents if sent_by == thread] == list(
+                range(count)
+            )
+        connection.close()
+        await stop_serving(serving)
+
+    asyncio.run(run())
+
+
+def test_background_receiver(tmp_path):
+    path = str(tmp_path / "server")
+
+    async def run():
+        serving, connected, _ = await start_serving(path)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        client = await connected.get()
+
+        connection.start_receiving()
+        assert connection.receiving
+        with pytest.raises(RuntimeError):
+            connection.recv()
+        with pytest.raises(RuntimeError):
+            connection.start_receiving()
+
+        for index in range(50):
+            await client.send(index)
+        contents = [
+            (await asyncio.to_thread(connection.incoming.get, timeout=5)).contents
+            for _ in range(50)
+        ]
+        assert contents == list(range(50))
+
+        await asyncio.to_thread(connection.close)
+        assert not connection.receiving
+        await stop_serving(serving)
+
+    asyncio.run(run())
+
+
+def test_receiver_callback_runs_on_its_thread(tmp_path):
+    path = str(tmp_path / "server")
+
+    async def run():
+        serving, connected, _ = await start_serving(path)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        client = await connected.get()
+
+        called = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        def callback(message):
+            loop.call_soon_threadsafe(
+                called.put_nowait, (message.contents, threading.current_thread())
+            )
+
+        connection.start_receiving(callback)
+        await client.send("hello")
+        contents, thread = await asyncio.wait_for(called.get(), 5)
+        assert contents == "hello"
+        assert thread is connection._receive_thread
+        assert connection.incoming.empty()
+
+        await asyncio.to_thread(connection.close)
+        assert not thread.is_alive()
+        await stop_serving(serving)
+
+    asyncio.run(run())
+
+
+def test_close_while_reconnecting(tmp_path):
+    # The server comes back, but never finishes a handshake
+    path = str(tmp_path / "server")
+
+    async def run():
+        serving, _, _ = await start_serving(path)
+        connection = await asyncio.to_thread(
+            ServerConnection.unix, path, backoff=Backoff(initial_delay=0)
+        )
+        await stop_serving(serving)
+        if os.path.exists(path):
+            os.unlink(path)
+        silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        silent.bind(path)
+        silent.listen()
+
+        connection.start_receiving()
+        connection.socket.shutdown(socket.SHUT_RDWR)
+        while not connection._reconnecting:
+            await asyncio.sleep(0.01)
+
+        started_at = time.monotonic()
+        await asyncio.wait_for(asyncio.to_thread(connection.close), 5)
+        assert time.monotonic() - started_at < connection.HANDSHAKE_TIMEOUT
+        assert not connection.receiving
+        silent.close()
+
+    asyncio.run(run())
+
+
+def test_reconnect_attempt_times_out(tmp_path):
+    path = str(tmp_path / "server")
+
+    async def run():
+        serving, _, _ = await start_serving(path)
+        connection = await asyncio.to_thread(
+            ServerConnection.unix,
+            path,
+            backoff=Backoff(initial_delay=0, max_attempts=2),
+        )
+        connection.HANDSHAKE_TIMEOUT = 0.1
+        await stop_serving(serving)
+        if os.path.exists(path):
+            os.unlink(path)
+        silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        silent.bind(path)
+        silent.listen()
+
+        connection.socket.shutdown(socket.SHUT_RDWR)
+        with pytest.raises(ConnectionError, match="after 2 attempts"):
+            await asyncio.wait_for(asyncio.to_thread(connection.send, "lost"), 5)
+        connection.close()
+        silent.close()
+
+    asyncio.run(run())
+
+
+def test_malformed_hello_is_retried(tmp_path):
+    path = str(tmp_path / "server")
+    attempts = 3
+
+    def answer_badly(listener):
+        listener.settimeout(2)
+        for _ in range(attempts):
+            try:
+                sock, _ = listener.accept()
+            except TimeoutError:
+                return  # The client gave up
+            with sock:
+                sock.recv(16)  # The client's UUID
+                (size,) = framing.LENGTH.unpack(sock.recv(framing.LENGTH.size))
+                sock.recv(size)
+                # Too short to be a SERVER_HELLO
+                sock.sendall(framing.LENGTH.pack(3) + b"bad")
+
+    async def run():
+        server = Server(security=NullSecurity())
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        connection = await asyncio.to_thread(
+            ServerConnection.unix,
+            path,
+            security=NullSecurity(),
+            backoff=Backoff(initial_delay=0, max_attempts=attempts),
+        )
+        await stop_serving(serving)
+        if os.path.exists(path):
+            os.unlink(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen()
+        answering = threading.Thread(target=answer_badly, args=(listener,), daemon=True)
+        answering.start()
+
+        connection.socket.shutdown(socket.SHUT_RDWR)
+        # Every attempt is made, rather than giving up at the first
+        with pytest.raises(ConnectionError, match=f"after {attempts} attempts"):
+            await asyncio.wait_for(asyncio.to_thread(connection.send, "lost"), 5)
+        await asyncio.to_thread(answering.join)
+        connection.close()
+        listener.close()
+
+    asyncio.run(run())
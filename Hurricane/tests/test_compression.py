@@ -0,0 +1,63 @@
+from Hurricane import compression
+from Hurricane.serialisation import MAXIMUM_SIZE
+import pytest
+import zlib
+
+
+@pytest.fixture(params=list(compression.available_compressors))
+def compressor_name(request):
+    return request.param
+
+
+def test_round_trip(compressor_name):
+    sender = compression.available_compressors[compressor_name]()
+    receiver = compression.available_compressors[compressor_name]()
+    data = b"Hello Hurricane " * 100
+    compressed = sender.compress(data)
+    assert len(compressed) < len(data)
+    assert receiver.decompress(compressed) == data
+
+
+def test_many_messages(compressor_name):
+    sender = compression.available_compressors[compressor_name]()
+    receiver = compression.available_compressors[compressor_name]()
+    for i in range(50):
+        data = f"player {i} moved to ({i}, {i * 2})".encode() * 20
+        assert receiver.decompress(sender.compress(data)) == data
+
+
+def test_stream_shares_history():
+    stream = compression.ZlibStreamCompressor()
+    message = b"The quick brown fox jumps over the lazy dog, again and again. " * 4
+    first = stream.compress(message)
+    second = stream.compress(message)
+    assert len(second) < len(first)
+    assert len(second) < len(compression.ZlibCompressor().compress(message))
+
+
+def test_decompression_bomb():
+    bomb = zlib.compress(b"\x00" * (MAXIMUM_SIZE * 4))
+    with pytest.raises(compression.DecompressionError):
+        compression.ZlibCompressor().decompress(bomb)
+
+
+def test_choose_prefers_client_order():
+    offered = compression.offer(["zlib-stream", "zlib"])
+    assert (
+        compression.choose(offered, None) == compression.ZlibStreamCompressor.identifier
+    )
+    assert (
+        compression.choose(offered, ["zlib"]) == compression.ZlibCompressor.identifier
+    )
+
+
+def test_choose_nothing_in_common():
+    assert compression.choose(compression.offer(["zlib"]), []) == 0
+    assert compression.choose(b"", None) == 0
+    assert compression.from_identifier(0, 256) is None
+
+
+def test_offer_skips_unavailable():
+    assert compression.offer(["not a compressor", "zlib"]) == bytes(
+        [compression.ZlibCompressor.identifier]
+    )
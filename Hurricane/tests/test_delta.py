@@ -0,0 +1,129 @@
+from Hurricane import delta, serialisation
+import asyncio
+import pytest
+
+
+@serialisation.make_serialisable
+class Player:
+    __slots__ = ("name", "position")
+
+    def __init__(self, name, position):
+        self.name = name
+        self.position = position
+
+    def __eq__(self, other):
+        return type(other) is Player and (self.name, self.position) == (
+            other.name,
+            other.position,
+        )
+
+
+class PatchedClient:
+    def __init__(self):
+        self.sent_messages = []
+        self.last_acknowledged_sequence = 0
+        self.reconnections = 0
+
+    async def send_serialised(self, data):
+        self.sent_messages.append(serialisation.loads(data))
+        return len(self.sent_messages)
+
+    def acknowledge_all(self):
+        self.last_acknowledged_sequence = len(self.sent_messages)
+
+
+def test_equal_has_no_changes():
+    state = {"a": [1, 2, {"b": 3}], "c": Player("x", (1, 2))}
+    assert delta.diff(state, serialisation.loads(serialisation.dumps(state))) is None
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ({"a": 1, "b": 2}, {"a": 1, "c": 3}),
+        ([1, 2, 3], [1, 5]),
+        ([1], [1, 2, [3]]),
+        ({"a": [1, {"b": 2}]}, {"a": [1, {"b": 3}]}),
+        (1, 1.0),
+        ((1, 2), (1, 3)),
+        (Player("x", 1), Player("x", 2)),
+        ({"p": Player("x", [1, 2])}, {"p": Player("y", [1, 3])}),
+    ],
+)
+def test_patch_round_trip(old, new):
+    change = delta.diff(old, new)
+    assert change is not None
+    result = delta.patch(old, serialisation.loads(serialisation.dumps(change)))
+    assert result == new
+    assert type(result) is type(new)
+
+
+def test_only_changes_are_sent():
+    old = {"players": {str(i): {"x": i, "y": 0} for i in range(100)}}
+    new = serialisation.loads(serialisation.dumps(old))
+    new["players"]["42"]["x"] = -1
+    change = delta.diff(old, new)
+    assert len(serialisation.dumps(change)) < len(serialisation.dumps(new)) // 20
+
+
+def test_patch_shares_unchanged_parts():
+    old = {"changed": {"a": 1}, "unchanged": {"b": 2}}
+    new = delta.patch(
+        old, delta.diff(old, {"changed": {"a": 2}, "unchanged": {"b": 2}})
+    )
+    assert new["unchanged"] is old["unchanged"]
+    assert old["changed"] == {"a": 1}
+
+
+def test_sync():
+    sync = delta.DeltaSync("world")
+    client = PatchedClient()
+    replica = delta.StateReplica("world")
+    state = {"tick": 0, "players": [Player("x", 0)]}
+
+    for tick in range(1, 10):
+        state["tick"] = tick
+        state["players"][0].position = tick
+        if tick == 5:
+            state["players"].append(Player("y", 0))
+        asyncio.run(sync.publish(state, [client]))
+        update = client.sent_messages[-1]
+        assert replica.apply(update) == state
+        if tick % 3 == 0:
+            client.acknowledge_all()
+
+    bases = [update.base_version for update in client.sent_messages]
+    assert bases == [0, 0, 0, 3, 3, 3, 6, 6, 6]
+
+
+def test_reconnection_resyncs():
+    sync = delta.DeltaSync()
+    client = PatchedClient()
+    asyncio.run(sync.publish({"a": 1}, [client]))
+    client.acknowledge_all()
+    asyncio.run(sync.publish({"a": 2}, [client]))
+    assert client.sent_messages[-1].base_version == 1
+
+    client.reconnections += 1
+    asyncio.run(sync.publish({"a": 3}, [client]))
+    assert client.sent_messages[-1].base_version == 0
+    assert client.sent_messages[-1].changes == {"a": 3}
+
+
+def test_clients_share_updates():
+    sync = delta.DeltaSync()
+    clients = [PatchedClient() for _ in range(3)]
+    asyncio.run(sync.publish([1], clients))
+    clients[0].acknowledge_all()
+    asyncio.run(sync.publish([2], clients))
+    assert clients[0].sent_messages[-1].base_version == 1
+    assert clients[1].sent_messages[-1].base_version == 0
+    assert clients[2].sent_messages[-1].base_version == 0
+
+
+def test_divergence():
+    replica = delta.StateReplica()
+    with pytest.raises(delta.StateDiverged):
+        replica.apply(delta.StateUpdate("state", 2, 1, None))
+    replica.apply(delta.StateUpdate("state", 3, 0, {"a": 1}))
+    assert replica.state == {"a": 1}
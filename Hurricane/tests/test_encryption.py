@@ -45,6 +45,20 @@ class TestBaseEncryption:
         with pytest.raises(ValueError):
             client_encrypter.decrypt(tampered_data)
 
+    def test_export_state(self):
+        server_encrypter = encryption.ServerEncryption()
+        client_encrypter = encryption.ClientEncryption()
+        client_encrypter.decrypt(server_encrypter.encrypt(b"before"))
+        server_encrypter.decrypt(client_encrypter.encrypt(b"before"))
+
+        state = server_encrypter.export_state()
+        restored = encryption.ServerEncryption.from_state(*state)
+        assert state == (b"A" * 32, 1, 2**63 + 1)
+        assert client_encrypter.decrypt(restored.encrypt(b"after")) == b"after"
+        assert restored.decrypt(client_encrypter.encrypt(b"after")) == b"after"
+        # Exporting does not use up a nonce
+        assert server_encrypter.get_encryption_nonce() == 1
+
 
 class TestServerEncryption:
     def test_get_nonces(self):
@@ -68,3 +82,43 @@ class TestClientEncryption:
         assert encrypter.get_decryption_nonce() == 0
         assert encrypter.get_decryption_nonce() == 1
         assert encrypter.get_decryption_nonce() == 2
+
+
+class TestNullEncryption:
+    def test_passthrough(self):
+        encrypter = encryption.NullEncryption()
+        assert encrypter.encrypt(b"hello") == b"hello"
+        assert encrypter.decrypt(b"hello") == b"hello"
+
+    def test_overhead(self):
+        data = b"hello"
+        assert len(encryption.ServerEncryption().encrypt(data)) == len(data) + 32
+        assert encryption.ServerEncryption.overhead == 32
+        assert encryption.NullEncryption.overhead == 0
+
+
+class TestIntegrity:
+    def test_round_trip(self):
+        server_integrity = encryption.ServerIntegrity(b"B" * 32)
+        client_integrity = encryption.ClientIntegrity(b"B" * 32)
+        data = b"hello"
+        authenticated_data = server_integrity.encrypt(data)
+        assert authenticated_data[32:] == data
+        assert client_integrity.decrypt(authenticated_data) == data
+        authenticated_data = client_integrity.encrypt(data)
+        assert server_integrity.decrypt(authenticated_data) == data
+
+    def test_tamper_protection(self):
+        server_integrity = encryption.ServerIntegrity(b"B" * 32)
+        client_integrity = encryption.ClientIntegrity(b"B" * 32)
+        authenticated_data = server_integrity.encrypt(b"hello")
+        with pytest.raises(ValueError):
+            client_integrity.decrypt(authenticated_data[:-1] + b"O")
+
+    def test_replay_protection(self):
+        server_integrity = encryption.ServerIntegrity(b"B" * 32)
+        client_integrity = encryption.ClientIntegrity(b"B" * 32)
+        authenticated_data = server_integrity.encrypt(b"hello")
+        client_integrity.decrypt(authenticated_data)
+        with pytest.raises(ValueError):
+            client_integrity.decrypt(authenticated_data)
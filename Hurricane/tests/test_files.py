@@ -0,0 +1,117 @@
+import asyncio
+import os
+import socket
+import uuid
+
+import pytest
+
+from Hurricane import Server
+from Hurricane.client import Client, ClientState
+from Hurricane.client_functions import ServerConnection
+from Hurricane.encryption import NullEncryption
+from Hurricane.message import ReceivedFile
+from Hurricane.security import AESSecurity, NullSecurity
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+# Unencrypted frames are sent with sendfile, encrypted ones are read a chunk at a time
+@pytest.mark.parametrize("security", [NullSecurity, AESSecurity])
+def test_send_file(tmp_path, security):
+    path = str(tmp_path / "server")
+    big = tmp_path / "big.bin"
+    big.write_bytes(os.urandom(200_000))
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+
+    async def run():
+        server = Server(security=security())
+        connected = asyncio.Queue()
+        server.on_new_connection(connected.put)
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+
+        connection = await asyncio.to_thread(
+            ServerConnection.unix, path, security=security()
+        )
+        sinks = []
+
+        @connection.on_file
+        def sink(name, size):
+            sinks.append((name, size))
+            return open(tmp_path / f"received-{len(sinks)}", "wb")
+
+        client = await connected.get()
+        sending = asyncio.gather(
+            client.send_file(str(big)),
+            client.send("between"),
+            client.send_file(str(empty), "renamed"),
+        )
+        received = [await asyncio.to_thread(connection.recv) for _ in range(3)]
+        big_sequence, _, empty_sequence = await sending
+        assert 0 < big_sequence < empty_sequence
+        assert client.reconnections == 0
+
+        connection.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        return sinks, [message.contents for message in received]
+
+    sinks, received = asyncio.run(run())
+    # The message goes between the file's chunks, rather than waiting for all of them
+    assert received[0] == "between"
+    assert sinks == [("big.bin", 200_000), ("renamed", 0)]
+    assert [(file.name, file.size) for file in received[1:]] == sinks
+    assert all(
+        isinstance(file, ReceivedFile) and file.file.closed for file in received[1:]
+    )
+    assert (tmp_path / "received-1").read_bytes() == big.read_bytes()
+    assert (tmp_path / "received-2").read_bytes() == b""
+
+
+def test_closed_client_leaves_file_alone(tmp_path):
+    client = Client(None, None, uuid.uuid4(), None, 60, NullEncryption())
+    client._state = ClientState.CLOSED
+    # Not even opened, so a missing file is no error either
+    assert asyncio.run(client.send_file(str(tmp_path / "missing.bin"))) is None
+    assert not client._outgoing_message_queue
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+def test_queued_file_is_handed_over(tmp_path):
+    path = str(tmp_path / "server")
+    handoff_path = str(tmp_path / "handoff")
+    # A long path, as it is handed over with the file's place in the queue
+    directory = tmp_path / ("d" * 200)
+    directory.mkdir()
+    big = directory / "big.bin"
+    big.write_bytes(os.urandom(100_000))
+
+    async def serve():
+        server = Server(handoff_path=handoff_path)
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(handoff_path):
+            await asyncio.sleep(0.01)
+        return server, serving
+
+    async def run():
+        old, old_serving = await serve()
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        connection.on_file(lambda name, size: open(tmp_path / "received", "wb"))
+        (client,) = old._clients.values()
+        connection.socket.shutdown(socket.SHUT_RDWR)
+        while client.state.name != "RECONNECTING":
+            await asyncio.sleep(0.01)
+        assert await client.send_file(str(big)) is None
+
+        new, new_serving = await serve()
+        await asyncio.wait_for(old_serving, 5)
+        received = (await asyncio.to_thread(connection.recv)).contents
+        assert (received.name, received.size) == ("big.bin", 100_000)
+
+        connection.close()
+        new_serving.cancel()
+        await asyncio.gather(new_serving, return_exceptions=True)
+
+    asyncio.run(run())
+    assert (tmp_path / "received").read_bytes() == big.read_bytes()
@@ -0,0 +1,107 @@
+import time
+
+from Hurricane import compression, framing
+import pytest
+
+
+def test_below_threshold_not_compressed():
+    compressor = compression.ZlibCompressor(minimum_size=100)
+    plaintext = framing.build_plaintext(b"a" * 99, compressor)
+    frame = framing.parse_plaintext(plaintext, compressor)
+    assert not frame.flags & framing.COMPRESSED
+    assert frame.data == b"a" * 99
+
+
+def test_above_threshold_compressed():
+    compressor = compression.ZlibCompressor(minimum_size=100)
+    plaintext = framing.build_plaintext(b"a" * 1000, compressor)
+    assert len(plaintext) < 1000
+    frame = framing.parse_plaintext(plaintext, compressor)
+    assert frame.flags & framing.COMPRESSED
+    assert frame.data == b"a" * 1000
+
+
+def test_compressed_without_compressor():
+    plaintext = framing.build_plaintext(b"a" * 1000, compression.ZlibCompressor())
+    with pytest.raises(ValueError):
+        framing.parse_plaintext(plaintext, None)
+
+
+def test_flags_round_trip():
+    plaintext = framing.build_plaintext(b"data", None, framing.PING)
+    sent_at_ns, flags, sequence, acknowledged, data = framing.parse_plaintext(
+        plaintext, None
+    )
+    assert flags == framing.PING
+    assert flags & framing.CONTROL
+    assert data == b"data"
+
+
+def test_message_is_not_control():
+    plaintext = framing.build_plaintext(b"a" * 1000, compression.ZlibCompressor())
+    flags = framing.parse_plaintext(plaintext, compression.ZlibCompressor()).flags
+    assert not flags & framing.CONTROL
+
+
+def test_sequence_numbers():
+    plaintext = framing.build_plaintext(b"data", None, sequence=2**40, acknowledged=7)
+    frame = framing.parse_plaintext(plaintext, None)
+    assert frame.sequence == 2**40
+    assert frame.acknowledged == 7
+
+
+def test_timestamp_in_nanoseconds():
+    before = time.time_ns()
+    frame = framing.parse_plaintext(framing.build_plaintext(b"data", None), None)
+    assert before <= frame.sent_at_ns <= time.time_ns()
+
+
+def _length_prefixed(*frames):
+    return b"".join(framing.LENGTH.pack(len(frame)) + frame for frame in frames)
+
+
+def test_decoder_several_frames_at_once():
+    decoder = framing.FrameDecoder()
+    assert decoder.feed(_length_prefixed(b"one", b"", b"three")) == [
+        b"one",
+        b"",
+        b"three",
+    ]
+    assert len(decoder) == 0
+
+
+def test_decoder_byte_by_byte():
+    data = _length_prefixed(b"one", b"two")
+    decoder = framing.FrameDecoder()
+    frames = []
+    for index in range(len(data)):
+        frames += decoder.feed(data[index : index + 1])
+    assert frames == [b"one", b"two"]
+
+
+def test_decoder_keeps_partial_frame():
+    data = _length_prefixed(b"one", b"a" * 1000)
+    decoder = framing.FrameDecoder()
+    assert decoder.feed(data[:10]) == [b"one"]
+    assert len(decoder) == 5
+    assert decoder.feed(data[10:500]) == []
+    assert decoder.feed(data[500:]) == [b"a" * 1000]
+    assert len(decoder) == 0
+
+
+def test_decoder_buffered():
+    data = _length_prefixed(b"one", b"a" * 1000)
+    decoder = framing.FrameDecoder()
+    decoder.feed(data[:500])
+    other = framing.FrameDecoder()
+    assert other.feed(decoder.buffered() + data[500:]) == [b"a" * 1000]
+
+
+def test_batch_round_trip():
+    messages = [b"", b"a", b"bc" * 1000]
+    assert framing.unpack_batch(framing.pack_batch(messages)) == messages
+
+
+def test_truncated_batch():
+    with pytest.raises(ValueError):
+        framing.unpack_batch(framing.pack_batch([b"abc"])[:-1])
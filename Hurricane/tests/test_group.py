@@ -1,4 +1,5 @@
 from Hurricane.group import Group
+from Hurricane.lanes import BULK, NORMAL
 import asyncio
 
 
@@ -6,8 +7,9 @@ class PatchedClient:
     def __init__(self):
         self.sent_messages = []
 
-    async def send(self, message):
+    async def send(self, message, priority=NORMAL, conflate_key=None, ttl=None):
         self.sent_messages.append(message)
+        self.priority = priority
 
 
 def test_simple():
@@ -82,3 +84,36 @@ def test_recursive():
     group_1.add(client)
     asyncio.run(group_1.send("c"))
     assert client.sent_messages == ["a", "b", "c"]
+
+
+class PatchedSerialisedClient:
+    def __init__(self):
+        self.sent_data = []
+
+    async def send_serialised(self, data, priority=NORMAL, conflate_key=None, ttl=None):
+        self.sent_data.append(data)
+
+
+def test_send_serialised():
+    parent_group = Group()
+    child_group = Group()
+    client_1 = PatchedSerialisedClient()
+    client_2 = PatchedSerialisedClient()
+    parent_group.add(client_1)
+    parent_group.add(child_group)
+    child_group.add(client_2)
+
+    asyncio.run(parent_group.send_serialised(b"data"))
+    assert client_1.sent_data == [b"data"]
+    assert client_2.sent_data == [b"data"]
+
+
+def test_priority():
+    parent_group = Group()
+    child_group = Group()
+    client = PatchedClient()
+    parent_group.add(child_group)
+    child_group.add(client)
+
+    asyncio.run(parent_group.send("a", BULK))
+    assert client.priority == BULK
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+from Hurricane import Server, handoff
+from Hurricane.client_functions import ServerConnection
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Handoff needs Unix domain sockets"
+)
+
+
+def test_send_and_receive_sockets():
+    left, right = socket.socketpair()
+    shared, kept = socket.socketpair()
+    with left, right, shared, kept:
+        handoff._send(left, [shared.fileno()], [b"first", b"", b"x" * 100000])
+        fds, records = handoff._receive(right)
+        assert records == [b"first", b"", b"x" * 100000]
+
+        with socket.socket(fileno=fds[0]) as received:
+            received.sendall(b"through the copy")
+            assert kept.recv(100) == b"through the copy"
+
+
+def test_take_over_without_running_process(tmp_path):
+    server = Server()
+    path = str(tmp_path / "handoff")
+    assert not asyncio.run(handoff.take_over(server, path))
+
+
+def test_restart_keeps_session(tmp_path):
+    path = str(tmp_path / "server")
+    handoff_path = str(tmp_path / "handoff")
+
+    async def echo(message):
+        await message.author.send((name, message.contents))
+
+    async def run():
+        nonlocal name
+        old = Server(handoff_path=handoff_path)
+        old.on_receiving_message(echo)
+        name = "old"
+        old_serving = asyncio.create_task(old.serve_unix(path))
+        while not os.path.exists(handoff_path):
+            await asyncio.sleep(0.01)
+
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        await asyncio.to_thread(connection.send, 1)
+        assert (await asyncio.to_thread(connection.recv)).contents == ("old", 1)
+        (uuid,) = old._clients
+
+        new = Server(handoff_path=handoff_path)
+        new.on_receiving_message(echo)
+        new_serving = asyncio.create_task(new.serve_unix(path))
+        await asyncio.wait_for(old_serving, 5)
+        name = "new"
+        assert not old._clients
+        assert list(new._clients) == [uuid]
+
+        # The same connection carries on, without reconnecting
+        sock = connection.socket
+        await asyncio.to_thread(connection.send, 2)
+        assert (await asyncio.to_thread(connection.recv)).contents == ("new", 2)
+        assert connection.socket is sock
+
+        connection.close()
+        new_serving.cancel()
+
+    name = None
+    asyncio.run(run())
+
+
+async def start_serving(path, handoff_path, name="old", **kwargs):
+    async def echo(message):
+        await message.author.send((name, message.contents))
+
+    server = Server(handoff_path=handoff_path, **kwargs)
+    server.on_receiving_message(echo)
+    serving = asyncio.create_task(server.serve_unix(path))
+    while not os.path.exists(handoff_path):
+        await asyncio.sleep(0.01)
+    return server, serving
+
+
+async def fail_handoff(handoff_path, read=True):
+    # Connects like a new process would, then goes away without acknowledging
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        await asyncio.to_thread(sock.connect, handoff_path)
+        if read:
+            fds, _ = await asyncio.to_thread(handoff._receive, sock)
+            for fd in fds:
+                os.close(fd)
+
+
+async def wait_for_listeners(server):
+    while not server._listeners:
+        await asyncio.sleep(0.01)
+
+
+async def check_still_serving(server, path, connection):
+    # Clients connected before the handoff, and those that connect after, are served
+    await asyncio.to_thread(connection.send, "after")
+    assert (await asyncio.to_thread(connection.recv)).contents == ("old", "after")
+    another = await asyncio.to_thread(ServerConnection.unix, path)
+    await asyncio.to_thread(another.send, "new")
+    assert (await asyncio.to_thread(another.recv)).contents == ("old", "new")
+    another.close()
+    assert server._listeners
+
+
+@pytest.mark.parametrize("read", [True, False])
+def test_successor_leaves_before_acknowledging(tmp_path, read):
+    path = str(tmp_path / "server")
+    handoff_path = str(tmp_path / "handoff")
+
+    async def run():
+        server, serving = await start_serving(path, handoff_path)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        await asyncio.to_thread(connection.send, "before")
+        await asyncio.to_thread(connection.recv)
+
+        await fail_handoff(handoff_path, read)
+        await check_still_serving(server, path, connection)
+        assert not serving.done()
+
+        connection.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_failed_export_rolls_back(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "server")
+    handoff_path = str(tmp_path / "handoff")
+
+    def broken_export(server, client, connected):
+        raise RuntimeError("Cannot export")
+
+    async def run():
+        server, serving = await start_serving(path, handoff_path)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        await asyncio.to_thread(connection.send, "before")
+        await asyncio.to_thread(connection.recv)
+
+        monkeypatch.setattr(handoff, "_export", broken_export)
+        await fail_handoff(handoff_path, read=False)
+        # The successor hears nothing, so wait for the old process to give up on it
+        await asyncio.wait_for(wait_for_listeners(server), 5)
+        await check_still_serving(server, path, connection)
+
+        connection.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+    asyncio.run(run())
+    assert "Cannot export" in capsys.readouterr().err
+
+
+def test_session_handed_over_without_its_connection(tmp_path):
+    # A stateful compressor cannot be carried on, so the client reconnects to resume
+    path = str(tmp_path / "server")
+    handoff_path = str(tmp_path / "handoff")
+
+    async def run():
+        old, old_serving = await start_serving(path, handoff_path)
+        connection = await asyncio.to_thread(
+            ServerConnection.unix, path, compression=("zlib-stream",)
+        )
+        assert connection._compressor.stateful
+        await asyncio.to_thread(connection.send, 1)
+        assert (await asyncio.to_thread(connection.recv)).contents == ("old", 1)
+        (uuid,) = old._clients
+
+        new, new_serving = await start_serving(path, handoff_path, name="new")
+        await asyncio.wait_for(old_serving, 5)
+        assert new._clients[uuid].state.name == "RECONNECTING"
+
+        sock = connection.socket
+        await asyncio.to_thread(connection.send, 2)
+        assert (await asyncio.to_thread(connection.recv)).contents == ("new", 2)
+        assert connection.socket is not sock
+        assert list(new._clients) == [uuid]
+
+        connection.close()
+        new_serving.cancel()
+        await asyncio.gather(new_serving, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_large_backlog(tmp_path):
+    # Far more waiting messages than would fit in one record, each with its own key
+    path = str(tmp_path / "server")
+    handoff_path = str(tmp_path / "handoff")
+    count = 20_000
+
+    async def run():
+        old, old_serving = await start_serving(path, handoff_path)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        await asyncio.to_thread(connection.send, "before")
+        await asyncio.to_thread(connection.recv)
+        (client,) = old._clients.values()
+
+        # The server notices, and queues everything until the client reconnects
+        connection.socket.shutdown(socket.SHUT_RDWR)
+        while client.state.name != "RECONNECTING":
+            await asyncio.sleep(0.01)
+        for index in range(count):
+            await client.send(index, conflate_key=("key", index), ttl=60)
+
+        new, new_serving = await start_serving(path, handoff_path, name="new")
+        await asyncio.wait_for(old_serving, 10)
+        restored = new._clients[client.uuid]
+        assert len(restored._outgoing_message_queue) == count
+        assert restored._conflated.keys() == {("key", index) for index in range(count)}
+
+        # Still conflated, and the client gets the rest once it reconnects
+        await restored.send("replaced", conflate_key=("key", 0))
+        received = [
+            (await asyncio.to_thread(connection.recv)).contents for _ in range(count)
+        ]
+        assert received == ["replaced", *range(1, count)]
+
+        connection.close()
+        new_serving.cancel()
+        await asyncio.gather(new_serving, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_many_subscriptions(tmp_path):
+    # Far more patterns than would fit in the session's header
+    path = str(tmp_path / "server")
+    handoff_path = str(tmp_path / "handoff")
+    patterns = {f"room.{index:05}.messages" for index in range(5_000)}
+
+    async def run():
+        old, old_serving = await start_serving(path, handoff_path)
+        connection = await asyncio.to_thread(ServerConnection.unix, path)
+        await asyncio.to_thread(connection.send, "before")
+        await asyncio.to_thread(connection.recv)
+        (client,) = old._clients.values()
+        for pattern in patterns:
+            old.topics.subscribe(client, pattern)
+
+        new, new_serving = await start_serving(path, handoff_path, name="new")
+        await asyncio.wait_for(old_serving, 10)
+        restored = new._clients[client.uuid]
+        assert new.topics.subscriptions(restored) == patterns
+
+        await new.topics.publish("room.01234.messages", "published")
+        assert (await asyncio.to_thread(connection.recv)).contents == "published"
+
+        connection.close()
+        new_serving.cancel()
+        await asyncio.gather(new_serving, return_exceptions=True)
+
+    asyncio.run(run())
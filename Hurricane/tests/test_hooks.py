@@ -0,0 +1,50 @@
+from Hurricane.hooks import ProfilingHooks
+import pytest
+
+
+def test_add_and_run():
+    hooks = ProfilingHooks()
+    calls = []
+    hooks.add("decrypt", lambda client, start, end: calls.append((client, end - start)))
+
+    assert hooks.decrypt
+    assert not hooks.encrypt
+    hooks.run(hooks.decrypt, "client", 1.0, 3.0)
+    assert calls == [("client", 2.0)]
+
+
+def test_decorator_and_remove():
+    hooks = ProfilingHooks()
+    calls = []
+
+    @hooks.on("write")
+    def hook(client, start, end):
+        calls.append(client)
+
+    hooks.run(hooks.write, 1, 0, 0)
+    hooks.remove("write", hook)
+    hooks.run(hooks.write, 2, 0, 0)
+    assert calls == [1]
+    assert not hooks.write
+
+
+def test_unknown_stage():
+    with pytest.raises(ValueError):
+        ProfilingHooks().add("not a stage", lambda client, start, end: None)
+
+
+def test_every_stage_is_an_attribute():
+    hooks = ProfilingHooks()
+    for stage in ProfilingHooks.STAGES:
+        assert getattr(hooks, stage) == []
+
+
+def test_broken_hook_does_not_raise(capsys):
+    hooks = ProfilingHooks()
+    calls = []
+    hooks.add("serialise", lambda client, start, end: 1 / 0)
+    hooks.add("serialise", lambda client, start, end: calls.append(client))
+
+    hooks.run(hooks.serialise, "client", 0, 0)
+    assert calls == ["client"]
+    assert "ZeroDivisionError" in capsys.readouterr().err
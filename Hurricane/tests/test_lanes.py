@@ -0,0 +1,92 @@
+from Hurricane.lanes import BULK, NORMAL, URGENT, PriorityLanes
+import pytest
+
+
+def _take(lanes, size=1):
+    priority, item = lanes.peek()
+    lanes.charge(priority, size)
+    return lanes.pop(priority)
+
+
+def test_fifo_within_a_lane():
+    lanes = PriorityLanes()
+    for item in range(5):
+        lanes.push(item, BULK)
+    assert [_take(lanes) for _ in range(5)] == [0, 1, 2, 3, 4]
+    assert len(lanes) == 0
+
+
+def test_urgent_overtakes_bulk():
+    lanes = PriorityLanes(quantum=10)
+    for item in range(3):
+        lanes.push(("bulk", item), BULK)
+    # A bulk item is taken, using up the bulk lane's share for this round
+    assert _take(lanes, 10) == ("bulk", 0)
+
+    lanes.push(("urgent", 0), URGENT)
+    assert _take(lanes, 10) == ("urgent", 0)
+    assert _take(lanes, 10) == ("bulk", 1)
+
+
+def test_shares_follow_weights():
+    lanes = PriorityLanes(weights=(3, 1), quantum=10)
+    for item in range(100):
+        lanes.push(("high", item), 0)
+        lanes.push(("low", item), 1)
+
+    taken = [_take(lanes, 10)[0] for _ in range(40)]
+    assert taken.count("high") == 30
+    assert taken.count("low") == 10
+
+
+def test_idle_lane_does_not_save_up():
+    lanes = PriorityLanes(weights=(1, 1), quantum=10)
+    for item in range(10):
+        lanes.push(("low", item), 1)
+    for _ in range(5):
+        _take(lanes, 10)
+
+    for item in range(10):
+        lanes.push(("high", item), 0)
+    taken = [_take(lanes, 10)[0] for _ in range(6)]
+    assert taken.count("high") == 3
+
+
+def test_items_taken_in_parts():
+    lanes = PriorityLanes(weights=(1, 1), quantum=10)
+    lanes.push("big", 0)
+    lanes.push("small", 1)
+
+    priority, item = lanes.peek()
+    assert item == "big"
+    lanes.charge(priority, 10)
+    # Its share is used up, so the other lane goes next, before the rest of big
+    assert lanes.peek() == (1, "small")
+
+
+def test_iterate():
+    lanes = PriorityLanes()
+    lanes.push("b", BULK)
+    lanes.push("a", URGENT)
+    lanes.push("n", NORMAL)
+    assert list(lanes) == [(URGENT, "a"), (NORMAL, "n"), (BULK, "b")]
+    assert len(lanes) == 3
+
+
+def test_remove_if():
+    lanes = PriorityLanes()
+    for item in range(6):
+        lanes.push(item, item % 3)
+    assert lanes.remove_if(lambda item: item % 2 == 0) == [0, 4, 2]
+    assert list(lanes) == [(URGENT, 3), (NORMAL, 1), (BULK, 5)]
+    assert len(lanes) == 3
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        PriorityLanes(weights=(1, 0))
+    lanes = PriorityLanes()
+    with pytest.raises(ValueError):
+        lanes.push("x", 3)
+    with pytest.raises(IndexError):
+        lanes.peek()
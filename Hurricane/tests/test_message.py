@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from Hurricane.message import AnonymousMessage
+
+
+def test_datetimes_from_nanoseconds():
+    sent_at = datetime(2024, 1, 2, 3, 4, 5, 678901)
+    sent_at_ns = int(sent_at.timestamp()) * 10**9 + 678901 * 1000
+    message = AnonymousMessage("hello", sent_at_ns, sent_at_ns + 10**9)
+    assert message.sent_at == sent_at
+    assert (message.received_at - message.sent_at).total_seconds() == 1
+
+
+def test_datetimes_are_cached():
+    message = AnonymousMessage("hello", 0, 0)
+    assert message.sent_at is message.sent_at
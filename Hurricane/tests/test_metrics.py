@@ -0,0 +1,116 @@
+from Hurricane import metrics
+from Hurricane.client import ClientState
+import asyncio
+import json
+
+
+class PatchedClient:
+    def __init__(self, state, incoming=0, outgoing=0):
+        self.state = state
+        self._incoming_message_queue = [None] * incoming
+        self._outgoing_message_queue = [None] * outgoing
+
+
+def test_counter():
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("test_total", "A counter")
+    counter.inc()
+    counter.inc(4)
+    assert registry.snapshot() == {"test_total": 5}
+
+
+def test_histogram():
+    registry = metrics.MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "A histogram", buckets=[1, 2, 3])
+    for value in (0.5, 1, 2.5, 10):
+        histogram.observe(value)
+
+    snapshot = registry.snapshot()["test_seconds"]
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == 14
+    assert snapshot["buckets"] == {"1": 2, "2": 2, "3": 3, "+Inf": 4}
+
+
+def test_gauge_is_computed_when_read():
+    registry = metrics.MetricsRegistry()
+    values = [1]
+    registry.gauge("test_gauge", "A gauge", lambda: len(values))
+    assert registry.snapshot()["test_gauge"] == 1
+    values.append(2)
+    assert registry.snapshot()["test_gauge"] == 2
+
+
+def test_duplicate_name():
+    registry = metrics.MetricsRegistry()
+    registry.counter("test_total", "A counter")
+    try:
+        registry.counter("test_total", "Another counter")
+    except ValueError:
+        pass
+    else:
+        assert False, "Registering a duplicate name should fail"
+
+
+def test_prometheus_format():
+    registry = metrics.MetricsRegistry()
+    registry.counter("test_total", "A counter").inc(3)
+    registry.histogram("test_seconds", "A histogram", buckets=[0.5]).observe(0.25)
+    registry.gauge("test_gauge", "A gauge", lambda: {"a": 1, "b": 2}, label="letter")
+
+    assert registry.to_prometheus() == (
+        "# HELP test_total A counter\n"
+        "# TYPE test_total counter\n"
+        "test_total 3\n"
+        "# HELP test_seconds A histogram\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="0.5"} 1\n'
+        'test_seconds_bucket{le="+Inf"} 1\n'
+        "test_seconds_sum 0.25\n"
+        "test_seconds_count 1\n"
+        "# HELP test_gauge A gauge\n"
+        "# TYPE test_gauge gauge\n"
+        'test_gauge{letter="a"} 1\n'
+        'test_gauge{letter="b"} 2\n'
+    )
+
+
+def test_server_metrics_connections():
+    clients = {
+        1: PatchedClient(ClientState.OPEN, incoming=2),
+        2: PatchedClient(ClientState.OPEN),
+        3: PatchedClient(ClientState.RECONNECTING, outgoing=5),
+    }
+    server_metrics = metrics.ServerMetrics(clients)
+    snapshot = server_metrics.snapshot()
+    assert snapshot["hurricane_connections"] == {
+        "OPEN": 2,
+        "RECONNECTING": 1,
+        "CLOSED": 0,
+    }
+    assert snapshot["hurricane_incoming_queue_depth"] == 2
+    assert snapshot["hurricane_outgoing_queue_depth"] == 5
+
+
+def test_http_endpoint():
+    registry = metrics.MetricsRegistry()
+    registry.counter("test_total", "A counter").inc(7)
+
+    async def fetch(path):
+        server = await registry.serve("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        server.close()
+        return response
+
+    response = asyncio.run(fetch("/metrics"))
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.endswith(b"test_total 7\n")
+
+    response = asyncio.run(fetch("/snapshot"))
+    assert json.loads(response.split(b"\r\n\r\n", 1)[1]) == {"test_total": 7}
+
+    response = asyncio.run(fetch("/other"))
+    assert response.startswith(b"HTTP/1.1 404 Not Found")
@@ -0,0 +1,242 @@
+import asyncio
+import functools
+import os
+import socket
+import threading
+import time
+
+from Hurricane import Server, pool
+from Hurricane.client_functions import ServerConnection
+from Hurricane.reliability import ReliableStream
+import pytest
+
+
+class PatchedConnection:
+    def __init__(self):
+        self.socket, self.server_socket = socket.socketpair()
+        self.sent_messages = []
+        self.closed = False
+        self._receive_thread = None
+
+    @property
+    def receiving(self):
+        return self._receive_thread is not None and self._receive_thread.is_alive()
+
+    def start_receiving(self, callback=None):
+        # Stops once the server end is closed, like a connection that gave up reconnecting
+        def receive():
+            try:
+                while self.socket.recv(1):
+                    pass
+            except OSError:
+                pass
+
+        self._receive_thread = threading.Thread(target=receive, daemon=True)
+        self._receive_thread.start()
+
+    def send(self, message):
+        self.sent_messages.append(message)
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+        self.server_socket.close()
+
+
+def make_pool(**kwargs):
+    connections = []
+
+    def connect():
+        connections.append(PatchedConnection())
+        return connections[-1]
+
+    kwargs.setdefault("health_check_interval", None)
+    return pool.ConnectionPool(connect, **kwargs), connections
+
+
+def test_opens_minimum_size():
+    connection_pool, connections = make_pool(minimum_size=3)
+    assert len(connection_pool) == 3
+    assert len(connections) == 3
+    connection_pool.close()
+    assert all(connection.closed for connection in connections)
+
+
+def test_reuses_idle_connection():
+    connection_pool, connections = make_pool(minimum_size=1)
+    for _ in range(5):
+        connection_pool.send("hello")
+    assert len(connections) == 1
+    assert connections[0].sent_messages == ["hello"] * 5
+
+
+def test_grows_when_all_in_use():
+    connection_pool, connections = make_pool(minimum_size=1, maximum_size=2)
+    with connection_pool.connection() as first:
+        with connection_pool.connection() as second:
+            assert first is not second
+            # At the maximum size, connections are shared
+            with connection_pool.connection() as third:
+                assert third in (first, second)
+    assert len(connection_pool) == 2
+
+
+def test_least_loaded():
+    connection_pool, connections = make_pool(minimum_size=2, maximum_size=2)
+    with connection_pool.connection() as first:
+        with connection_pool.connection() as second:
+            assert first is not second
+
+
+def test_round_robin():
+    connection_pool, connections = make_pool(
+        minimum_size=3, maximum_size=3, strategy=pool.ROUND_ROBIN
+    )
+    used = []
+    for _ in range(6):
+        with connection_pool.connection() as connection:
+            used.append(connection)
+    assert used[:3] == used[3:]
+    assert len(set(used)) == 3
+
+
+def test_replaces_dead_connection():
+    connection_pool, connections = make_pool(minimum_size=1, health_check_interval=0.01)
+    connections[0].server_socket.close()
+    time.sleep(0.2)
+    assert connections[0].closed
+    assert len(connections) == 2
+    assert len(connection_pool) == 1
+    connection_pool.close()
+
+
+def test_shrinks_to_minimum_size():
+    connection_pool, connections = make_pool(
+        minimum_size=1, maximum_size=3, idle_timeout=0, health_check_interval=0.01
+    )
+    with connection_pool.connection():
+        with connection_pool.connection():
+            with connection_pool.connection():
+                assert len(connection_pool) == 3
+    time.sleep(0.2)
+    assert len(connection_pool) == 1
+    connection_pool.close()
+
+
+def test_invalid_sizes():
+    with pytest.raises(ValueError):
+        make_pool(minimum_size=2, maximum_size=1)
+
+
+def test_closed_pool():
+    connection_pool, connections = make_pool()
+    connection_pool.close()
+    with pytest.raises(RuntimeError):
+        connection_pool.send("hello")
+
+
+def test_never_grows_past_maximum_size_when_empty():
+    # Every caller finds the pool empty, while the first connection is being opened
+    connections = []
+
+    def slow_connect():
+        time.sleep(0.1)
+        connections.append(PatchedConnection())
+        return connections[-1]
+
+    connection_pool = pool.ConnectionPool(
+        slow_connect, minimum_size=0, maximum_size=1, health_check_interval=None
+    )
+    threads = [
+        threading.Thread(target=connection_pool.send, args=(index,))
+        for index in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(connections) == 1
+    assert len(connection_pool) == 1
+    assert sorted(connections[0].sent_messages) == [0, 1, 2, 3]
+    connection_pool.close()
+
+
+def test_waiting_caller_opens_after_failure():
+    connections = []
+    opened = threading.Event()
+
+    def connect():
+        if not connections:
+            connections.append(None)
+            opened.wait()
+            raise OSError("Refused")
+        connections.append(PatchedConnection())
+        return connections[-1]
+
+    connection_pool = pool.ConnectionPool(
+        connect, minimum_size=0, maximum_size=1, health_check_interval=None
+    )
+    failures = []
+
+    def send():
+        try:
+            connection_pool.send("hello")
+        except OSError as e:
+            failures.append(e)
+
+    first = threading.Thread(target=send)
+    first.start()
+    while not connections:
+        time.sleep(0.01)
+    # Waits for the first caller's connection, then opens its own once that fails
+    second = threading.Thread(target=send)
+    second.start()
+    time.sleep(0.05)
+    opened.set()
+    first.join()
+    second.join()
+    assert len(failures) == 1
+    assert connections[1].sent_messages == ["hello"]
+    assert len(connection_pool) == 1
+    connection_pool.close()
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+def test_idle_connections_keep_up_with_server(tmp_path):
+    path = str(tmp_path / "server")
+
+    async def run():
+        # Silent for longer than this, and the server would drop the connection
+        server = Server(heartbeat_interval=0.05, heartbeat_misses=2)
+        connected = asyncio.Queue()
+        server.on_new_connection(connected.put)
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+
+        received = []
+        connection_pool = await asyncio.to_thread(
+            pool.ConnectionPool,
+            functools.partial(ServerConnection.unix, path),
+            health_check_interval=None,
+            on_message=lambda message: received.append(message.contents),
+        )
+        client = await connected.get()
+        for index in range(4 * ReliableStream.ACKNOWLEDGE_EVERY):
+            await asyncio.to_thread(connection_pool.send, index)
+        await client.send("hello")
+        # Idle, so only heartbeats and acknowledgements are sent
+        await asyncio.sleep(0.5)
+
+        with connection_pool.connection() as connection:
+            assert len(connection._stream) < ReliableStream.ACKNOWLEDGE_EVERY
+        assert client.state.name == "OPEN"
+        assert client.reconnections == 0
+        assert client.rtt is not None
+        assert received == ["hello"]
+
+        await asyncio.to_thread(connection_pool.close)
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+    asyncio.run(run())
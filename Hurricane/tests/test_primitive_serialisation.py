@@ -1,3 +1,5 @@
+from io import BytesIO
+
 from Hurricane import serialisation
 import pytest
 
@@ -182,6 +184,10 @@ class TestSet:
 
 
 class TestFloat:
+    def test_wire_format(self):
+        # Little-endian, matching what earlier versions wrote on common platforms
+        assert serialisation.dumps(1.0) == b"\x09" + b"\x00" * 6 + b"\xf0\x3f"
+
     def test_integer(self):
         serialised = serialisation.dumps(4.0)
         assert serialisation.loads(serialised) == 4.0
@@ -307,3 +313,196 @@ class TestNone:
     def test_none(self):
         serialised = serialisation.dumps(None)
         assert serialisation.loads(serialised) is None
+
+
+class TestTypedArray:
+    def test_floats(self):
+        li = [i / 7 for i in range(5_000)]
+        serialised = serialisation.dumps(li)
+        assert len(serialised) == 5 + 8 * len(li)
+        assert serialisation.loads(serialised) == li
+
+    def test_floats_in_same_byte_order_as_scalar(self):
+        li = [1.5, -0.25] * 10
+        serialised = serialisation.dumps(li)
+        assert serialised[5:13] == serialisation.dumps(1.5)[1:]
+        assert serialised[13:21] == serialisation.dumps(-0.25)[1:]
+
+    def test_ints(self):
+        tup = tuple(range(-50, 50))
+        serialised = serialisation.dumps(tup)
+        assert serialised[0] == 14
+        deserialised = serialisation.loads(serialised)
+        assert type(deserialised) is tuple
+        assert deserialised == tup
+
+    def test_strs(self):
+        se = {"apple", "banana", "", "çà", "durian", "elderberry", "fig", "grape"}
+        serialised = serialisation.dumps(se)
+        assert serialised[0] == 14
+        assert serialisation.loads(serialised) == se
+
+    def test_frozenset(self):
+        se = frozenset(range(100))
+        deserialised = serialisation.loads(serialisation.dumps(se))
+        assert type(deserialised) is frozenset
+        assert deserialised == se
+
+    def test_int_widths(self):
+        for largest in (100, 30_000, 2**31 - 1, 2**63 - 1):
+            li = [-largest - 1, largest] * 5
+            assert serialisation.loads(serialisation.dumps(li)) == li
+
+    def test_ints_too_large_for_array(self):
+        li = [2**64] * 10
+        serialised = serialisation.dumps(li)
+        assert serialised[0] == 5
+        assert serialisation.loads(serialised) == li
+
+    def test_heterogenous_fallback(self):
+        li = [1, 2, 3, 4, 5, 6, 7, 8.0]
+        serialised = serialisation.dumps(li)
+        assert serialised[0] == 5
+        assert serialisation.loads(serialised) == li
+
+    def test_bools_not_packed_as_ints(self):
+        li = [True, False] * 10
+        deserialised = serialisation.loads(serialisation.dumps(li))
+        assert all(type(item) is bool for item in deserialised)
+        assert deserialised == li
+
+
+class TestStreams:
+    def test_load_leaves_stream_after_object(self):
+        stream = BytesIO(serialisation.dumps("abc") + serialisation.dumps(12))
+        assert serialisation.load(stream) == "abc"
+        assert serialisation.load(stream) == 12
+        assert stream.read() == b""
+
+    def test_loads_memoryview(self):
+        data = memoryview(b"\x00" + serialisation.dumps([1, "a", 2.5]))
+        assert serialisation.loads(data[1:]) == [1, "a", 2.5]
+
+    def test_empty(self):
+        with pytest.raises(serialisation.MalformedDataError):
+            serialisation.loads(b"")
+
+    def test_truncated(self):
+        with pytest.raises(serialisation.MalformedDataError):
+            serialisation.loads(serialisation.dumps(1.5)[:-1])
+
+
+class TestDeepNesting:
+    # Deeper than the default recursion limit
+    DEPTH = 5000
+
+    def test_deep_list(self):
+        obj = []
+        for _ in range(self.DEPTH):
+            obj = [obj]
+        result = serialisation.loads(serialisation.dumps(obj))
+        for _ in range(self.DEPTH):
+            assert type(result) is list and len(result) == 1
+            result = result[0]
+        assert result == []
+
+    def test_deep_mixed(self):
+        obj = "leaf"
+        for i in range(self.DEPTH):
+            obj = {"n": obj} if i % 2 else (obj,)
+        result = serialisation.loads(serialisation.dumps(obj))
+        # Compared by hand, == would hit the recursion limit
+        for i in reversed(range(self.DEPTH)):
+            result = result["n"] if i % 2 else result[0]
+        assert result == "leaf"
+
+    def test_empty_containers(self):
+        obj = [[], (), {}, set(), frozenset(), [[], {}]]
+        assert serialisation.loads(serialisation.dumps(obj)) == obj
+
+
+class TestReferences:
+    def test_repeated_strings_written_once(self):
+        records = [{"name": i, "description": i} for i in range(100)]
+        serialised = serialisation.dumps(records)
+        assert serialised.count(b"description") == 1
+        assert serialisation.loads(serialised) == records
+
+    def test_shared_references(self):
+        shared = [1, 2]
+        result = serialisation.loads(serialisation.dumps([shared, {"a": shared}]))
+        assert result == [[1, 2], {"a": [1, 2]}]
+        assert result[0] is result[1]["a"]
+
+    def test_equal_containers_not_merged(self):
+        result = serialisation.loads(serialisation.dumps([[1], [1]]))
+        assert result[0] is not result[1]
+
+    def test_shared_tuple(self):
+        shared = (1, "a")
+        result = serialisation.loads(serialisation.dumps({"x": shared, "y": shared}))
+        assert result["x"] is result["y"]
+
+    def test_recursive_list(self):
+        obj = [1]
+        obj.append(obj)
+        result = serialisation.loads(serialisation.dumps(obj))
+        assert result[0] == 1
+        assert result[1] is result
+
+    def test_recursive_dict(self):
+        obj = {}
+        obj["self"] = obj
+        result = serialisation.loads(serialisation.dumps(obj))
+        assert result["self"] is result
+
+    def test_recursive_tuple(self):
+        inner = []
+        obj = (inner,)
+        inner.append(obj)
+        with pytest.raises(serialisation.CannotBeSerialised):
+            serialisation.dumps(obj)
+
+    def test_invalid_reference(self):
+        # A back reference to something that has not been read
+        with pytest.raises(serialisation.MalformedDataError):
+            serialisation.loads(b"\x0F\x00\x05")
+
+
+class TestDecoder:
+    OBJECTS = [1, "abc", [1.5, None, b"xyz"], {"a": (True, 2**70)}, list(range(20))]
+
+    def test_several_objects_at_once(self):
+        data = b"".join(map(serialisation.dumps, self.OBJECTS))
+        decoder = serialisation.Decoder()
+        assert decoder.feed(data) == self.OBJECTS
+        assert len(decoder) == 0
+
+    def test_byte_by_byte(self):
+        data = b"".join(map(serialisation.dumps, self.OBJECTS))
+        decoder = serialisation.Decoder()
+        objects = []
+        for index in range(len(data)):
+            objects += decoder.feed(data[index : index + 1])
+        assert objects == self.OBJECTS
+
+    def test_string_cut_short(self):
+        # Unlike loads, waits for the rest of the string
+        decoder = serialisation.Decoder()
+        assert decoder.feed(b"\x02\x00\x05abc") == []
+        assert decoder.feed(b"de") == ["abcde"]
+
+    def test_references_across_feeds(self):
+        shared = ["shared"]
+        data = serialisation.dumps([shared, shared, "shared"])
+        decoder = serialisation.Decoder()
+        assert decoder.feed(data[:-3]) == []
+        (result,) = decoder.feed(data[-3:])
+        assert result[0] is result[1]
+        assert result[2] == "shared"
+
+    def test_malformed(self):
+        decoder = serialisation.Decoder()
+        with pytest.raises(serialisation.MalformedDataError):
+            decoder.feed(b"\x63")
+        assert decoder.feed(serialisation.dumps(1)) == [1]
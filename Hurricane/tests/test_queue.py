@@ -107,3 +107,22 @@ def test_async_pop_then_push(runner):
         return await t
 
     assert runner.run_until_complete(inner()) == 3
+
+
+def test_push_front(runner):
+    q = Queue()
+    q.push(1)
+    q.push_front(0)
+    assert q.pop() == 0
+    assert q.pop() == 1
+
+    q.push_front(2)
+    assert runner.run_until_complete(q.async_pop()) == 2
+
+
+def test_iterate():
+    q = Queue()
+    q.push(1)
+    q.push(2)
+    assert list(q) == [1, 2]
+    assert len(q) == 2
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import socket
+import time
+
+import pytest
+
+from Hurricane import Server
+from Hurricane.client import ClientState
+from Hurricane.client_functions import ServerConnection
+from Hurricane.ratelimit import RateLimit, RateLimiter, TokenBucket
+
+
+def test_bucket_starts_full():
+    bucket = TokenBucket(rate=10, capacity=5)
+    now = bucket._updated_at
+    for _ in range(5):
+        assert bucket.take(1, now) == pytest.approx(0)
+    assert bucket.take(1, now) == pytest.approx(0.1)
+
+
+def test_bucket_refills():
+    bucket = TokenBucket(rate=10, capacity=5)
+    now = bucket._updated_at
+    bucket.take(5, now)
+    assert bucket.take(1, now + 0.1) == pytest.approx(0)
+    assert bucket.take(1, now + 0.1) == pytest.approx(0.1)
+
+
+def test_bucket_does_not_overfill():
+    bucket = TokenBucket(rate=10, capacity=5)
+    now = bucket._updated_at
+    assert bucket.take(5, now + 100) == pytest.approx(0)
+    assert bucket.take(1, now + 100) == pytest.approx(0.1)
+
+
+def test_debt_is_paid_off_before_refilling():
+    bucket = TokenBucket(rate=10, capacity=5)
+    now = bucket._updated_at
+    assert bucket.take(25, now) == pytest.approx(2)
+    assert bucket.take(1, now + 2) == pytest.approx(0.1)
+
+
+def test_unlimited():
+    limiter = RateLimiter(RateLimit())
+    for _ in range(1000):
+        assert limiter.take(60000) == pytest.approx(0)
+
+
+def test_longest_wait_of_both_limits():
+    limiter = RateLimiter(
+        RateLimit(messages_per_second=100, bytes_per_second=100_000, burst=0)
+    )
+    now = limiter._messages._updated_at
+    limiter.take(64 * 1024, now)
+    # One message is allowed at once, but bytes are 1 second in debt
+    assert limiter.take(100_000, now) == pytest.approx(1)
+    limiter = RateLimiter(RateLimit(messages_per_second=1, burst=0))
+    now = limiter._messages._updated_at
+    limiter.take(10, now)
+    assert limiter.take(10, now) == pytest.approx(1)
+
+
+async def start_serving(path, limit):
+    server = Server(rate_limit=limit)
+    received = asyncio.Queue()
+
+    async def collect(message):
+        await received.put(message.contents)
+
+    server.on_receiving_message(collect)
+    connected = asyncio.Queue()
+    server.on_new_connection(connected.put)
+    serving = asyncio.create_task(server.serve_unix(path))
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+    connection = await asyncio.to_thread(ServerConnection.unix, path)
+    return server, serving, connection, await connected.get(), received
+
+
+async def stop_serving(serving, connection):
+    connection.close()
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+def test_reading_pauses_over_limit(tmp_path):
+    async def run():
+        # Five messages at once, then twenty a second
+        limit = RateLimit(messages_per_second=20, burst=0.25)
+        server, serving, connection, client, received = await start_serving(
+            str(tmp_path / "server"), limit
+        )
+        started_at = time.monotonic()
+        for i in range(25):
+            await asyncio.to_thread(connection.send, i)
+        contents = [await asyncio.wait_for(received.get(), 5) for _ in range(25)]
+        elapsed = time.monotonic() - started_at
+
+        assert contents == list(range(25))
+        assert elapsed >= 0.8
+        assert server.metrics.throttled_messages.value > 0
+        assert client.state is ClientState.OPEN
+        await stop_serving(serving, connection)
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+def test_disconnects_client_throttled_too_long(tmp_path):
+    async def run():
+        limit = RateLimit(messages_per_second=20, burst=0.05, disconnect_after=0.2)
+        server, serving, connection, client, received = await start_serving(
+            str(tmp_path / "server"), limit
+        )
+        for i in range(50):
+            await asyncio.to_thread(connection.send, i)
+        for _ in range(500):
+            if client.state is ClientState.CLOSED:
+                break
+            await asyncio.sleep(0.01)
+
+        assert client.state is ClientState.CLOSED
+        assert server.metrics.rate_limit_disconnections.value == 1
+        # It was disconnected long before it could send everything
+        assert received.qsize() < 50
+        await stop_serving(serving, connection)
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+def test_reconnect_while_throttled(tmp_path):
+    async def run():
+        limit = RateLimit(messages_per_second=20, burst=0.05)
+        server, serving, connection, client, received = await start_serving(
+            str(tmp_path / "server"), limit
+        )
+        for i in range(30):
+            await asyncio.to_thread(connection.send, i)
+        # Reading is throttled with frames from the old connection still unhandled
+        await asyncio.wait_for(received.get(), 5)
+        await asyncio.sleep(0.1)
+        connection.socket.shutdown(socket.SHUT_RDWR)
+        await asyncio.to_thread(connection.send, "after-reconnect")
+
+        contents = [0]
+        while contents[-1] != "after-reconnect":
+            contents.append(await asyncio.wait_for(received.get(), 5))
+        assert contents == [*range(30), "after-reconnect"]
+        assert client.reconnections == 1
+        assert client.state is ClientState.OPEN
+        await stop_serving(serving, connection)
+
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+from Hurricane.reliability import ReliableStream
+
+
+def test_sequence_numbers():
+    stream = ReliableStream()
+    assert stream.record(b"a") == 1
+    assert stream.record(b"b") == 2
+    assert len(stream) == 2
+
+
+def test_acknowledge_is_cumulative():
+    stream = ReliableStream()
+    for data in (b"a", b"b", b"c", b"d"):
+        stream.record(data)
+
+    stream.acknowledge(2)
+    assert list(stream.unacknowledged()) == [(3, b"c"), (4, b"d")]
+    stream.acknowledge(1)  # Stale acknowledgements change nothing
+    assert len(stream) == 2
+    stream.acknowledge(4)
+    assert list(stream.unacknowledged()) == []
+
+
+def test_bounded():
+    stream = ReliableStream(maximum_size=3)
+    for i in range(5):
+        stream.record(bytes([i]))
+
+    assert [sequence for sequence, _ in stream.unacknowledged()] == [3, 4, 5]
+    assert stream.overflowed == 2
+
+
+def test_duplicates_ignored():
+    stream = ReliableStream()
+    assert stream.receive(1)
+    assert stream.receive(2)
+    assert not stream.receive(2)
+    assert not stream.receive(1)
+    assert stream.last_received == 2
+
+
+def test_needs_acknowledgement():
+    stream = ReliableStream()
+    for i in range(1, ReliableStream.ACKNOWLEDGE_EVERY):
+        stream.receive(i)
+        assert not stream.needs_acknowledgement
+
+    stream.receive(ReliableStream.ACKNOWLEDGE_EVERY)
+    assert stream.needs_acknowledgement
+    assert stream.acknowledgement() == ReliableStream.ACKNOWLEDGE_EVERY
+    assert not stream.needs_acknowledgement
+
+
+def test_last_acknowledged():
+    stream = ReliableStream()
+    for data in (b"a", b"b", b"c"):
+        stream.record(data)
+
+    assert stream.last_acknowledged == 0
+    stream.acknowledge(2)
+    stream.acknowledge(1)
+    assert stream.last_acknowledged == 2
+
+
+def test_export_state():
+    stream = ReliableStream(maximum_size=3)
+    for i in range(4):
+        stream.record(bytes([i]))
+    stream.acknowledge(2)
+    stream.receive(5)
+
+    restored = ReliableStream.from_state(
+        stream.export_state(), stream.unacknowledged_frames()
+    )
+    assert list(restored.unacknowledged()) == list(stream.unacknowledged())
+    assert restored.maximum_size == 3
+    assert restored.last_received == 5
+    assert restored.last_acknowledged == 2
+    assert restored.overflowed == 1
+    assert restored.record(b"next") == 5
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+
+from Hurricane import Server, handoff, security
+from Hurricane.client_functions import ServerConnection
+import pytest
+
+
+def handshake(server_security, client_security):
+    # Runs both sides of the handshake over a socket pair
+    # Returns the server and client encryption
+    server_socket, client_socket = socket.socketpair()
+    client_result = {}
+
+    def connect():
+        client_result["encrypter"] = client_security.connect(client_socket, None)[1]
+
+    async def accept():
+        reader, writer = await asyncio.open_connection(sock=server_socket)
+        thread = threading.Thread(target=connect)
+        thread.start()
+        encrypter = await server_security.accept(reader, writer)
+        await writer.drain()
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+        writer.close()
+        return encrypter
+
+    try:
+        return asyncio.run(accept()), client_result["encrypter"]
+    finally:
+        client_socket.close()
+
+
+@pytest.mark.parametrize(
+    "server_security, client_security",
+    [
+        (security.AESSecurity(), security.AESSecurity()),
+        (security.IntegritySecurity(b"secret"), security.IntegritySecurity(b"secret")),
+        (security.NullSecurity(), security.NullSecurity()),
+    ],
+)
+def test_handshake(server_security, client_security):
+    server_security.prepare()
+    server_encrypter, client_encrypter = handshake(server_security, client_security)
+    assert client_encrypter.decrypt(server_encrypter.encrypt(b"hello")) == b"hello"
+    assert server_encrypter.decrypt(client_encrypter.encrypt(b"world")) == b"world"
+
+
+def test_integrity_keys_differ_per_connection():
+    server_security = security.IntegritySecurity(b"secret")
+    client_security = security.IntegritySecurity(b"secret")
+    first_server, first_client = handshake(server_security, client_security)
+    second_server, second_client = handshake(server_security, client_security)
+    with pytest.raises(ValueError):
+        second_client.decrypt(first_server.encrypt(b"hello"))
+
+
+def test_integrity_wrong_secret():
+    server_encrypter, client_encrypter = handshake(
+        security.IntegritySecurity(b"secret"), security.IntegritySecurity(b"wrong")
+    )
+    with pytest.raises(ValueError):
+        client_encrypter.decrypt(server_encrypter.encrypt(b"hello"))
+
+
+def test_integrity_is_not_encrypted():
+    server_encrypter, client_encrypter = handshake(
+        security.IntegritySecurity(b"secret"), security.IntegritySecurity(b"secret")
+    )
+    assert server_encrypter.encrypt(b"hello").endswith(b"hello")
+
+
+@pytest.fixture
+def tls_contexts(tmp_path):
+    # A self-signed certificate for localhost, and contexts for each side using it
+    if shutil.which("openssl") is None:
+        pytest.skip("Needs openssl to make a certificate")
+    certificate, key = tmp_path / "certificate.pem", tmp_path / "key.pem"
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "ec",
+            "-pkeyopt",
+            "ec_paramgen_curve:prime256v1",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+            "-addext",
+            "subjectAltName=DNS:localhost",
+            "-keyout",
+            str(key),
+            "-out",
+            str(certificate),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(certificate, key)
+    client_context = ssl.create_default_context(cafile=str(certificate))
+    return server_context, client_context
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Needs Unix domain sockets")
+def test_tls(tmp_path, tls_contexts):
+    server_context, client_context = tls_contexts
+    path = str(tmp_path / "server")
+    sent = tmp_path / "sent.bin"
+    sent.write_bytes(os.urandom(100_000))
+
+    async def echo(message):
+        await message.author.send(message.contents)
+
+    async def run():
+        server = Server(security=security.TLSSecurity(server_context))
+        server.on_receiving_message(echo)
+        connected = asyncio.Queue()
+        server.on_new_connection(connected.put)
+        serving = asyncio.create_task(server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+
+        connection = await asyncio.to_thread(
+            ServerConnection.unix,
+            path,
+            security=security.TLSSecurity(client_context, "localhost"),
+        )
+        assert isinstance(connection.socket, ssl.SSLSocket)
+        client = await connected.get()
+        await asyncio.to_thread(connection.send, "hello")
+        assert (await asyncio.to_thread(connection.recv)).contents == "hello"
+
+        # The TLS state cannot be handed over, only the session
+        assert handoff._connection_to_hand_over(client) is None
+        # Frames are not encrypted again, so files go through asyncio's sendfile, which
+        # falls back to reading them, as the ssl module has to encrypt them
+        connection.on_file(lambda name, size: open(tmp_path / "received.bin", "wb"))
+        sending = asyncio.create_task(client.send_file(str(sent)))
+        received = (await asyncio.to_thread(connection.recv)).contents
+        assert await sending
+        assert (received.name, received.size) == ("sent.bin", 100_000)
+        assert client.reconnections == 0
+
+        connection.close()
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+    asyncio.run(run())
+    assert (tmp_path / "received.bin").read_bytes() == sent.read_bytes()
+
+
+def test_tls_rejects_unknown_certificate(tls_contexts):
+    server_context, _ = tls_contexts
+    # Trusts only the usual certificate authorities, not the self-signed certificate
+    client_security = security.TLSSecurity(ssl.create_default_context(), "localhost")
+    server_socket, client_socket = socket.socketpair()
+
+    async def accept():
+        accepting = asyncio.ensure_future(
+            asyncio.get_running_loop().connect_accepted_socket(
+                asyncio.Protocol, server_socket, ssl=server_context
+            )
+        )
+        with pytest.raises(ssl.SSLCertVerificationError):
+            await asyncio.to_thread(client_security.connect, client_socket, None)
+        client_socket.close()
+        # The server's side of the handshake fails too
+        await asyncio.gather(accepting, return_exceptions=True)
+
+    try:
+        asyncio.run(accept())
+    finally:
+        server_socket.close()
+        client_socket.close()
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from Hurricane.timers import TimingWheel
+
+
+def test_fires_in_order_and_never_early():
+    wheel = TimingWheel(tick=0.01, slots=8)
+    fired = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        for delay in (0.05, 0.01, 0.03):
+            wheel.schedule(
+                delay, lambda delay: fired.append((delay, loop.time())), delay
+            )
+        assert len(wheel) == 3
+        await asyncio.sleep(0.1)
+        return started_at
+
+    started_at = asyncio.run(run())
+    assert [delay for delay, _ in fired] == [0.01, 0.03, 0.05]
+    for delay, fired_at in fired:
+        assert fired_at - started_at >= delay
+    assert len(wheel) == 0
+
+
+def test_longer_than_a_turn():
+    # 8 slots of 0.01 seconds, so the timer goes round the wheel more than once
+    wheel = TimingWheel(tick=0.01, slots=8)
+    fired = []
+
+    async def run():
+        wheel.schedule(0.15, fired.append, "late")
+        await asyncio.sleep(0.1)
+        assert fired == []
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert fired == ["late"]
+
+
+def test_cancel():
+    wheel = TimingWheel(tick=0.01)
+    fired = []
+
+    async def run():
+        timer = wheel.schedule(0.02, fired.append, "cancelled")
+        wheel.schedule(0.02, fired.append, "kept")
+        timer.cancel()
+        assert timer.cancelled()
+        assert len(wheel) == 1
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert fired == ["kept"]
+
+
+def test_idle_wheel_leaves_loop_alone():
+    wheel = TimingWheel(tick=0.01)
+
+    async def run():
+        timer = wheel.schedule(10, lambda: None)
+        assert wheel._handle is not None
+        timer.cancel()
+        assert wheel._handle is None
+
+    asyncio.run(run())
+
+
+def test_callback_reschedules_and_cancels():
+    wheel = TimingWheel(tick=0.01)
+    fired = []
+
+    async def run():
+        def first():
+            fired.append("first")
+            second.cancel()
+            wheel.schedule(0.01, fired.append, "again")
+
+        wheel.schedule(0.02, first)
+        second = wheel.schedule(0.02, fired.append, "second")
+        await asyncio.sleep(0.06)
+
+    asyncio.run(run())
+    # Timers in the same slot run in no particular order
+    assert fired in (["first", "again"], ["second", "first", "again"])
+
+
+def test_broken_callback_does_not_stop_others():
+    wheel = TimingWheel(tick=0.01)
+    fired = []
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context["exception"])
+        )
+        wheel.schedule(0.01, lambda: 1 / 0)
+        wheel.schedule(0.01, fired.append, "kept")
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert fired == ["kept"]
+    assert isinstance(errors[0], ZeroDivisionError)
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        TimingWheel(tick=0)
+    with pytest.raises(ValueError):
+        TimingWheel(slots=0)
@@ -0,0 +1,116 @@
+from Hurricane import serialisation
+from Hurricane.lanes import NORMAL
+from Hurricane.topics import TopicRouter
+import asyncio
+import pytest
+
+
+class PatchedClient:
+    def __init__(self):
+        self.sent_messages = []
+
+    async def send_serialised(self, data, priority=NORMAL, conflate_key=None, ttl=None):
+        self.sent_messages.append(serialisation.loads(data))
+
+
+def test_exact():
+    router = TopicRouter()
+    client = PatchedClient()
+    router.subscribe(client, "game.42.chat")
+
+    assert router.subscribers("game.42.chat") == {client}
+    assert router.subscribers("game.42") == set()
+    assert router.subscribers("game.42.chat.extra") == set()
+    assert router.subscribers("game.43.chat") == set()
+
+
+def test_single_wildcard():
+    router = TopicRouter()
+    client = PatchedClient()
+    router.subscribe(client, "game.*.chat")
+
+    assert router.subscribers("game.1.chat") == {client}
+    assert router.subscribers("game.2.chat") == {client}
+    assert router.subscribers("game.chat") == set()
+    assert router.subscribers("game.1.2.chat") == set()
+
+
+def test_multi_wildcard():
+    router = TopicRouter()
+    client = PatchedClient()
+    router.subscribe(client, "game.42.#")
+
+    assert router.subscribers("game.42") == {client}
+    assert router.subscribers("game.42.chat") == {client}
+    assert router.subscribers("game.42.chat.team.red") == {client}
+    assert router.subscribers("game.43.chat") == set()
+
+
+def test_overlapping_subscriptions():
+    router = TopicRouter()
+    client_1 = PatchedClient()
+    client_2 = PatchedClient()
+    router.subscribe(client_1, "game.42.*")
+    router.subscribe(client_1, "game.#")
+    router.subscribe(client_2, "game.42.chat")
+
+    assert router.subscribers("game.42.chat") == {client_1, client_2}
+    asyncio.run(router.publish("game.42.chat", "hello"))
+    assert client_1.sent_messages == ["hello"]
+    assert client_2.sent_messages == ["hello"]
+
+
+def test_unsubscribe():
+    router = TopicRouter()
+    client = PatchedClient()
+    router.subscribe(client, "a.b.c")
+    router.subscribe(client, "a.*")
+
+    router.unsubscribe(client, "a.b.c")
+    assert router.subscribers("a.b.c") == set()
+    assert router.subscribers("a.b") == {client}
+    assert router.subscriptions(client) == {"a.*"}
+    assert "b" not in router._root.children["a"].children
+
+    router.unsubscribe_all(client)
+    assert router.subscribers("a.b") == set()
+    assert router._root.children == {}
+
+
+def test_unsubscribe_unknown():
+    router = TopicRouter()
+    router.unsubscribe(PatchedClient(), "not.subscribed")
+
+
+def test_invalid_patterns():
+    router = TopicRouter()
+    client = PatchedClient()
+    for pattern in ("a.#.b", "a.b#", "a*.b", "a..b", ""):
+        with pytest.raises(ValueError):
+            router.subscribe(client, pattern)
+
+    with pytest.raises(ValueError):
+        router.subscribers("a.*")
+
+
+def test_publish_without_subscribers():
+    assert asyncio.run(TopicRouter().publish("a.b", "nobody")) == 0
+
+
+def test_many_topics():
+    router = TopicRouter()
+    clients = [PatchedClient() for _ in range(10_000)]
+    for index, client in enumerate(clients):
+        router.subscribe(client, f"game.{index}.chat")
+
+    assert router.subscribers("game.1234.chat") == {clients[1234]}
+    assert asyncio.run(router.publish("game.9999.chat", "hi")) == 1
+    assert clients[9999].sent_messages == ["hi"]
+
+
+def test_clients_held_weakly():
+    router = TopicRouter()
+    client = PatchedClient()
+    router.subscribe(client, "a.b")
+    del client
+    assert router.subscribers("a.b") == set()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import math
+from typing import Any, Callable
+
+
+class WheelTimer:
+    # Returned by TimingWheel.schedule, cancelled the same way as an asyncio.TimerHandle
+    __slots__ = ("deadline", "callback", "args", "_wheel", "_cancelled")
+
+    def __init__(
+        self,
+        deadline: int,
+        callback: Callable[..., Any],
+        args: tuple,
+        wheel: TimingWheel,
+    ) -> None:
+        # The tick the timer fires on
+        self.deadline: int = deadline
+        self.callback: Callable[..., Any] = callback
+        self.args: tuple = args
+        # None once the timer has fired or been cancelled
+        self._wheel: TimingWheel | None = wheel
+        self._cancelled: bool = False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        if self._wheel is not None:
+            self._wheel._remove(self)
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+
+class TimingWheel:
+    # Runs callbacks after a delay, like loop.call_later, for timeouts that are usually
+    # cancelled before they fire, such as those kept for each connection
+    # Timers are kept in a ring of slots, one for each tick, so scheduling and cancelling
+    # take the same time however many there are, and the event loop only has one timer of
+    # its own, for the next tick, and none while the wheel is empty
+    # Callbacks run up to a tick late, never early
+    def __init__(self, tick: float = 0.1, slots: int = 512) -> None:
+        if tick <= 0 or slots < 1:
+            raise ValueError("tick must be positive and there must be at least 1 slot")
+        self.tick: float = tick
+        self._slots: list[set[WheelTimer]] = [set() for _ in range(slots)]
+        self._length: int = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # The last tick whose slot was run, counted in ticks of the loop's clock
+        self._current: int = 0
+        self._handle: asyncio.TimerHandle | None = None
+
+    def __len__(self) -> int:
+        return self._length
+
+    def schedule(self, delay: float, callback: Callable[..., Any], *args) -> WheelTimer:
+        # Calls callback(*args) once delay seconds have passed, from the running loop
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if loop is not self._loop:
+            # Timers left from a loop that has stopped would never fire
+            for slot in self._slots:
+                for timer in slot:
+                    timer._wheel = None
+                slot.clear()
+            self._length = 0
+            self._loop = loop
+            self._handle = None
+        if self._handle is None:
+            # Ticks that passed while the wheel was empty had nothing to run
+            self._current = max(self._current, self._tick_at(now))
+
+        deadline = max(math.ceil((now + delay) / self.tick), self._current + 1)
+        timer = WheelTimer(deadline, callback, args, self)
+        self._slots[deadline % len(self._slots)].add(timer)
+        self._length += 1
+        if self._handle is None:
+            self._schedule_tick()
+        return timer
+
+    def _remove(self, timer: WheelTimer) -> None:
+        self._slots[timer.deadline % len(self._slots)].discard(timer)
+        timer._wheel = None
+        self._length -= 1
+        if not self._length and self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick_at(self, time: float) -> int:
+        return math.floor(time / self.tick)
+
+    def _schedule_tick(self) -> None:
+        self._handle = self._loop.call_at((self._current + 1) * self.tick, self._run)
+
+    def _run(self) -> None:
+        self._handle = None
+        now = self._tick_at(self._loop.time())
+        # After a stall longer than a whole turn of the wheel, every slot is run once,
+        # rather than once for each tick that passed
+        first = max(self._current + 1, now - len(self._slots) + 1)
+        due = []
+        for tick in range(first, now + 1):
+            slot = self._slots[tick % len(self._slots)]
+            due += [timer for timer in slot if timer.deadline <= now]
+        self._current = max(self._current, now)
+        for timer in due:
+            self._slots[timer.deadline % len(self._slots)].remove(timer)
+            timer._wheel = None
+        self._length -= len(due)
+
+        for timer in due:
+            # A callback can cancel timers that are due after it
+            if timer._cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                self._loop.call_exception_handler(
+                    {"message": "Exception in a TimingWheel callback", "exception": e}
+                )
+
+        # Unless a callback scheduled a timer, and with it the next tick
+        if self._length and self._handle is None:
+            self._schedule_tick()
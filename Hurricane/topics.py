@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from typing import Any, Hashable
+from weakref import WeakKeyDictionary, WeakSet
+
+from Hurricane import serialisation
+from Hurricane.client import Client
+from Hurricane.group import Group
+from Hurricane.lanes import NORMAL
+
+# Topics are made of segments separated by dots, such as game.42.chat
+SEPARATOR = "."
+# In a subscription, matches exactly one segment, such as game.*.chat
+SINGLE_WILDCARD = "*"
+# At the end of a subscription, matches any number of segments, such as game.42.#
+MULTI_WILDCARD = "#"
+
+
+class _TopicNode:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _TopicNode] = {}
+        self.subscribers: WeakSet[Client] = WeakSet()
+
+
+class TopicRouter:
+    # Subscriptions are stored in a trie, one level per segment
+    # Publishing only visits the branches that can match the topic,
+    # so the cost does not grow with the total number of subscriptions
+    def __init__(self) -> None:
+        self._root: _TopicNode = _TopicNode()
+        self._subscriptions: WeakKeyDictionary[Client, set[str]] = WeakKeyDictionary()
+
+    def subscriptions(self, client: Client) -> set[str]:
+        return set(self._subscriptions.get(client, ()))
+
+    def subscribe(self, client: Client, pattern: str) -> None:
+        segments = _split(pattern)
+        for index, segment in enumerate(segments):
+            if MULTI_WILDCARD in segment and (
+                segment != MULTI_WILDCARD or index != len(segments) - 1
+            ):
+                raise ValueError(f"{MULTI_WILDCARD} can only be the last segment")
+            if SINGLE_WILDCARD in segment and segment != SINGLE_WILDCARD:
+                raise ValueError(f"{SINGLE_WILDCARD} must be a whole segment")
+
+        node = self._root
+        for segment in segments:
+            node = node.children.setdefault(segment, _TopicNode())
+        node.subscribers.add(client)
+        self._subscriptions.setdefault(client, set()).add(pattern)
+
+    def unsubscribe(self, client: Client, pattern: str) -> None:
+        segments = _split(pattern)
+        path = [self._root]
+        for segment in segments:
+            if segment not in path[-1].children:
+                return
+            path.append(path[-1].children[segment])
+
+        path[-1].subscribers.discard(client)
+        self._subscriptions.get(client, set()).discard(pattern)
+
+        # Remove nodes that no longer lead to any subscribers
+        for parent, segment, node in zip(
+            reversed(path[:-1]), reversed(segments), reversed(path)
+        ):
+            if node.children or node.subscribers:
+                break
+            del parent.children[segment]
+
+    def unsubscribe_all(self, client: Client) -> None:
+        for pattern in self.subscriptions(client):
+            self.unsubscribe(client, pattern)
+        self._subscriptions.pop(client, None)
+
+    def subscribers(self, topic: str) -> set[Client]:
+        segments = _split(topic)
+        if SINGLE_WILDCARD in segments or MULTI_WILDCARD in segments:
+            raise ValueError("Cannot publish to a topic containing wildcards")
+
+        matched = set()
+        # Each entry is a node and how many segments of the topic it has matched
+        to_visit = [(self._root, 0)]
+        while to_visit:
+            node, depth = to_visit.pop()
+
+            multi_wildcard = node.children.get(MULTI_WILDCARD, None)
+            if multi_wildcard is not None:
+                matched.update(multi_wildcard.subscribers)
+
+            if depth == len(segments):
+                matched.update(node.subscribers)
+                continue
+
+            for segment in (segments[depth], SINGLE_WILDCARD):
+                child = node.children.get(segment, None)
+                if child is not None:
+                    to_visit.append((child, depth + 1))
+
+        return matched
+
+    async def publish(
+        self,
+        topic: str,
+        message: Any,
+        priority: int = NORMAL,
+        conflate_key: Hashable | None = None,
+        ttl: float | None = None,
+    ) -> int:
+        # The message is serialised once, however many clients it is sent to
+        # See Client.send_serialised for priority, conflate_key and ttl
+        # Returns the number of clients it was sent to
+        subscribers = self.subscribers(topic)
+        if not subscribers:
+            return 0
+
+        group = Group()
+        for client in subscribers:
+            group.add(client)
+        await group.send_serialised(
+            serialisation.dumps(message), priority, conflate_key, ttl
+        )
+        return len(subscribers)
+
+
+def _split(topic: str) -> list[str]:
+    segments = topic.split(SEPARATOR)
+    if not all(segments):
+        raise ValueError(f"{topic!r} has an empty segment")
+    return segments